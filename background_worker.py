@@ -0,0 +1,56 @@
+import abc
+import time
+import queue
+import threading
+
+# Skeleton shared by the folder scan, tag, identity and playlist import
+# workers: _run() goes on its own thread and reports through a queue of
+# (kind, items) messages that the engine drains from its host loop, ending
+# with ('done', ...) or ('cancelled', []).
+
+
+class BackgroundWorker(abc.ABC):
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.thread = None
+        self.started_at = 0.0
+        self.finished_at = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def elapsed(self):
+        end = self.finished_at or time.perf_counter()
+        return max(1e-6, end - self.started_at)
+
+    def files_per_second(self):
+        return self.progress() / self.elapsed()
+
+    def progress(self):
+        # files handled so far, for the rate
+        return 0
+
+    def drain(self):
+        items = []
+        while True:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    def _finish(self, items=()):
+        self.finished_at = time.perf_counter()
+        if self.cancel_event.is_set():
+            self.queue.put(('cancelled', []))
+        else:
+            self.queue.put(('done', list(items)))
+
+    @abc.abstractmethod
+    def _run(self):
+        pass
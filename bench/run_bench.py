@@ -0,0 +1,323 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+sys.path.insert(0, str(BENCH_DIR))
+
+# no real sound card or window is needed for any benchmark
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+from player_engine import PlayerEngine
+from synth_library import generate
+
+# Times the player's hot paths against a generated library and writes the
+# results as JSON. With --baseline, each result is compared against an
+# earlier run and the limits in thresholds.json.
+#
+#   python bench/run_bench.py --tracks 100000 --out new.json --baseline old.json
+
+SEARCH_QUERIES = ("night", "ech", "velvet orbit", "0001", "zzz", "~nite drv", "~glass")
+SCAN_TIMEOUT = 3600
+CONTROL_BATCH = 20
+
+
+def measure(fn, runs):
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return summarize(times)
+
+
+def summarize(times):
+    times = sorted(times)
+    return {
+        'median_ms': statistics.median(times),
+        'min_ms': times[0],
+        'p95_ms': times[min(len(times) - 1, int(0.95 * len(times)))],
+        'runs': len(times),
+    }
+
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR.parent,
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def library_for(args):
+    if args.library:
+        return Path(args.library)
+    name = (f"mp3bench-{args.tracks}-{args.vbr_ratio}-{args.tag_ratio}-{args.frames}-{args.name_length}"
+            f"-{args.depth}-{args.fanout}-{args.seed}")
+    folder = Path(tempfile.gettempdir()) / name
+    marker = folder / ".complete"
+    if not marker.exists():
+        shutil.rmtree(folder, ignore_errors=True)
+        print(f"Generating {args.tracks} tracks in {folder} ...", flush=True)
+        generate(str(folder), args.tracks, args.vbr_ratio, args.frames,
+                 args.name_length, args.depth, args.fanout, args.seed, args.tag_ratio)
+        marker.touch()
+    return folder
+
+
+def wait_for_scan(engine):
+    deadline = time.monotonic() + SCAN_TIMEOUT
+    while engine.scanner is not None and time.monotonic() < deadline:
+        engine.poll_scan()
+        time.sleep(0.01)
+
+
+###########################
+# Benchmarks
+###########################
+
+def bench_scan(library, data_dir, results):
+    engine = PlayerEngine(data_dir)
+    engine.load_stats()
+    results['scan_full'] = measure(lambda: (engine.load_folder(str(library)), wait_for_scan(engine)), 1)
+    results['scan_full']['tracks'] = len(engine.playlist)
+
+    def wait_for_tags():
+        while engine.tag_pipeline is not None:
+            engine.poll_tags()
+            time.sleep(0.01)
+    # the scan starts the tag pipeline when it finishes
+    results['read_tags'] = measure(wait_for_tags, 1)
+    results['read_tags']['tracks'] = len(engine.playlist)
+    engine.close()
+
+    # reopening: the index is warm, only new files get probed
+    engine = PlayerEngine(data_dir)
+    engine.load_stats()
+    results['scan_incremental'] = measure(lambda: (engine.restore_library(), wait_for_scan(engine)), 1)
+    return engine
+
+
+def bench_search(engine, results, runs):
+    # the index fills on a thread after restore_library(); wait for it
+    deadline = time.monotonic() + SCAN_TIMEOUT
+    while len(engine.search_index.keys) < len(engine.playlist) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    for kind, queries in (('search_substring', [q for q in SEARCH_QUERIES if not q.startswith('~')]),
+                          ('search_fuzzy', [q for q in SEARCH_QUERIES if q.startswith('~')])):
+        def run():
+            # every run starts cold; repeats would only measure the LRU
+            engine.search_index.cache.clear()
+            for q in queries:
+                # type the query one character at a time, like the search box
+                for i in range(1, len(q) + 1):
+                    engine.search(q[:i])
+                engine.search("")
+        total = measure(run, runs)
+        keystrokes = sum(len(q) + 1 for q in queries)
+        results[kind] = {k: (v / keystrokes if k.endswith('_ms') else v) for k, v in total.items()}
+
+
+def bench_shuffle(engine, results, runs):
+    engine.seeded_shuffle_enabled = True
+    engine.shuffle_seed = "bench"
+    results['apply_shuffle'] = measure(engine.apply_shuffle, runs)
+
+
+def bench_stats(engine, results, runs):
+    paths = [engine.playlist[i] for i in range(min(1000, len(engine.playlist)))]
+
+    def increments():
+        for p in paths:
+            engine.increment_stat(p, 'started')
+    total = measure(increments, runs)
+    results['increment_stat'] = {k: (v / len(paths) if k.endswith('_ms') else v) for k, v in total.items()}
+    results['flush_stats'] = measure(lambda: (engine.increment_stat(paths[0], 'listened'), engine.flush_stats()), runs)
+
+
+def bench_refresh(engine, results, runs):
+    try:
+        import tkinter as tk
+        from virtual_list import VirtualList
+        root = tk.Tk()
+    except Exception as e:
+        results['playlist_refresh'] = {'skipped': f"no display: {e}"}
+        return
+    root.withdraw()
+    box = VirtualList(root, width=60, height=30)
+    box.pack(fill='both', expand=True)
+    root.update()
+
+    def refresh():
+        box.set_items(engine.playlist.rows, os.path.basename)
+        root.update_idletasks()
+    results['playlist_refresh'] = measure(refresh, runs)
+    root.destroy()
+
+
+def bench_play(engine, results, runs):
+    if not engine.init_audio():
+        results['play_track'] = {'skipped': "pygame mixer unavailable"}
+        return
+    n = len(engine.playlist)
+    step = max(1, n // max(1, runs))
+    tracks = iter(range(0, n, step))
+    results['play_track'] = measure(lambda: engine.play_track(next(tracks, 0)), min(runs, n))
+    engine.stop()
+
+
+def bench_control(engine, data_dir, results, rate, seconds=2.0):
+    from control_server import ControlServer, ControlClient
+    server = ControlServer(engine, os.path.join(data_dir, "control.sock"))
+    if not server.start():
+        results['control_rtt'] = {'skipped': "no Unix domain sockets"}
+        return
+    # stand-in for the Tk loop: sleeps until a command is posted
+    wake = threading.Event()
+    done = threading.Event()
+    engine.wake = wake.set
+
+    def host():
+        while not done.is_set():
+            wake.wait(0.05)
+            wake.clear()
+            engine.run_posted()
+    threading.Thread(target=host, daemon=True).start()
+
+    client = ControlClient(server.path)
+    # a subscriber listening along, as a status bar script would
+    listener = ControlClient(server.path)
+    listener.request({'cmd': 'subscribe', 'events': ['volume_changed']})
+
+    def paced(make_request, count):
+        times = []
+        next_at = time.perf_counter()
+        for i in range(count):
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            started = time.perf_counter()
+            client.request(make_request(i))
+            times.append((time.perf_counter() - started) * 1000)
+            next_at += 1.0 / rate
+        return times
+
+    count = int(rate * seconds)
+    results['control_rtt'] = summarize(paced(lambda i: {'id': i, 'cmd': 'status'}, count))
+    results['control_rtt']['rate'] = rate
+    batch = [{'cmd': 'volume', 'value': 0.1 + (i % 10) / 100} for i in range(CONTROL_BATCH - 1)] + [{'cmd': 'status'}]
+    results['control_batch'] = summarize(paced(lambda i: batch, max(1, count // CONTROL_BATCH)))
+    results['control_batch']['commands'] = CONTROL_BATCH
+
+    client.close()
+    listener.close()
+    done.set()
+    engine.wake = None
+    server.stop()
+
+
+###########################
+# Comparison
+###########################
+
+def compare(current, baseline, thresholds):
+    failures = []
+    ratio_limit = thresholds.get('regression_ratio', 1.25)
+    floor = thresholds.get('noise_floor_ms', 1.0)
+    limits = thresholds.get('limits_ms', {})
+    print(f"{'benchmark':<20} {'median ms':>12} {'baseline':>12} {'ratio':>8}")
+    for name, result in sorted(current['results'].items()):
+        if 'median_ms' not in result:
+            print(f"{name:<20} {'skipped':>12}")
+            continue
+        median = result['median_ms']
+        line = f"{name:<20} {median:12.3f}"
+        old = (baseline or {}).get('results', {}).get(name, {}).get('median_ms')
+        if old:
+            ratio = median / old
+            line += f" {old:12.3f} {ratio:8.2f}"
+            if ratio > ratio_limit and median - old > floor:
+                failures.append(f"{name}: {old:.3f} -> {median:.3f} ms ({ratio:.2f}x)")
+        limit = limits.get(name)
+        if limit is not None and median > limit:
+            failures.append(f"{name}: {median:.3f} ms over the {limit} ms limit")
+        print(line)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the player's hot paths")
+    parser.add_argument('--tracks', type=int, default=10000)
+    parser.add_argument('--vbr-ratio', type=float, default=0.3)
+    parser.add_argument('--tag-ratio', type=float, default=0.8, help="share of files with ID3v2 tags")
+    parser.add_argument('--frames', type=int, default=8, help="frames per generated file")
+    parser.add_argument('--name-length', type=int, default=40)
+    parser.add_argument('--depth', type=int, default=2)
+    parser.add_argument('--fanout', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--control-rate', type=int, default=500, help="control requests per second")
+    parser.add_argument('--library', help="use an existing folder instead of generating one")
+    parser.add_argument('--out', default=str(BENCH_DIR / "results.json"))
+    parser.add_argument('--baseline', help="earlier results file to compare against")
+    parser.add_argument('--thresholds', default=str(BENCH_DIR / "thresholds.json"))
+    args = parser.parse_args()
+
+    library = library_for(args)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="mp3bench-data-") as data_dir:
+        engine = bench_scan(library, data_dir, results)
+        bench_search(engine, results, args.runs)
+        bench_shuffle(engine, results, args.runs)
+        bench_stats(engine, results, args.runs)
+        bench_refresh(engine, results, args.runs)
+        bench_play(engine, results, args.runs)
+        bench_control(engine, data_dir, results, args.control_rate)
+        engine.close()
+
+    current = {
+        'meta': {
+            'commit': git_commit(),
+            'time': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'tracks': args.tracks,
+            'vbr_ratio': args.vbr_ratio,
+            'tag_ratio': args.tag_ratio,
+            'name_length': args.name_length,
+            'depth': args.depth,
+            'seed': args.seed,
+            'library': str(library),
+        },
+        'results': results,
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(current, f, indent=2)
+    print(f"Results written to {args.out}")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    with open(args.thresholds, encoding='utf-8') as f:
+        thresholds = json.load(f)
+    failures = compare(current, baseline, thresholds)
+    for failure in failures:
+        print("REGRESSION", failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
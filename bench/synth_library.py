@@ -0,0 +1,132 @@
+import os
+import random
+import struct
+import sys
+
+# Writes a synthetic MP3 library: valid MPEG-1 Layer III frame headers with
+# silent (zeroed) payloads, so the probe, scanner and seek-table code see
+# real frame structure without shipping audio files.
+#
+#   python bench/synth_library.py <folder> [tracks] [vbr_ratio] [tag_ratio]
+
+SAMPLE_RATE = 44100
+SAMPLE_RATE_IDX = 0
+BITRATE_IDX = {32: 1, 40: 2, 48: 3, 56: 4, 64: 5, 80: 6, 96: 7, 112: 8,
+               128: 9, 160: 10, 192: 11, 224: 12, 256: 13, 320: 14}
+CBR_BITRATES = (128, 192, 256, 320)
+VBR_BITRATES = (96, 112, 128, 160, 192, 224, 256, 320)
+SIDE_INFO = 32  # MPEG-1 stereo
+WORDS = ("night", "drive", "echo", "summer", "static", "river", "neon", "ghost",
+         "signal", "velvet", "orbit", "paper", "glass", "ember", "tide", "hollow")
+
+
+def frame_header(bitrate, padding=0):
+    # MPEG-1, Layer III, no CRC, 44.1 kHz, joint stereo
+    return bytes((0xFF, 0xFB, (BITRATE_IDX[bitrate] << 4) | (SAMPLE_RATE_IDX << 2) | (padding << 1), 0x44))
+
+
+def frame_length(bitrate, padding=0):
+    return 144000 * bitrate // SAMPLE_RATE + padding
+
+
+def frame(bitrate, padding=0):
+    header = frame_header(bitrate, padding)
+    return header + bytes(frame_length(bitrate, padding) - len(header))
+
+
+def cbr_bytes(bitrate, frames):
+    # padding every other frame keeps the average on the nominal bitrate
+    plain, padded = frame(bitrate, 0), frame(bitrate, 1)
+    return b''.join(padded if i % 2 else plain for i in range(frames))
+
+
+def vbr_bytes(rng, frames):
+    bitrates = [rng.choice(VBR_BITRATES) for _ in range(frames)]
+    body = [frame(b) for b in bitrates]
+    total = sum(len(f) for f in body)
+
+    # Xing frame: frame count, byte count and a 100-entry TOC
+    offsets = []
+    pos = 0
+    for f in body:
+        offsets.append(pos)
+        pos += len(f)
+    toc = bytes(min(255, offsets[min(frames - 1, i * frames // 100)] * 256 // max(1, total))
+                for i in range(100))
+    tag = b'Xing' + struct.pack('>III', 0x7, frames, total) + toc
+    xing = bytearray(frame(128))
+    xing[4 + SIDE_INFO:4 + SIDE_INFO + len(tag)] = tag
+    return bytes(xing) + b''.join(body)
+
+
+def _text_frame(frame_id, text):
+    body = b'\x03' + text.encode('utf-8')
+    return frame_id + struct.pack('>I', len(body)) + b'\x00\x00' + body
+
+
+def id3v2_tag(rng, i, padding=512):
+    # ID3v2.3 with the frames the tag reader looks for, plus padding
+    artist = f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}"
+    frames = (
+        _text_frame(b'TIT2', " ".join(rng.choice(WORDS) for _ in range(3)).title())
+        + _text_frame(b'TPE1', artist)
+        + _text_frame(b'TALB', f"{rng.choice(WORDS).title()} Sessions")
+        + _text_frame(b'TRCK', f"{i % 12 + 1}/12")
+        + _text_frame(b'TXXX', f"replaygain_track_gain\x00{rng.uniform(-12, 3):.2f} dB")
+    )
+    size = len(frames) + padding
+    syncsafe = bytes(((size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F))
+    return b'ID3\x03\x00\x00' + syncsafe + frames + bytes(padding)
+
+
+def track_name(rng, i, name_length):
+    words = []
+    while sum(len(w) + 1 for w in words) < name_length:
+        words.append(rng.choice(WORDS))
+    name = f"{i:07d} " + " ".join(words)
+    return name[:max(name_length, 8)].rstrip() + ".mp3"
+
+
+def track_folder(root, i, depth, fanout):
+    parts = []
+    n = i
+    for _ in range(depth):
+        n //= fanout
+        parts.append(f"d{n % fanout:03d}")
+    return os.path.join(root, *reversed(parts)) if parts else root
+
+
+def generate(root, tracks=1000, vbr_ratio=0.3, frames=8, name_length=40,
+             depth=2, fanout=32, seed=1, tag_ratio=0.0):
+    rng = random.Random(seed)
+    cbr_cache = {}
+    made = set()
+    for i in range(tracks):
+        folder = track_folder(root, i, depth, fanout)
+        if folder not in made:
+            os.makedirs(folder, exist_ok=True)
+            made.add(folder)
+        if rng.random() < vbr_ratio:
+            data = vbr_bytes(rng, frames)
+        else:
+            bitrate = rng.choice(CBR_BITRATES)
+            data = cbr_cache.get(bitrate)
+            if data is None:
+                data = cbr_cache[bitrate] = cbr_bytes(bitrate, frames)
+        name = track_name(rng, i, name_length)
+        with open(os.path.join(folder, name), 'wb') as f:
+            if rng.random() < tag_ratio:
+                f.write(id3v2_tag(rng, i))
+            f.write(data)
+    return tracks
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("usage: synth_library.py <folder> [tracks] [vbr_ratio]")
+        sys.exit(1)
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    ratio = float(sys.argv[3]) if len(sys.argv) > 3 else 0.3
+    tag_ratio = float(sys.argv[4]) if len(sys.argv) > 4 else 0.0
+    generate(sys.argv[1], count, ratio, tag_ratio=tag_ratio)
+    print(f"Wrote {count} tracks to {sys.argv[1]}")
@@ -0,0 +1,56 @@
+import threading
+
+# State-changing commands from any thread (hotkeys, buttons, workers), run
+# by the host loop. A command that repeats the one before it is merged into
+# it, so a held key gives one volume change of N steps or one skip of N
+# tracks instead of N separate updates.
+
+
+def add(old, new):
+    return old + new
+
+
+def toggle(old, new):
+    # two toggles cancel out
+    return (old + new) % 2
+
+
+class CommandQueue:
+    def __init__(self, wake=None):
+        self.handlers = {}
+        self.merges = {}
+        self.pending = []
+        self.lock = threading.Lock()
+        # called from the pushing thread when the queue goes non-empty
+        self.wake = wake
+        self.pushed = 0
+        self.merged = 0
+
+    def register(self, name, handler, merge=None):
+        self.handlers[name] = handler
+        if merge is not None:
+            self.merges[name] = merge
+
+    def push(self, name, value=None):
+        with self.lock:
+            self.pushed += 1
+            merge = self.merges.get(name)
+            if merge is not None and self.pending and self.pending[-1][0] == name:
+                self.pending[-1] = (name, merge(self.pending[-1][1], value))
+                self.merged += 1
+                return
+            self.pending.append((name, value))
+            first = len(self.pending) == 1
+        # one wake per batch; the rest ride along with it
+        if first and self.wake is not None:
+            self.wake()
+
+    def run(self):
+        with self.lock:
+            items, self.pending = self.pending, []
+        for name, value in items:
+            try:
+                self.handlers[name](value)
+            except Exception as e:
+                print(f"Command {name} failed:", e)
+        return len(items)
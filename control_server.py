@@ -0,0 +1,435 @@
+import os
+import sys
+import json
+import stat
+import socket
+import asyncio
+import tempfile
+import threading
+
+# Local control API: line-delimited JSON over a Unix domain socket.
+#
+#   {"id": 1, "cmd": "next"}
+#   [{"cmd": "volume", "value": 0.4}, {"cmd": "status"}]    (batch, one reply line)
+#   {"cmd": "subscribe", "events": ["track_started", "position"]}
+#
+# Replies are {"id": ..., "ok": true, "result": ...} or {"ok": false,
+# "error": ...}; a batch gets a list back. Subscribed events arrive as
+# {"event": ..., ...} lines. The server runs an asyncio loop on its own
+# thread; commands are posted to the engine's host loop, a batch in one go.
+#
+#   python control_server.py status          -- send one command
+#   python control_server.py volume value=0.5
+#   python control_server.py move_queued from=2 to=0   -- queue indices as in 'queue'
+#   python control_server.py subscribe       -- print events until ^C
+
+SOCKET_NAME = "control.sock"
+SEND_BACKLOG = 256
+# longest request line; longer ones get an error reply and are skipped
+MAX_LINE = 1 << 20
+DEFAULT_EVENTS = ('track_started', 'state_changed', 'position', 'volume_changed', 'queue_changed')
+# everything the engine emits
+EVENTS = frozenset(DEFAULT_EVENTS + (
+    'ended', 'playlist_changed', 'view_changed', 'tags_changed', 'stats_changed',
+    'scan_progress', 'duplicates_changed', 'peaks_ready'))
+
+
+def socket_path(data_dir):
+    return os.environ.get('MP3_PLAYER_SOCKET') or os.path.join(str(data_dir), SOCKET_NAME)
+
+
+def supported():
+    return hasattr(socket, 'AF_UNIX') and sys.platform != 'win32'
+
+
+class CommandError(Exception):
+    pass
+
+
+###########################
+# Commands
+###########################
+# each runs on the host loop and gets the engine and the request dict
+
+def _number(req, key):
+    try:
+        return float(req[key])
+    except (KeyError, TypeError, ValueError):
+        raise CommandError(f"'{key}' must be a number")
+
+
+def _events(req):
+    events = req.get('events')
+    if events is None:
+        return None
+    if not isinstance(events, list) or not all(isinstance(event, str) for event in events):
+        raise CommandError("'events' must be a list of event names")
+    unknown = [event for event in events if event not in EVENTS]
+    if unknown:
+        raise CommandError(f"unknown events: {', '.join(unknown)}")
+    return events
+
+
+def cmd_status(engine, req):
+    path = engine.current_path()
+    return {
+        'track': path,
+        'title': engine.display_name(path) if path else None,
+        'position': round(engine.playback_position(), 3) if engine.playing else 0.0,
+        'duration': engine.track_duration,
+        'playing': engine.playing,
+        'paused': engine.paused,
+        'volume': engine.volume,
+        'queue': len(engine.play_queue),
+        'tracks': len(engine.playlist),
+        'search': engine.search_query,
+    }
+
+
+def cmd_play(engine, req):
+    if 'path' in req:
+        tid = engine.playlist.lookup(str(req['path']))
+        row = engine.playlist.row_of(tid) if tid is not None else -1
+        if row < 0:
+            raise CommandError("not in the library")
+        engine.play_track(row)
+    elif 'row' in req:
+        engine.play_view_row(int(_number(req, 'row')))
+    elif engine.paused or not engine.playing:
+        engine.toggle_play()
+
+
+def cmd_pause(engine, req):
+    if engine.playing and not engine.paused:
+        engine.toggle_play()
+
+
+def cmd_seek(engine, req):
+    engine.seek_to(max(0.0, _number(req, 'position')))
+
+
+def cmd_volume(engine, req):
+    if 'delta' in req:
+        engine.set_volume(engine.volume + _number(req, 'delta'))
+    elif 'value' in req:
+        engine.set_volume(_number(req, 'value'))
+    return engine.volume
+
+
+def cmd_enqueue(engine, req):
+    if not engine.enqueue(str(req.get('path')), bool(req.get('next'))):
+        raise CommandError("not in the library")
+    return len(engine.play_queue)
+
+
+def cmd_dequeue(engine, req):
+    path = engine.dequeue(int(_number(req, 'index')) if 'index' in req else 0)
+    if path is None:
+        raise CommandError("no such queue entry")
+    return path
+
+
+def cmd_move_queued(engine, req):
+    if not engine.move_queued(int(_number(req, 'from')), int(_number(req, 'to'))):
+        raise CommandError("no such queue entry")
+    return engine.queued_paths()
+
+
+def cmd_search(engine, req):
+    engine.search(str(req.get('query', '')))
+    return engine.playlist.view_len()
+
+
+COMMANDS = {
+    'status': cmd_status,
+    'play': cmd_play,
+    'pause': cmd_pause,
+    'toggle': lambda engine, req: engine.toggle_play(),
+    'next': lambda engine, req: engine.play_next(),
+    'prev': lambda engine, req: engine.play_prev(),
+    'stop': lambda engine, req: engine.stop(),
+    'seek': cmd_seek,
+    'volume': cmd_volume,
+    'enqueue': cmd_enqueue,
+    'queue': lambda engine, req: engine.queued_paths(),
+    'dequeue': cmd_dequeue,
+    'move_queued': cmd_move_queued,
+    'clear_queue': lambda engine, req: engine.clear_queue(),
+    'search': cmd_search,
+    'duplicates': lambda engine, req: engine.duplicate_groups(),
+}
+
+
+###########################
+# Server
+###########################
+
+class Connection:
+    def __init__(self, server):
+        self.server = server
+        self.out = asyncio.Queue()
+        self.events = {}
+
+    def send(self, item):
+        # called on the server loop; a client that stops reading loses its
+        # oldest lines rather than growing the queue forever
+        if self.out.qsize() >= SEND_BACKLOG:
+            self.out.get_nowait()
+        self.out.put_nowait(item)
+
+    def subscribe(self, events):
+        bus = self.server.engine.events
+        loop = self.server.loop
+        for event in events:
+            if event not in self.events:
+                self.events[event] = bus.subscribe(
+                    event, lambda data: loop.call_soon_threadsafe(self.send, data))
+        return sorted(self.events)
+
+    def unsubscribe(self, events=None):
+        for event in list(events or self.events):
+            callback = self.events.pop(event, None)
+            if callback is not None:
+                self.server.engine.events.unsubscribe(event, callback)
+        return sorted(self.events)
+
+
+class ControlServer:
+    def __init__(self, engine, path):
+        self.engine = engine
+        self.path = str(path)
+        self.loop = None
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        if not supported():
+            return False
+        started = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(started,), daemon=True)
+        self.thread.start()
+        started.wait(5.0)
+        return self.server is not None
+
+    def stop(self):
+        if self.loop is not None and self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(2.0)
+
+    def _run(self, started):
+        loop = self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            self._clear_stale()
+            self.server = loop.run_until_complete(
+                asyncio.start_unix_server(self._client, sock=self._bind(), limit=MAX_LINE))
+        except Exception as e:
+            print("Control server failed:", e)
+            self.server = None
+            started.set()
+            loop.close()
+            return
+        started.set()
+        try:
+            loop.run_forever()
+        finally:
+            self.server.close()
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.close()
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def _clear_stale(self):
+        # only a socket left behind by a crashed run is removed; one that
+        # still answers belongs to a running player
+        if not (os.path.exists(self.path) and stat.S_ISSOCK(os.stat(self.path).st_mode)):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+        except ConnectionRefusedError:
+            os.remove(self.path)
+            return
+        finally:
+            probe.close()
+        raise OSError(f"another player is listening on {self.path}")
+
+    def _bind(self):
+        # bound inside a private directory and made owner-only before it is
+        # renamed into place, so no one else can ever reach it
+        private = tempfile.mkdtemp(prefix='.control-', dir=os.path.dirname(os.path.abspath(self.path)))
+        tmp = os.path.join(private, SOCKET_NAME)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(tmp)
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, self.path)
+        except Exception:
+            sock.close()
+            raise
+        finally:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            os.rmdir(private)
+        return sock
+
+    async def _client(self, reader, writer):
+        conn = Connection(self)
+        sender = asyncio.ensure_future(self._send(conn, writer))
+        try:
+            while True:
+                try:
+                    line = await reader.readuntil(b'\n')
+                except asyncio.IncompleteReadError as e:
+                    # a last line without a newline, or the end
+                    line = e.partial
+                    if not line:
+                        break
+                except asyncio.LimitOverrunError:
+                    conn.send({'ok': False, 'error': f"request longer than {MAX_LINE} bytes"})
+                    await self._skip_line(reader)
+                    continue
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    msg = json.loads(line)
+                except ValueError as e:
+                    conn.send({'ok': False, 'error': f"bad json: {e}"})
+                    continue
+                batch = isinstance(msg, list)
+                replies = await self._execute(conn, msg if batch else [msg])
+                conn.send(replies if batch else replies[0])
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # disconnected, or the server is shutting down
+            pass
+        finally:
+            # unsubscribing takes the bus lock only, so it's fine off the host
+            conn.unsubscribe()
+            sender.cancel()
+            writer.close()
+
+    async def _skip_line(self, reader):
+        # drops the rest of an overlong line a buffer at a time
+        while True:
+            try:
+                await reader.readuntil(b'\n')
+                return
+            except asyncio.LimitOverrunError as e:
+                await reader.readexactly(e.consumed)
+
+    async def _send(self, conn, writer):
+        while True:
+            item = await conn.out.get()
+            writer.write((json.dumps(item, separators=(',', ':'), default=str) + '\n').encode())
+            if conn.out.empty():
+                await writer.drain()
+
+    async def _execute(self, conn, requests):
+        # the whole batch is one trip through the host loop
+        done = self.loop.create_future()
+
+        def finish(replies):
+            if not done.done():
+                done.set_result(replies)
+
+        def run():
+            replies = [self._run_one(conn, req) for req in requests]
+            self.loop.call_soon_threadsafe(finish, replies)
+
+        self.engine.post(run)
+        return await done
+
+    def _run_one(self, conn, req):
+        if not isinstance(req, dict):
+            return {'ok': False, 'error': "request must be an object"}
+        reply = {'id': req['id']} if 'id' in req else {}
+        cmd = req.get('cmd')
+        try:
+            if cmd == 'subscribe':
+                result = conn.subscribe(_events(req) or DEFAULT_EVENTS)
+            elif cmd == 'unsubscribe':
+                result = conn.unsubscribe(_events(req))
+            elif cmd in COMMANDS:
+                result = COMMANDS[cmd](self.engine, req)
+            else:
+                raise CommandError(f"unknown command: {cmd}")
+        except CommandError as e:
+            reply.update(ok=False, error=str(e))
+            return reply
+        except Exception as e:
+            reply.update(ok=False, error=f"{cmd} failed: {e}")
+            return reply
+        reply.update(ok=True, result=result)
+        return reply
+
+
+###########################
+# Client
+###########################
+
+class ControlClient:
+    def __init__(self, path, timeout=5.0):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(str(path))
+        self.reader = self.sock.makefile('rb')
+
+    def request(self, msg):
+        self.sock.sendall((json.dumps(msg) + '\n').encode())
+        return self.read()
+
+    def read(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("control server closed the connection")
+        return json.loads(line)
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+def _parse_value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+if __name__ == '__main__':
+    from pathlib import Path
+
+    if len(sys.argv) < 2:
+        print("usage: python control_server.py <command> [key=value ...]")
+        sys.exit(2)
+    request = {'cmd': sys.argv[1]}
+    if request['cmd'] == 'subscribe':
+        request['events'] = sys.argv[2:]
+    else:
+        for arg in sys.argv[2:]:
+            key, _, value = arg.partition('=')
+            request[key] = _parse_value(value)
+    try:
+        client = ControlClient(socket_path(Path(__file__).resolve().parent))
+    except OSError as e:
+        print("Player not running:", e)
+        sys.exit(1)
+    reply = client.request(request)
+    print(json.dumps(reply))
+    if request['cmd'] == 'subscribe' and reply.get('ok'):
+        client.sock.settimeout(None)
+        try:
+            while True:
+                print(json.dumps(client.read()), flush=True)
+        except (KeyboardInterrupt, ConnectionError):
+            pass
+    client.close()
+    sys.exit(0 if reply.get('ok') else 1)
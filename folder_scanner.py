@@ -0,0 +1,97 @@
+import os
+import time
+
+from background_worker import BackgroundWorker
+
+# Recursive folder scan on a worker thread. Results are pushed onto a queue
+# that the Tk side drains with root.after, so the UI never blocks on disk.
+
+DEFAULT_EXTENSIONS = ('.mp3', '.ogg', '.wav', '.flac')
+BATCH_SIZE = 200
+BATCH_INTERVAL = 0.2
+
+
+class FolderScanner(BackgroundWorker):
+    def __init__(self, folder, index, probe, extensions=DEFAULT_EXTENSIONS, only_new=False):
+        super().__init__()
+        self.folder = os.path.abspath(folder)
+        self.index = index
+        self.probe = probe
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.only_new = only_new
+        self.scanned = 0
+        self.found = 0
+
+    def progress(self):
+        return self.scanned
+
+    def _walk(self):
+        stack = [self.folder]
+        while stack and not self.cancel_event.is_set():
+            current = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    entries = sorted(it, key=lambda e: e.name.lower())
+            except OSError:
+                continue
+            subdirs = []
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.name.lower().endswith(self.extensions):
+                        yield entry
+                except OSError:
+                    continue
+            stack.extend(reversed(subdirs))
+
+    def _run(self):
+        known = self.index.known(self.folder)
+        seen = set()
+        changed = []
+        batch = []
+        last_flush = time.perf_counter()
+
+        for entry in self._walk():
+            if self.cancel_event.is_set():
+                break
+            self.scanned += 1
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            path = entry.path
+            seen.add(path)
+            old = known.get(path)
+            if old != (st.st_size, st.st_mtime_ns):
+                try:
+                    info = self.probe(path)
+                except Exception as e:
+                    # one broken file must not end the scan
+                    print("Probe failed:", path, e)
+                    info = None
+                changed.append((path, st.st_size, st.st_mtime_ns, info))
+            if not (self.only_new and old is not None):
+                batch.append(path)
+                self.found += 1
+
+            now = time.perf_counter()
+            if len(batch) >= BATCH_SIZE or (batch and now - last_flush >= BATCH_INTERVAL):
+                self.queue.put(('batch', batch))
+                batch = []
+                last_flush = now
+            if len(changed) >= BATCH_SIZE:
+                self.index.update(self.folder, changed)
+                changed = []
+
+        if batch:
+            self.queue.put(('batch', batch))
+        if self.cancel_event.is_set():
+            self.index.update(self.folder, changed)
+            self._finish()
+            return
+
+        removed = [p for p in known if p not in seen]
+        self.index.update(self.folder, changed, removed)
+        self.index.set_meta('last_folder', self.folder)
+        self._finish(removed)
@@ -0,0 +1,183 @@
+import os
+import struct
+
+# ID3v1/ID3v2 tag reader. Only the tag bytes are read: the ID3v2 header and
+# the frames we care about (anything else, cover art included, is skipped
+# with a seek), plus the last 128 bytes for ID3v1.
+
+TEXT_FRAMES = {
+    b'TIT2': 'title', b'TPE1': 'artist', b'TALB': 'album', b'TRCK': 'track',
+    b'TT2': 'title', b'TP1': 'artist', b'TAL': 'album', b'TRK': 'track',
+}
+USER_FRAMES = (b'TXXX', b'TXX')
+REPLAYGAIN_KEYS = {
+    'replaygain_track_gain': 'rg_track_gain',
+    'replaygain_track_peak': 'rg_track_peak',
+    'replaygain_album_gain': 'rg_album_gain',
+}
+MAX_FRAME = 64 * 1024
+ENCODINGS = ('latin-1', 'utf-16', 'utf-16-be', 'utf-8')
+
+
+def _syncsafe(b):
+    return ((b[0] & 0x7F) << 21) | ((b[1] & 0x7F) << 14) | ((b[2] & 0x7F) << 7) | (b[3] & 0x7F)
+
+
+def _decode_text(body):
+    # first byte is the text encoding; values are NUL separated
+    if not body:
+        return []
+    enc = ENCODINGS[body[0]] if body[0] < len(ENCODINGS) else 'latin-1'
+    text = body[1:].decode(enc, 'replace')
+    return [t.strip() for t in text.split('\x00')]
+
+
+def _parse_number(text):
+    # "3/12" -> 3, "-6.50 dB" -> -6.5
+    text = text.split('/')[0].strip()
+    if text.lower().endswith('db'):
+        text = text[:-2].strip()
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _read_id3v2(f):
+    head = f.read(10)
+    if len(head) < 10 or head[:3] != b'ID3':
+        return {}
+    major = head[3]
+    flags = head[5]
+    end = 10 + _syncsafe(head[6:10])
+    if major not in (2, 3, 4):
+        return {}
+    if flags & 0x80 and major < 4:
+        # whole-tag unsynchronisation: rare enough to just read it all
+        data = f.read(end - 10).replace(b'\xff\x00', b'\xff')
+        return _parse_frames(data, 0, major)
+
+    pos = 10
+    if flags & 0x40 and major > 2:
+        ext = f.read(4)
+        size = _syncsafe(ext) if major == 4 else struct.unpack('>I', ext)[0] + 4
+        pos += size
+        f.seek(pos)
+
+    tags = {}
+    id_len, header_len = (3, 6) if major == 2 else (4, 10)
+    while pos + header_len <= end:
+        header = f.read(header_len)
+        if len(header) < header_len or header[0] == 0:
+            break
+        frame_id = header[:id_len]
+        if major == 2:
+            size = int.from_bytes(header[3:6], 'big')
+        elif major == 4:
+            size = _syncsafe(header[4:8])
+        else:
+            size = struct.unpack('>I', header[4:8])[0]
+        pos += header_len
+        if size <= 0 or pos + size > end:
+            break
+        if (frame_id in TEXT_FRAMES or frame_id in USER_FRAMES) and size <= MAX_FRAME:
+            _apply_frame(tags, frame_id, f.read(size))
+        else:
+            f.seek(size, os.SEEK_CUR)
+        pos += size
+    return tags
+
+
+def _parse_frames(data, pos, major):
+    tags = {}
+    id_len, header_len = (3, 6) if major == 2 else (4, 10)
+    while pos + header_len <= len(data):
+        header = data[pos:pos + header_len]
+        if header[0] == 0:
+            break
+        frame_id = header[:id_len]
+        size = int.from_bytes(header[3:6], 'big') if major == 2 else struct.unpack('>I', header[4:8])[0]
+        pos += header_len
+        if size <= 0 or pos + size > len(data):
+            break
+        if frame_id in TEXT_FRAMES or frame_id in USER_FRAMES:
+            _apply_frame(tags, frame_id, data[pos:pos + size])
+        pos += size
+    return tags
+
+
+def _apply_frame(tags, frame_id, body):
+    values = _decode_text(body)
+    if not values:
+        return
+    if frame_id in USER_FRAMES:
+        if len(values) < 2:
+            return
+        key = REPLAYGAIN_KEYS.get(values[0].lower())
+        if key:
+            value = _parse_number(values[1])
+            if value is not None:
+                tags[key] = value
+        return
+    key = TEXT_FRAMES[frame_id]
+    value = values[0]
+    if not value:
+        return
+    if key == 'track':
+        number = _parse_number(value)
+        if number is not None:
+            tags['track'] = int(number)
+    else:
+        tags[key] = value
+
+
+def _read_id3v1(f, file_size):
+    if file_size < 128:
+        return {}
+    f.seek(file_size - 128)
+    tag = f.read(128)
+    if tag[:3] != b'TAG':
+        return {}
+
+    def text(b):
+        return b.split(b'\x00')[0].decode('latin-1').strip()
+
+    tags = {}
+    for key, value in (('title', text(tag[3:33])), ('artist', text(tag[33:63])), ('album', text(tag[63:93]))):
+        if value:
+            tags[key] = value
+    # ID3v1.1 keeps the track number in the last comment byte
+    if tag[125] == 0 and tag[126]:
+        tags['track'] = tag[126]
+    return tags
+
+
+def read_tags(path):
+    # dict with any of title, artist, album, track, rg_track_gain,
+    # rg_track_peak, rg_album_gain; {} if the file has no tags, None if
+    # it can't be read
+    try:
+        with open(path, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            tags = _read_id3v2(f)
+            if 'title' not in tags or 'artist' not in tags:
+                for key, value in _read_id3v1(f, file_size).items():
+                    tags.setdefault(key, value)
+            return tags
+    except (OSError, struct.error, IndexError):
+        return None
+
+
+def display_label(tags):
+    # "Artist - Title" for the playlist, None to fall back to the file name
+    if not tags or not tags.get('title'):
+        return None
+    if tags.get('artist'):
+        return f"{tags['artist']} - {tags['title']}"
+    return tags['title']
+
+
+def search_text(tags):
+    if not tags:
+        return ""
+    return " ".join(tags[k] for k in ('artist', 'title', 'album') if tags.get(k))
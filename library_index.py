@@ -0,0 +1,291 @@
+import time
+import sqlite3
+import threading
+
+# Persistent library index. Only files whose size/mtime changed get re-probed.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    duration REAL,
+    bitrate INTEGER,
+    title TEXT,
+    artist TEXT,
+    album TEXT,
+    track INTEGER,
+    rg_track_gain REAL,
+    rg_track_peak REAL,
+    rg_album_gain REAL,
+    tagged INTEGER NOT NULL DEFAULT 0,
+    loudness REAL,
+    peak REAL,
+    analyzed INTEGER NOT NULL DEFAULT 0,
+    fingerprint TEXT,
+    content_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS tracks_folder ON tracks(folder);
+CREATE INDEX IF NOT EXISTS tracks_untagged ON tracks(folder, tagged);
+CREATE INDEX IF NOT EXISTS tracks_fingerprint ON tracks(folder, fingerprint);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS probes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    duration REAL,
+    bitrate INTEGER,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS probes_used ON probes(used);
+"""
+
+# probe results kept for files outside the scanned folder (imported
+# playlists), least recently played dropped first
+PROBE_ROWS = 20000
+PRUNE_EVERY = 500
+
+
+TAG_COLUMNS = (
+    ('track', 'INTEGER'),
+    ('rg_track_gain', 'REAL'),
+    ('rg_track_peak', 'REAL'),
+    ('rg_album_gain', 'REAL'),
+    ('tagged', 'INTEGER NOT NULL DEFAULT 0'),
+    ('loudness', 'REAL'),
+    ('peak', 'REAL'),
+    ('analyzed', 'INTEGER NOT NULL DEFAULT 0'),
+    ('fingerprint', 'TEXT'),
+    ('content_hash', 'TEXT'),
+)
+TAG_FIELDS = ('title', 'artist', 'album', 'track', 'rg_track_gain', 'rg_track_peak', 'rg_album_gain')
+
+
+class LibraryIndex:
+    def __init__(self, path):
+        self.path = str(path)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self.probes_added = 0
+
+    def _migrate(self):
+        # older indexes lack the tag, loudness and identity columns
+        cols = {r[1] for r in self.conn.execute("PRAGMA table_info(tracks)")}
+        if not cols:
+            return
+        for name, decl in TAG_COLUMNS:
+            if name not in cols:
+                self.conn.execute(f"ALTER TABLE tracks ADD COLUMN {name} {decl}")
+
+    def get_meta(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (key, value))
+            self.conn.commit()
+
+    def last_folder(self):
+        return self.get_meta('last_folder')
+
+    def tracks_in(self, folder):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT path FROM tracks WHERE folder=? ORDER BY path", (folder,)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def known(self, folder):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT path, size, mtime_ns FROM tracks WHERE folder=?", (folder,)
+            ).fetchall()
+        return {r[0]: (r[1], r[2]) for r in rows}
+
+    def get(self, path):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT duration, bitrate, loudness, peak, analyzed, " + ", ".join(TAG_FIELDS)
+                + " FROM tracks WHERE path=?", (path,)
+            ).fetchone()
+        if not row:
+            return None
+        info = {'duration': row[0], 'bitrate': row[1], 'loudness': row[2], 'peak': row[3], 'analyzed': bool(row[4])}
+        info.update(zip(TAG_FIELDS, row[5:]))
+        return info
+
+    def probe_info(self, path, size, mtime_ns):
+        # the scanner's probe result, or a stored one for a file outside the
+        # library, if the row still matches the file
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT duration, bitrate FROM tracks WHERE path=? AND size=? AND mtime_ns=?",
+                (path, size, mtime_ns)
+            ).fetchone()
+            if not row or row[0] is None:
+                row = self.conn.execute(
+                    "SELECT duration, bitrate FROM probes WHERE path=? AND size=? AND mtime_ns=?",
+                    (path, size, mtime_ns)
+                ).fetchone()
+                if row:
+                    with self.conn:
+                        self.conn.execute("UPDATE probes SET used=? WHERE path=?", (time.time(), path))
+        if not row or row[0] is None:
+            return None
+        return {'duration': row[0], 'bitrate': row[1]}
+
+    def store_probe(self, path, size, mtime_ns, info):
+        with self.lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO probes(path, size, mtime_ns, duration, bitrate, used)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (path, size, mtime_ns, info.get('duration'), info.get('bitrate'), time.time()))
+                self.probes_added += 1
+                if self.probes_added % PRUNE_EVERY == 0:
+                    self.conn.execute(
+                        "DELETE FROM probes WHERE path IN"
+                        " (SELECT path FROM probes ORDER BY used DESC LIMIT -1 OFFSET ?)", (PROBE_ROWS,))
+
+    def durations(self, paths, chunk=500):
+        # path -> duration for the paths the index knows
+        paths = list(paths)
+        out = {}
+        for i in range(0, len(paths), chunk):
+            part = paths[i:i + chunk]
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT path, duration FROM tracks WHERE path IN (" + ",".join("?" * len(part)) + ")", part
+                ).fetchall()
+            out.update(rows)
+        return out
+
+    def tags_in(self, folder):
+        # (path, tags) for every track whose tags have been read
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT path, " + ", ".join(TAG_FIELDS) + " FROM tracks"
+                " WHERE folder=? AND tagged=1 AND (title IS NOT NULL OR artist IS NOT NULL OR album IS NOT NULL)",
+                (folder,)
+            ).fetchall()
+        return [(r[0], {k: v for k, v in zip(TAG_FIELDS, r[1:]) if v is not None}) for r in rows]
+
+    def untagged(self, folder):
+        # rows written since the file last changed start out untagged
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT path FROM tracks WHERE folder=? AND tagged=0", (folder,)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def set_tags(self, items):
+        # items: iterable of (path, tags dict or None)
+        rows = [tuple((tags or {}).get(k) for k in TAG_FIELDS) + (path,) for path, tags in items]
+        with self.lock:
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE tracks SET " + ", ".join(f"{k}=?" for k in TAG_FIELDS) + ", tagged=1 WHERE path=?",
+                    rows)
+
+    def update(self, folder, changed, removed=()):
+        # changed: iterable of (path, size, mtime_ns, info_dict_or_None)
+        rows = []
+        for path, size, mtime_ns, info in changed:
+            info = info or {}
+            rows.append((path, folder, size, mtime_ns, info.get('duration'), info.get('bitrate'),
+                         info.get('title'), info.get('artist'), info.get('album')))
+        with self.lock:
+            with self.conn:
+                if rows:
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO tracks"
+                        "(path, folder, size, mtime_ns, duration, bitrate, title, artist, album)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                if removed:
+                    self.conn.executemany("DELETE FROM tracks WHERE path=?", [(p,) for p in removed])
+
+    def unanalyzed(self, folder):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT path FROM tracks WHERE folder=? AND analyzed=0 ORDER BY path", (folder,)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def set_loudness(self, items):
+        # items: iterable of (path, loudness, peak); None values mean the
+        # track couldn't be decoded, which is recorded so it isn't retried
+        with self.lock:
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE tracks SET loudness=?, peak=?, analyzed=1 WHERE path=?",
+                    [(loudness, peak, path) for path, loudness, peak in items])
+
+    def unfingerprinted(self, folder):
+        # rows are replaced when size or mtime change, which clears these
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT path FROM tracks WHERE folder=? AND fingerprint IS NULL", (folder,)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def set_fingerprints(self, items):
+        # items: iterable of (path, fingerprint)
+        with self.lock:
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE tracks SET fingerprint=?, content_hash=NULL WHERE path=?",
+                    [(fp, path) for path, fp in items])
+
+    def colliding(self, folder):
+        # paths sharing a fingerprint with another file, not yet fully hashed
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT path FROM tracks WHERE folder=? AND content_hash IS NULL AND fingerprint IN"
+                " (SELECT fingerprint FROM tracks WHERE folder=? AND fingerprint IS NOT NULL"
+                "  GROUP BY fingerprint HAVING COUNT(*) > 1)", (folder, folder)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def set_content_hashes(self, items):
+        # items: iterable of (path, full hash)
+        with self.lock:
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE tracks SET content_hash=? WHERE path=?", [(h, path) for path, h in items])
+
+    def duplicate_groups(self, folder):
+        # lists of paths with the same content, each sorted; a colliding
+        # fingerprint only counts once the full hashes agree
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT fingerprint, content_hash, path FROM tracks WHERE folder=? AND fingerprint IN"
+                " (SELECT fingerprint FROM tracks WHERE folder=? AND fingerprint IS NOT NULL"
+                "  GROUP BY fingerprint HAVING COUNT(*) > 1)"
+                " AND content_hash IS NOT NULL ORDER BY fingerprint, content_hash, path", (folder, folder)
+            ).fetchall()
+        groups = []
+        last = None
+        for fp, content_hash, path in rows:
+            if (fp, content_hash) != last:
+                groups.append([])
+                last = (fp, content_hash)
+            groups[-1].append(path)
+        return [g for g in groups if len(g) > 1]
+
+    def close(self):
+        with self.lock:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
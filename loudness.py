@@ -0,0 +1,208 @@
+import os
+import sys
+import math
+import multiprocessing
+import time
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except Exception:
+    NUMPY_AVAILABLE = False
+
+from waveform import compute_peaks
+
+# Loudness analysis for volume normalization. Worker processes decode a track
+# with pygame's mixer (on SDL's dummy audio driver) and measure it with NumPy:
+# gated mean-square loudness over 400 ms blocks with 75% overlap, as in
+# EBU R128 but without the K-weighting filter, plus the sample peak. Results
+# go into the library index next to the track's tags. The same decode also
+# yields the waveform peaks for the progress bar.
+#
+#   python loudness.py [folder]   -- analyze a whole library
+
+SAMPLE_RATE = 44100
+BLOCK = int(0.4 * SAMPLE_RATE)
+HOP = BLOCK // 4
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+TARGET_LOUDNESS = -18.0
+MAX_GAIN_DB = 12.0
+BATCH_SIZE = 16
+ANALYZE_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+_mixer_ready = False
+
+
+def _pool(workers):
+    # spawn, not fork: a forked child would inherit the player's open mixer
+    # (so _init_worker's settings never apply) and the locks of its threads
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                               mp_context=multiprocessing.get_context('spawn'))
+
+
+def _init_worker():
+    global _mixer_ready
+    os.environ['SDL_AUDIODRIVER'] = 'dummy'
+    os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+    import pygame
+    pygame.mixer.init(frequency=SAMPLE_RATE, size=-16, channels=2)
+    _mixer_ready = True
+
+
+def measure(samples):
+    # samples: int16 array of shape (n, channels); returns (loudness, peak)
+    x = samples.astype(np.float32) / 32768.0
+    if x.ndim == 1:
+        x = x[:, None]
+    peak = float(np.abs(x).max()) if x.size else 0.0
+    power = np.square(x, dtype=np.float64).sum(axis=1)
+    if len(power) < BLOCK:
+        blocks = np.array([power.mean()]) if len(power) else np.zeros(0)
+    else:
+        csum = np.concatenate(([0.0], np.cumsum(power)))
+        starts = np.arange(0, len(power) - BLOCK + 1, HOP)
+        blocks = (csum[starts + BLOCK] - csum[starts]) / BLOCK
+
+    with np.errstate(divide='ignore'):
+        levels = -0.691 + 10 * np.log10(blocks)
+    gated = blocks[levels > ABSOLUTE_GATE]
+    if not len(gated):
+        return None, peak
+    relative = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE
+    gated = blocks[(levels > ABSOLUTE_GATE) & (levels > relative)]
+    return float(-0.691 + 10 * np.log10(gated.mean())), peak
+
+
+def analyze_file(path):
+    if not _mixer_ready:
+        _init_worker()
+    import pygame
+    try:
+        sound = pygame.mixer.Sound(path)
+        samples = pygame.sndarray.array(sound)
+    except Exception:
+        return path, None, None, None
+    loudness, peak = measure(samples)
+    return path, loudness, peak, compute_peaks(samples)
+
+
+def _analyze_batch(paths):
+    return [analyze_file(p) for p in paths]
+
+
+def gain_db(loudness, peak, target=TARGET_LOUDNESS):
+    # gain toward the target level, held back so the peak doesn't clip
+    gain = target - loudness
+    if peak and peak > 0:
+        gain = min(gain, -20 * math.log10(peak))
+    return max(-MAX_GAIN_DB, min(MAX_GAIN_DB, gain))
+
+
+class LoudnessAnalyzer:
+    # background analysis of tracks that are about to play
+    def __init__(self, index, peaks=None, workers=ANALYZE_WORKERS):
+        self.index = index
+        self.peaks = peaks
+        self.workers = workers
+        # (path, peak entry or None) for finished analyses; the engine adds
+        # the entry to the peak cache on its own thread
+        self.done = queue.Queue()
+        self.available = NUMPY_AVAILABLE
+        self.requests = queue.Queue()
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def request(self, path):
+        if not self.available or path is None:
+            return
+        with self.lock:
+            if path in self.pending:
+                return
+            self.pending.add(path)
+            if self.thread is None:
+                # the pool is only spun up once there is something to do
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        self.requests.put(path)
+
+    def stop(self):
+        self.requests.put(None)
+
+    def _finished(self, path, future):
+        try:
+            path, loudness, peak, pairs = future.result()
+            self.index.set_loudness([(path, loudness, peak)])
+            entry = None
+            if pairs is not None and self.peaks is not None:
+                entry = self.peaks.write(path, pairs)
+            self.done.put((path, entry))
+        except Exception as e:
+            # a broken pool (no pygame/numpy in the workers) stays broken
+            print("Loudness analysis failed:", path, e)
+            self.available = False
+        with self.lock:
+            self.pending.discard(path)
+
+    def _run(self):
+        with _pool(self.workers) as pool:
+            while self.available:
+                path = self.requests.get()
+                if path is None:
+                    return
+                info = self.index.get(path)
+                need_peaks = self.peaks is not None and not self.peaks.has(path)
+                if info is None or (info.get('analyzed') and not need_peaks):
+                    with self.lock:
+                        self.pending.discard(path)
+                    continue
+                future = pool.submit(analyze_file, path)
+                future.add_done_callback(lambda f, p=path: self._finished(p, f))
+
+
+def analyze_library(index, folder, workers=ANALYZE_WORKERS, progress=None, peaks=None):
+    # batch mode: every track in the folder that has no loudness yet
+    paths = index.unanalyzed(folder)
+    total = len(paths)
+    done = 0
+    started = time.perf_counter()
+    chunks = [paths[i:i + BATCH_SIZE] for i in range(0, total, BATCH_SIZE)]
+    with _pool(workers) as pool:
+        for future in as_completed([pool.submit(_analyze_batch, c) for c in chunks]):
+            results = future.result()
+            index.set_loudness([(p, loudness, peak) for p, loudness, peak, _ in results])
+            if peaks is not None:
+                for p, _, _, pairs in results:
+                    if pairs is not None:
+                        peaks.store(p, pairs)
+            done += len(results)
+            if progress:
+                progress(done, total, done / max(1e-6, time.perf_counter() - started))
+    return done, time.perf_counter() - started
+
+
+if __name__ == '__main__':
+    from pathlib import Path
+    from library_index import LibraryIndex
+    from waveform import PeakCache
+
+    if not NUMPY_AVAILABLE:
+        print("Loudness analysis needs numpy: pip install numpy")
+        sys.exit(1)
+    base = Path(__file__).resolve().parent
+    library = LibraryIndex(base / "library.db")
+    target = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 else library.last_folder()
+    if not target:
+        print("No library yet, load a folder in the player first")
+        sys.exit(1)
+
+    def report(done, total, rate):
+        print(f"\rAnalyzed {done}/{total} files ({rate:.1f} files/s)", end="", flush=True)
+
+    count, elapsed = analyze_library(library, target, progress=report, peaks=PeakCache(base / "peaks"))
+    print(f"\nDone: {count} files in {elapsed:.1f}s")
+    library.close()
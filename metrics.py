@@ -0,0 +1,178 @@
+import json
+import os
+import threading
+import time
+from array import array
+
+# In-process metrics for the debug window. Gauges are sampled values (CPU,
+# RSS, ...) and histograms are latencies in ms; both keep their most recent
+# samples in a fixed-size array, so memory use never grows. Histograms also
+# keep a running count and sum for export.
+
+GAUGE_SAMPLES = 300
+HISTOGRAM_SAMPLES = 1024
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Ring:
+    def __init__(self, size):
+        self.size = size
+        self.data = array('d', bytes(8 * size))
+        self.pos = 0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def add(self, value):
+        with self.lock:
+            self.data[self.pos] = value
+            self.pos = (self.pos + 1) % self.size
+            if self.count < self.size:
+                self.count += 1
+
+    def values(self):
+        # oldest first
+        with self.lock:
+            if self.count < self.size:
+                return self.data[:self.count].tolist()
+            return (self.data[self.pos:] + self.data[:self.pos]).tolist()
+
+    def last(self):
+        with self.lock:
+            return self.data[(self.pos - 1) % self.size] if self.count else None
+
+    def percentiles(self, qs=QUANTILES):
+        values = sorted(self.values())
+        if not values:
+            return [None for _ in qs]
+        n = len(values)
+        return [values[min(n - 1, int(q * n))] for q in qs]
+
+    def sparkline(self, width=30):
+        values = self.values()[-width:]
+        if not values:
+            return ""
+        lo, hi = min(values), max(values)
+        span = (hi - lo) or 1.0
+        top = len(SPARK_CHARS) - 1
+        return "".join(SPARK_CHARS[int((v - lo) / span * top)] for v in values)
+
+
+class Histogram(Ring):
+    def __init__(self, size=HISTOGRAM_SAMPLES):
+        super().__init__(size)
+        self.total_count = 0
+        self.total_sum = 0.0
+
+    def add(self, value):
+        super().add(value)
+        with self.lock:
+            self.total_count += 1
+            self.total_sum += value
+
+
+class Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.add((time.perf_counter() - self.started) * 1000)
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.gauges = {}
+        self.histograms = {}
+
+    def gauge(self, name):
+        with self.lock:
+            g = self.gauges.get(name)
+            if g is None:
+                g = self.gauges[name] = Ring(GAUGE_SAMPLES)
+            return g
+
+    def histogram(self, name):
+        with self.lock:
+            h = self.histograms.get(name)
+            if h is None:
+                h = self.histograms[name] = Histogram()
+            return h
+
+    def set(self, name, value):
+        self.gauge(name).add(value)
+
+    def observe(self, name, ms):
+        self.histogram(name).add(ms)
+
+    def time(self, name):
+        # with metrics.time('search_ms'): ...
+        return Timer(self.histogram(name))
+
+    def timed(self, name, fn):
+        histogram = self.histogram(name)
+
+        def wrapper(*args, **kwargs):
+            with Timer(histogram):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def summary(self, name):
+        # (p50, p95, p99, count) or None before the first sample
+        h = self.histograms.get(name)
+        if h is None or not h.count:
+            return None
+        return (*h.percentiles(), h.total_count)
+
+    ###########################
+    # Export
+    ###########################
+    def prometheus_text(self, prefix='mp3player_'):
+        lines = []
+        with self.lock:
+            gauges = sorted(self.gauges.items())
+            histograms = sorted(self.histograms.items())
+        for name, g in gauges:
+            value = g.last()
+            if value is None:
+                continue
+            lines.append(f"# TYPE {prefix}{name} gauge")
+            lines.append(f"{prefix}{name} {value:g}")
+        for name, h in histograms:
+            if not h.count:
+                continue
+            lines.append(f"# TYPE {prefix}{name} summary")
+            for q, v in zip(QUANTILES, h.percentiles()):
+                lines.append(f'{prefix}{name}{{quantile="{q}"}} {v:g}')
+            lines.append(f"{prefix}{name}_sum {h.total_sum:g}")
+            lines.append(f"{prefix}{name}_count {h.total_count}")
+        return "\n".join(lines) + "\n"
+
+    def export_prometheus(self, path):
+        # textfile-collector format, replaced atomically
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, path)
+
+    def export_jsonl(self, path):
+        with self.lock:
+            gauges = sorted(self.gauges.items())
+            histograms = sorted(self.histograms.items())
+        record = {'time': time.time(), 'gauges': {}, 'histograms': {}}
+        for name, g in gauges:
+            record['gauges'][name] = g.last()
+        for name, h in histograms:
+            if h.count:
+                p50, p95, p99 = h.percentiles()
+                record['histograms'][name] = {
+                    'p50': p50, 'p95': p95, 'p99': p99,
+                    'count': h.total_count, 'sum': h.total_sum,
+                }
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + "\n")
@@ -1,834 +1,1067 @@
-import pygame
+from startup_timing import StartupTimer
 import os
 import random
 import tkinter as tk
 from tkinter import filedialog, ttk
+import tkinter.font as tkfont
 import time
 import threading
-import json
 from pathlib import Path
-try:
-    import keyboard
-    KEYBOARD_AVAILABLE = True
-except Exception:
-    KEYBOARD_AVAILABLE = False
-import psutil
-
-
-try:
-    pygame.mixer.init()
-except Exception as e:
-    print("Audio init failed:", e)
-
-pygame.mixer.init()
-
-playlist = []
-filtered_playlist = []
-index = 0
-playing = False
-paused = False
-volume = 0.1
-slider_dragging = False
-track_duration = 0
-seek_block_until = 0
-playback_offset = 0
-_listened_flag = False
-auto_adjust_enabled = False
-auto_thread = None
-auto_stop_event = threading.Event()
-seeded_shuffle_enabled = False
-shuffle_seed = None
-base_playlist = []
-
-debug_window = None
-debug_labels = {}
-debug_updating = False
-
-process = psutil.Process(os.getpid())
-
-
-BASE_DIR = Path(__file__).resolve().parent
-stats_file = BASE_DIR / "song_stats.json"
-
-
-if stats_file.exists():
-    try:
-        with open(stats_file, 'r', encoding='utf-8') as f:
-            song_stats = json.load(f)
-    except Exception:
-        song_stats = {}
-else:
-    song_stats = {}
-
-def save_stats():
-    try:
-        with open(stats_file, 'w', encoding='utf-8') as f:
-            json.dump(song_stats, f, indent=2)
-    except Exception:
-        pass
-
-def get_stats_for_path(path):
-    name = os.path.basename(path)
-    return song_stats.get(name, {'started': 0, 'listened': 0, 'skipped': 0})
-
-def increment_stat_for_path(path, key):
-    name = os.path.basename(path)
-    if name not in song_stats:
-        song_stats[name] = {'started': 0, 'listened': 0, 'skipped': 0}
-    song_stats[name][key] = song_stats[name].get(key, 0) + 1
-    save_stats()
-
-root = tk.Tk()
-root.title("Python MP3 Player")
-root.geometry("560x540")
-root.minsize(400, 400)
-root.rowconfigure(1, weight=1)
-root.columnconfigure(0, weight=1)
-
-def toggle_button(btn, var, command=None):
-    var.set(not var.get())
-    apply_toggle_button_style(btn, var)
-    if command:
-        command()
-
-def apply_toggle_button_style(btn, var):
-    if dark_mode:
-        btn.config(
-            bg=DARK_BTN_ON if var.get() else DARK_BTN_OFF,
-            fg=DARK_BTN_FG,
-            activebackground=DARK_BTN_ON,
-            activeforeground=DARK_BTN_FG,
-            relief="sunken" if var.get() else "raised"
-        )
-    else:
-        btn.config(
-            bg=LIGHT_BTN_ON if var.get() else LIGHT_BTN_OFF,
-            fg=LIGHT_BTN_FG,
-            activebackground=LIGHT_BTN_ON,
-            activeforeground=LIGHT_BTN_FG,
-            relief="sunken" if var.get() else "raised"
-        )
+from player_engine import PlayerEngine
+from control_server import ControlServer, socket_path
+from command_queue import CommandQueue, add, toggle
+from ui_updates import UIUpdater
+from virtual_list import VirtualList
+
+
+def main():
+    timer = StartupTimer()
+    timer.mark('imports')
+
+    BASE_DIR = Path(__file__).resolve().parent
+
+    engine = PlayerEngine(BASE_DIR)
+    playlist = engine.playlist
+    scheduler = engine.scheduler
+    metrics = engine.metrics
+    timer.mark('engine')
+
+    slider_dragging = False
+    auto_adjust_enabled = False
+    SEARCH_DEBOUNCE_MS = 120
+    STATUS_RESET_MS = 1200
+
+    debug_window = None
+    debug_labels = {}
+    debug_updating = False
+
+    # psutil is imported when the debug window first opens
+    process = None
+
+    root = tk.Tk()
+    root.title("Python MP3 Player")
+    root.geometry("560x540")
+    root.minsize(400, 400)
+    root.rowconfigure(1, weight=1)
+    root.columnconfigure(0, weight=1)
+
+    ###########################
+    # Commands
+    ###########################
+
+    # Hotkeys fire on the keyboard thread, so nothing there touches Tk or the
+    # mixer: playback and volume actions are pushed onto this queue and run on
+    # the Tk loop, with repeats merged (a held volume key, a mashed next).
+    def wake_from_thread():
+        # with a non-threaded Tcl this raises and the next tick catches up
+        try:
+            root.event_generate('<<EnginePost>>', when='tail')
+        except Exception:
+            pass
+
+    def run_commands(event=None):
+        commands.run()
+        engine.run_posted()
+
+    commands = CommandQueue(wake_from_thread)
+    root.bind('<<EnginePost>>', run_commands)
+
+    # labels, buttons and sliders are updated through here: once per pass, and
+    # only when the value actually changes
+    ui = UIUpdater(root, metrics)
+
+    ###########################
+    # Scheduler
+    ###########################
+
+    # Every timed job goes through engine.scheduler; Tk only ever holds one
+    # after() for its earliest deadline, and none at all when nothing is due.
+    scheduler_after_id = None
+
+    def arm_scheduler():
+        nonlocal scheduler_after_id
+        if scheduler_after_id is not None:
+            root.after_cancel(scheduler_after_id)
+            scheduler_after_id = None
+        due = scheduler.next_due()
+        if due is not None:
+            delay = max(0, int((due - time.monotonic()) * 1000))
+            scheduler_after_id = root.after(delay, run_scheduler)
+
+    def run_scheduler():
+        nonlocal scheduler_after_id
+        scheduler_after_id = None
+        scheduler.run_due()
+        arm_scheduler()
+
+    scheduler.on_change = arm_scheduler
+
+    def reset_status_later(delay_ms=STATUS_RESET_MS):
+        scheduler.call_later(delay_ms / 1000, 'status_reset', update_status_label)
+
+    def toggle_button(btn, var, command=None):
+        var.set(not var.get())
+        apply_toggle_button_style(btn, var)
+        if command:
+            command()
+
+    def apply_toggle_button_style(btn, var):
+        if dark_mode:
+            btn.config(
+                bg=DARK_BTN_ON if var.get() else DARK_BTN_OFF,
+                fg=DARK_BTN_FG,
+                activebackground=DARK_BTN_ON,
+                activeforeground=DARK_BTN_FG,
+                relief="sunken" if var.get() else "raised"
+            )
+        else:
+            btn.config(
+                bg=LIGHT_BTN_ON if var.get() else LIGHT_BTN_OFF,
+                fg=LIGHT_BTN_FG,
+                activebackground=LIGHT_BTN_ON,
+                activeforeground=LIGHT_BTN_FG,
+                relief="sunken" if var.get() else "raised"
+            )
+
+
+    ###########################
+    # Search Bar
+    ###########################
+    search_frame = tk.Frame(root)
+    search_frame.pack(pady=6)
+
+    search_label = tk.Label(search_frame, text="Search:")
+    search_label.pack(side='left', padx=(0, 5))
+
+    search_var = tk.StringVar()
+    search_entry = tk.Entry(search_frame, textvariable=search_var, width=40)
+    search_entry.pack(side='left')
+
+    ############################
+    #Playback buttons
+    ############################
+    def toggle_play():
+        commands.push('toggle', 1)
+
+    def play_next():
+        commands.push('skip', 1)
+
+    def play_prev():
+        commands.push('skip', -1)
 
+    ###########################
+    # Playlist Box
+    ###########################
+    playlist_box = VirtualList(root, width=60)
+    playlist_box.pack(fill="both", expand=True, padx=20, pady=16)
 
-###########################
-# Search Bar
-###########################
-search_frame = tk.Frame(root)
-search_frame.pack(pady=6)
-
-search_label = tk.Label(search_frame, text="Search:")
-search_label.pack(side='left', padx=(0, 5))
-
-search_var = tk.StringVar()
-search_entry = tk.Entry(search_frame, textvariable=search_var, width=40)
-search_entry.pack(side='left')
-
-############################
-#Playback buttons
-############################
-def toggle_play():
-    global playing, paused
-    if not playlist:
-        return
-    if playing and not paused:
-        pygame.mixer.music.pause()
-        paused = True
-        btn_play.config(text='▶ Resume')
-    elif paused:
-        pygame.mixer.music.unpause()
-        paused = False
-        btn_play.config(text='⏸ Pause')
-    else:
-        play_track(index)
-
-def play_next():
-    global index, _listened_flag
-    if not playlist:
-        return
-    if not _listened_flag:
-        increment_stat_for_path(playlist[index], 'skipped')
-    index = (index + 1) % len(playlist)
-    play_track(index)
-
-def play_prev():
-    global index, _listened_flag
-    if not playlist:
-        return
-    if not _listened_flag:
-        increment_stat_for_path(playlist[index], 'skipped')
-    index = (index - 1) % len(playlist)
-    play_track(index)
-
-###########################
-# Playlist Box
-###########################
-playlist_box = tk.Listbox(root, selectmode=tk.SINGLE, width=60)
-playlist_box.pack(fill="both", expand=True, padx=20, pady=16)
-
-status_label = tk.Label(root, text="No track loaded", anchor="w")
-status_label.pack(fill="x")
-
-progress_slider = ttk.Scale(root, from_=0, to=1, orient="horizontal", length=500)
-progress_slider.pack(fill="x", expand=False, padx=10, pady=10)
-
-control_frame = tk.Frame(root)
-control_frame.pack()
-
-btn_prev = tk.Button(control_frame, text="⏮ Prev", command=play_prev)
-btn_prev.grid(row=0, column=0, padx=6)
-
-btn_play = tk.Button(control_frame, text="▶ Play", command=toggle_play)
-btn_play.grid(row=0, column=1, padx=6)
-
-btn_next = tk.Button(control_frame, text="⏭ Next", command=play_next)
-btn_next.grid(row=0, column=2, padx=6)
-
-volume_frame = tk.Frame(root)
-volume_frame.pack(pady=8)
-
-volume_label = tk.Label(volume_frame, text='Volume')
-volume_label.pack(side='left')
-
-volume_slider = ttk.Scale(volume_frame, from_=0, to=1, orient='horizontal', length=300)
-volume_slider.set(volume)
-volume_slider.pack(side='left', padx=8)
-
-###########################
-# Mode Toggles
-###########################
-auto_frame = tk.Frame(root)
-auto_frame.pack(pady=6)
-
-auto_var = tk.BooleanVar(value=False)
-show_stats_var = tk.BooleanVar(value=False)
-
-def toggle_auto():
-    if auto_var.get():
-        start_auto_adjust()
-    else:
-        stop_auto_adjust()
-
-def toggle_show_stats():
-    refresh_playlist_box()
-
-schizo_btn = tk.Button(
-    auto_frame,
-    text="Schizo mode",
-    width=14,
-    command=lambda: toggle_button(schizo_btn, auto_var, toggle_auto)
-)
-schizo_btn.pack(side="left", padx=8)
-
-stats_btn = tk.Button(
-    auto_frame,
-    text="Show Stats",
-    width=14,
-    command=lambda: toggle_button(stats_btn, show_stats_var, toggle_show_stats)
-)
-stats_btn.pack(side="left", padx=8)
-
-
-
-###########################
-# Playlist Logic
-###########################
-def apply_shuffle():
-    global playlist, filtered_playlist, index
-
-    if not base_playlist:
-        return
+    status_label = tk.Label(root, text="No track loaded", anchor="w")
+    status_label.pack(fill="x")
 
-    playlist = base_playlist.copy()
+    WAVEFORM_HEIGHT = 36
+    waveform_colors = {'wave': '#5a7fa8', 'cursor': '#ff8c00'}
 
-    if seeded_shuffle_enabled and shuffle_seed is not None:
-        rng = random.Random(shuffle_seed)
-        rng.shuffle(playlist)
-    else:
-        random.shuffle(playlist)
+    # Tk widgets can't be transparent, so the overview sits in a strip right
+    # above the slider rather than inside it
+    waveform_canvas = tk.Canvas(root, height=WAVEFORM_HEIGHT, highlightthickness=0)
+    waveform_canvas.pack(fill="x", expand=False, padx=10, pady=(10, 0))
 
-    filtered_playlist = playlist.copy()
+    progress_slider = ttk.Scale(root, from_=0, to=1, orient="horizontal", length=500)
+    progress_slider.pack(fill="x", expand=False, padx=10, pady=(0, 10))
 
-    index = 0
-    refresh_playlist_box()
+    control_frame = tk.Frame(root)
+    control_frame.pack()
 
+    btn_prev = tk.Button(control_frame, text="⏮ Prev", command=play_prev)
+    btn_prev.grid(row=0, column=0, padx=6)
 
+    btn_play = tk.Button(control_frame, text="▶ Play", command=toggle_play)
+    btn_play.grid(row=0, column=1, padx=6)
 
-def load_folder():
-    global playlist, base_playlist, filtered_playlist
+    btn_next = tk.Button(control_frame, text="⏭ Next", command=play_next)
+    btn_next.grid(row=0, column=2, padx=6)
 
-    root.update()
-    folder = filedialog.askdirectory(parent=root)
-    if not folder:
-        return
+    volume_frame = tk.Frame(root)
+    volume_frame.pack(pady=8)
 
+    volume_label = tk.Label(volume_frame, text='Volume')
+    volume_label.pack(side='left')
 
-    base_playlist = sorted(
-        os.path.join(folder, f)
-        for f in os.listdir(folder)
-        if f.lower().endswith('.mp3')
+    volume_slider = ttk.Scale(volume_frame, from_=0, to=1, orient='horizontal', length=300)
+    volume_slider.set(engine.volume)
+    volume_slider.pack(side='left', padx=8)
+
+    ###########################
+    # Mode Toggles
+    ###########################
+    auto_frame = tk.Frame(root)
+    auto_frame.pack(pady=6)
+
+    auto_var = tk.BooleanVar(value=False)
+    show_stats_var = tk.BooleanVar(value=False)
+    normalize_var = tk.BooleanVar(value=engine.normalize)
+    collapse_var = tk.BooleanVar(value=False)
+
+    def toggle_auto():
+        if auto_var.get():
+            start_auto_adjust()
+        else:
+            stop_auto_adjust()
+
+    def toggle_show_stats():
+        refresh_playlist_box()
+
+    schizo_btn = tk.Button(
+        auto_frame,
+        text="Schizo mode",
+        width=14,
+        command=lambda: toggle_button(schizo_btn, auto_var, toggle_auto)
+    )
+    schizo_btn.pack(side="left", padx=8)
+
+    stats_btn = tk.Button(
+        auto_frame,
+        text="Show Stats",
+        width=14,
+        command=lambda: toggle_button(stats_btn, show_stats_var, toggle_show_stats)
+    )
+    stats_btn.pack(side="left", padx=8)
+
+    normalize_btn = tk.Button(
+        auto_frame,
+        text="Normalize",
+        width=14,
+        command=lambda: toggle_button(normalize_btn, normalize_var, lambda: engine.set_normalize(normalize_var.get()))
     )
+    normalize_btn.pack(side="left", padx=8)
+
+    collapse_btn = tk.Button(
+        auto_frame,
+        text="Hide Duplicates",
+        width=14,
+        command=lambda: toggle_button(collapse_btn, collapse_var, lambda: engine.set_collapse_duplicates(collapse_var.get()))
+    )
+    collapse_btn.pack(side="left", padx=8)
+
 
-    apply_shuffle()
-    filtered_playlist = playlist.copy()
-    play_track(0)
 
-def refresh_playlist_box():
-    playlist_box.delete(0, tk.END)
-    for song in filtered_playlist:
-        name = os.path.basename(song)
+    ###########################
+    # Playlist Logic
+    ###########################
+    def load_folder():
+        root.update()
+        folder = filedialog.askdirectory(parent=root)
+        if not folder:
+            return
+
+        engine.load_folder(folder)
+        wake_progress()
+
+    PLAYLIST_FILETYPES = [("Playlists", "*.m3u *.m3u8 *.pls"), ("All files", "*.*")]
+
+    def import_playlist():
+        root.update()
+        path = filedialog.askopenfilename(parent=root, filetypes=PLAYLIST_FILETYPES)
+        if not path:
+            return
+
+        engine.import_playlist(path)
+        wake_progress()
+
+    def export_playlist():
+        root.update()
+        path = filedialog.asksaveasfilename(parent=root, filetypes=PLAYLIST_FILETYPES,
+                                            defaultextension=".m3u8", initialfile="playlist.m3u8")
+        if not path:
+            return
+
+        engine.export_playlist(path)
+
+    def format_playlist_row(song):
+        name = engine.display_name(song)
+        copies = len(engine.copies(song))
+        if copies > 1:
+            name = f"{name} (×{copies})"
         if show_stats_var.get():
-            s = get_stats_for_path(song)
+            s = engine.stats_for(song)
             name = f"{name} | ▶{s['started']} 🎧{s['listened']} ⏭{s['skipped']}"
-        playlist_box.insert(tk.END, name)
-
-###########################
-# Seeded Shuffle Controls
-###########################
-def estimate_bitrate(filepath):
-    try:
-        size_bytes = os.path.getsize(filepath)
-        if track_duration > 0:
-            return int((size_bytes * 8) / track_duration / 1000)
-    except Exception:
-        pass
-    return 0
-
-def update_debug_stats():
-    global debug_updating
-
-    if not debug_updating:
-        return
-
-    try:
-            current_path = playlist[index] if playlist else None
-
-            debug_labels["Track"].config(
-                text=os.path.basename(current_path) if current_path else "None"
-            )
-            debug_labels["Playing"].config(text=str(playing))
-            debug_labels["Paused"].config(text=str(paused))
-            debug_labels["Volume"].config(text=f"{int(volume*100)}%")
-            debug_labels["Track Duration"].config(text=f"{round(track_duration,2)}s")
-
-            pos = pygame.mixer.music.get_pos()
-            pos_s = (pos / 1000.0 if pos >= 0 else 0) + playback_offset
-            debug_labels["Playback Position"].config(text=f"{round(pos_s,2)}s")
-
-            if current_path:
-                debug_labels["Bitrate (est)"].config(
-                    text=f"{estimate_bitrate(current_path)} kbps"
-                )
-                cpu = process.cpu_percent(interval=None)
+        return name
 
-                mem = process.memory_info().rss / (1024 * 1024)  # MB
+    def refresh_playlist_box():
+        with metrics.time('playlist_refresh_ms'):
+            playlist_box.set_items(playlist.rows, format_playlist_row)
+            row = playlist.view_row(playlist.tid_at(engine.index)) if playlist else -1
+            playlist_box.select(row if row >= 0 else None, see=False)
 
-                try:
-                    io = process.io_counters()
-                    disk_read = io.read_bytes / (1024 * 1024)
-                    disk_write = io.write_bytes / (1024 * 1024)
-                except Exception:
-                    disk_read = disk_write = 0
+    ###########################
+    # Seeded Shuffle Controls
+    ###########################
+    def update_debug_stats():
+        nonlocal debug_updating
 
+        if not debug_updating:
+            return
+
+        try:
+                current_path = engine.current_path()
 
-                debug_labels["CPU %"].config(text=f"{cpu:.2f}%")
-                debug_labels["RAM %"].config(text=f"{mem:.1f} MB")
-                debug_labels["Disk %"].config(
+                ui.config(debug_labels["Track"], 
+                    text=os.path.basename(current_path) if current_path else "None"
+                )
+                ui.config(debug_labels["Playing"], text=str(engine.playing))
+                ui.config(debug_labels["Paused"], text=str(engine.paused))
+                ui.config(debug_labels["Volume"], text=f"{int(engine.volume*100)}%")
+                ui.config(debug_labels["Track Duration"], text=f"{round(engine.track_duration,2)}s")
+
+                pos_s = engine.playback_position()
+                ui.config(debug_labels["Playback Position"], text=f"{round(pos_s,2)}s")
+                if engine.last_transition_ms is not None:
+                    ui.config(debug_labels["Transition Latency"], text=f"{engine.last_transition_ms:.1f} ms")
+                if engine.last_seek_ms is not None:
+                    ui.config(debug_labels["Seek Latency"], text=f"{engine.last_seek_ms:.1f} ms")
+
+                if current_path:
+                    ui.config(debug_labels["Bitrate (est)"], 
+                        text=f"{engine.estimate_bitrate()} kbps"
+                    )
+
+                sample_process_metrics()
+                cpu = metrics.gauge('cpu_percent')
+                mem = metrics.gauge('rss_mb')
+                disk_read = metrics.gauge('disk_read_mb').last()
+                disk_write = metrics.gauge('disk_write_mb').last()
+                ui.config(debug_labels["CPU %"], text=f"{cpu.last():.2f}%  {cpu.sparkline()}")
+                ui.config(debug_labels["RAM %"], text=f"{mem.last():.1f} MB  {mem.sparkline()}")
+                ui.config(debug_labels["Disk %"], 
                     text=f"R {disk_read:.1f} MB / W {disk_write:.1f} MB"
                 )
 
-            debug_labels["Threads"].config(text=str(threading.active_count()))
-            debug_labels["Playlist Size"].config(text=str(len(playlist)))
-            debug_labels["Filtered Size"].config(text=str(len(filtered_playlist)))
+                for label, name in LATENCY_FIELDS:
+                    summary = metrics.summary(name)
+                    if summary:
+                        p50, p95, p99, count = summary
+                        ui.config(debug_labels[label], 
+                            text=f"{p50:.1f} / {p95:.1f} / {p99:.1f} ms (n={count})  {metrics.histogram(name).sparkline()}"
+                        )
+
+                next_change = scheduler.due_in('auto_volume')
+                ui.config(debug_labels["Next Schizo Volume Change"], 
+                    text=f"{int(next_change // 60)}m {int(next_change % 60)}s" if next_change is not None else "Off"
+                )
+                ui.config(debug_labels["Timers"], 
+                    text=", ".join(f"{name} {due:.1f}s" for name, due in scheduler.snapshot()) or "None"
+                )
 
-    except Exception:
-            pass
+                ui.config(debug_labels["Threads"], text=str(threading.active_count()))
+                ui.config(debug_labels["Commands"], text=f"{commands.pushed} pushed, {commands.merged} merged")
+                ui.config(debug_labels["UI Updates"], text=f"{ui.applied} applied, {ui.skipped} unchanged")
+                ui.config(debug_labels["Playlist Size"], text=str(len(playlist)))
+                ui.config(debug_labels["Filtered Size"], text=str(len(playlist.rows)))
+                ui.config(debug_labels["Duplicates"],
+                          text=f"{len(engine.dup_groups)} groups, {len(engine.dup_of) - len(engine.dup_groups)} extra copies")
 
-    root.after(1000, update_debug_stats)
-
-def open_debug_window():
-    global debug_window, debug_labels, debug_updating
-
-    if debug_window and tk.Toplevel.winfo_exists(debug_window):
-        debug_window.lift()
-        return
-
-    debug_window = tk.Toplevel(root)
-    debug_window.title("MP3 Debug")
-    debug_window.geometry("420x360")
-
-    frame = tk.Frame(debug_window)
-    frame.pack(fill="both", expand=True, padx=10, pady=10)
-
-    fields = [
-        "Track",
-        "Playing",
-        "Paused",
-        "Volume",
-        "Bitrate (est)",
-        "Track Duration",
-        "Playback Position",
-        "Next Schizo Volume Change",
-        "CPU %",
-        "RAM %",
-        "Disk %",
-        "Threads",
-        "Playlist Size",
-        "Filtered Size"
+        except Exception:
+                pass
+
+    # histograms shown as p50 / p95 / p99 in the debug window
+    LATENCY_FIELDS = [
+        ("Track Load", 'track_load_ms'),
+        ("Gapless Switch", 'gapless_switch_ms'),
+        ("Seek", 'seek_ms'),
+        ("Duration Probe", 'probe_ms'),
+        ("Playlist Refresh", 'playlist_refresh_ms'),
+        ("Search", 'search_ms'),
+        ("Stats Write", 'stats_write_ms'),
+        ("UI Tick Lag", 'tick_lag_ms'),
+        ("UI Flush", 'ui_flush_ms'),
     ]
 
-    debug_labels = {}
-    for f in fields:
-        row = tk.Frame(frame)
-        row.pack(anchor="w", fill="x", pady=2)
-        tk.Label(row, text=f + ":", width=22, anchor="w").pack(side="left")
-        val = tk.Label(row, text="—", anchor="w")
-        val.pack(side="left")
-        debug_labels[f] = val
-
-    debug_updating = True
-    update_debug_stats()
-
-    def on_close():
-        global debug_updating
-        debug_updating = False
-        debug_window.destroy()
-
-    debug_window.protocol("WM_DELETE_WINDOW", on_close)
-
-seed_var = tk.StringVar()
-seed_enable_var = tk.BooleanVar(value=False)
-
-def apply_seed():
-    global seeded_shuffle_enabled, shuffle_seed
-
-    text = seed_var.get().strip()
-
-    if text == "-debug":
-        open_debug_window()
-        return
-
-    seeded_shuffle_enabled = seed_enable_var.get()
-    shuffle_seed = text or None
-
-    apply_shuffle()
-
-    if playlist:
-        play_track(0)
-
-seed_frame = tk.Frame(root)
-seed_frame.pack(pady=6)
-
-seed_btn = tk.Button(
-    seed_frame,
-    text="Seeded Shuffle",
-    width=14,
-    command=lambda: toggle_button(seed_btn, seed_enable_var)
-)
-seed_btn.pack(side="left", padx=4)
-
-seed_entry = tk.Entry(
-    seed_frame,
-    textvariable=seed_var,
-    width=18
-)
-seed_entry.pack(side="left", padx=4)
-
-seed_apply_btn = tk.Button(
-    seed_frame,
-    text="Apply",
-    command=apply_seed
-)
-seed_apply_btn.pack(side="left", padx=4)
-
-
-
-###########################
-# Search Logic
-###########################
-def update_search_results(*args):
-    global filtered_playlist
-    query = search_var.get().lower()
-    if not query:
-        filtered_playlist = playlist.copy()
-    else:
-        filtered_playlist = [s for s in playlist if query in os.path.basename(s).lower()]
-    refresh_playlist_box()
-
-def play_first_search_result(event=None):
-    if filtered_playlist:
-        play_track(playlist.index(filtered_playlist[0]))
-
-search_var.trace_add('write', update_search_results)
-search_entry.bind('<Return>', play_first_search_result)
-
-###########################
-# Playback Functions
-###########################
-def play_track(i, position=None):
-    global index, playing, paused, track_duration, playback_offset, _listened_flag
-    if not playlist:
-        return
-    index = i % len(playlist)
-    filepath = playlist[index]
-    increment_stat_for_path(filepath, 'started')
-    _listened_flag = False
-    try:
-        pygame.mixer.music.load(filepath)
-    except Exception as e:
-        print("Failed loading:", filepath, e)
-        return
-    pygame.mixer.music.play(0)
-    pygame.mixer.music.set_volume(volume)
-    playback_offset = 0
-    if position is not None:
+    def sample_process_metrics():
+        metrics.set('cpu_percent', process.cpu_percent(interval=None))
+        metrics.set('rss_mb', process.memory_info().rss / (1024 * 1024))
         try:
-            pygame.mixer.music.set_pos(position)
-            playback_offset = position
+            io = process.io_counters()
+            metrics.set('disk_read_mb', io.read_bytes / (1024 * 1024))
+            metrics.set('disk_write_mb', io.write_bytes / (1024 * 1024))
         except Exception:
-            pass
-    playing = True
-    paused = False
-    try:
-        track_duration = pygame.mixer.Sound(filepath).get_length()
-    except Exception:
-        track_duration = 0
-    update_ui_state()
-    update_status_label()
-    playlist_box.select_clear(0, tk.END)
-    if filepath in filtered_playlist:
-        playlist_box.select_set(filtered_playlist.index(filepath))
-        playlist_box.activate(filtered_playlist.index(filepath))
-
-def play_selected():
-    selection = playlist_box.curselection()
-    if selection:
-        selected_name = playlist_box.get(selection[0]).split('|')[0].strip()
-        for i, path in enumerate(playlist):
-            if os.path.basename(path) == selected_name:
-                play_track(i)
-                break
-
-playlist_box.bind("<Double-Button-1>", lambda e: play_selected())
-
-###########################
-# Volume Control
-###########################
-def change_volume(e=None):
-    global volume
-    volume = float(volume_slider.get())
-    pygame.mixer.music.set_volume(volume)
-    status_label.config(text=f"Volume: {int(volume*100)}%")
-    root.after(1200, update_status_label)
-
-volume_slider.bind('<ButtonRelease-1>', change_volume)
-volume_slider.bind('<B1-Motion>', change_volume)
-
-###########################
-# Slider Seeking
-###########################
-def start_drag(event):
-    global slider_dragging
-    slider_dragging = True
-
-def stop_drag(event):
-    global slider_dragging, seek_block_until, playback_offset
-    slider_dragging = False
-    if playing and playlist:
-        new_pos = progress_slider.get() * track_duration
+            metrics.set('disk_read_mb', 0)
+            metrics.set('disk_write_mb', 0)
+        metrics.set('threads', threading.active_count())
+
+    def export_metrics():
         try:
-            pygame.mixer.music.stop()
-            pygame.mixer.music.load(playlist[index])
-            pygame.mixer.music.play(start=new_pos)
-            pygame.mixer.music.set_volume(volume)
-            playback_offset = new_pos
-            seek_block_until = time.time() + 1.0
+            metrics.export_prometheus(BASE_DIR / "metrics.prom")
+            metrics.export_jsonl(BASE_DIR / "metrics.jsonl")
+            ui.config(status_label, text="Metrics written to metrics.prom and metrics.jsonl")
         except Exception as e:
-            print("Seek failed:", e)
-
-progress_slider.bind("<ButtonPress-1>", start_drag)
-progress_slider.bind("<ButtonRelease-1>", stop_drag)
-
-###########################
-# Auto-volume adjuster
-###########################
-
-def schedule_next_adjust():
-    return random.randint(5*60, 30*60)
-
-def auto_adjust_loop():
-    while not auto_stop_event.is_set():
-        wait = schedule_next_adjust()
-        slept = 0
-        while slept < wait and not auto_stop_event.is_set():
-            time.sleep(1)
-            slept += 1
-        if auto_stop_event.is_set():
-            break
-        change = 0.0 if random.choice([True, False]) else -0.03
-        new_vol = max(0.0, min(1.0, volume + change))
-        def apply_volume():
-            global volume
-            volume = new_vol
-            pygame.mixer.music.set_volume(volume)
-            volume_slider.set(volume)
-            status_label.config(text=f'Auto-adjusted volume to {int(volume*100)}%')
-            root.after(100, update_status_label)
-        root.after(0, apply_volume)
-
-def start_auto_adjust():
-    global auto_adjust_enabled, auto_thread, auto_stop_event
-    if auto_adjust_enabled:
-        return
-    auto_adjust_enabled = True
-    auto_stop_event.clear()
-    auto_thread = threading.Thread(target=auto_adjust_loop, daemon=True)
-    auto_thread.start()
-
-def stop_auto_adjust():
-    global auto_adjust_enabled, auto_thread, auto_stop_event
-    if not auto_adjust_enabled:
-        return
-    auto_stop_event.set()
-    auto_thread = None
-    auto_adjust_enabled = False
-
-###########################
-# Dark Mode
-###########################
-
-dark_mode = True
-style = ttk.Style()
-
-LIGHT_BTN_OFF = "#f0f0f0"
-LIGHT_BTN_ON  = "#6a9fb5"
-LIGHT_BTN_FG  = "#000000"
-DARK_BTN_OFF = "#444444"
-DARK_BTN_ON  = "#6a9fb5"
-DARK_BTN_FG  = "#ffffff"
-
-def set_dark_mode_styles():
-    style.theme_use('default')
-    style.configure('TCheckbutton', background='#2e2e2e', foreground='white')
-    style.configure('TScale', troughcolor='#555555', background='#2e2e2e')
-
-def set_light_mode_styles():
-    style.theme_use('default')
-    style.configure('TCheckbutton', background='#f0f0f0', foreground='black')
-    style.configure('TScale', troughcolor='#d9d9d9', background='#f0f0f0')
-
-def apply_dark_mode():
-    bg_color = '#2e2e2e'
-    fg_color = '#ffffff'
-    btn_bg = '#444444'
-    entry_bg = '#3a3a3a'
-    entry_fg = '#ffffff'
-
-    bottom_btn_frame.configure(bg=bg_color)
-
-    apply_toggle_button_style(schizo_btn, auto_var)
-    apply_toggle_button_style(stats_btn, show_stats_var)
-    apply_toggle_button_style(seed_btn, seed_enable_var)
-
-    set_dark_mode_styles()
-    root.configure(bg=bg_color)
-    playlist_box.configure(bg='#3e3e3e', fg=fg_color, selectbackground='#666666', selectforeground=fg_color)
-    status_label.configure(bg=bg_color, fg=fg_color)
-    volume_label.configure(bg=bg_color, fg=fg_color)
-    control_frame.configure(bg=bg_color)
-    volume_frame.configure(bg=bg_color)
-    auto_frame.configure(bg=bg_color)
-    search_frame.configure(bg=bg_color)
-    search_label.configure(bg=bg_color, fg=fg_color)
-    search_entry.configure(bg=entry_bg, fg=entry_fg, insertbackground=entry_fg, highlightbackground='#555555', highlightcolor='#777777', relief='flat')
-    for btn in [btn_prev, btn_play, btn_next, btn_load, darkmode_btn]:
-        btn.configure(bg=btn_bg, fg=fg_color, activebackground='#555555')
-    seed_frame.configure(bg=bg_color)
-
-    seed_entry.configure(
-        bg=entry_bg,
-        fg=entry_fg,
-        insertbackground=entry_fg,
-        highlightbackground='#555555',
-        highlightcolor='#777777',
-        relief='flat'
+            ui.config(status_label, text=f"Metrics export failed: {e}")
+        reset_status_later()
+
+    def open_debug_window():
+        nonlocal debug_window, debug_labels, debug_updating, process
+
+        if process is None:
+            import psutil
+            process = psutil.Process(os.getpid())
+
+        if debug_window and tk.Toplevel.winfo_exists(debug_window):
+            debug_window.lift()
+            return
+
+        debug_window = tk.Toplevel(root)
+        debug_window.title("MP3 Debug")
+        debug_window.geometry("560x640")
+
+        frame = tk.Frame(debug_window)
+        frame.pack(fill="both", expand=True, padx=10, pady=10)
+
+        fields = [
+            "Track",
+            "Playing",
+            "Paused",
+            "Volume",
+            "Bitrate (est)",
+            "Track Duration",
+            "Playback Position",
+            "Transition Latency",
+            "Seek Latency",
+            "Next Schizo Volume Change",
+            "Timers",
+            "CPU %",
+            "RAM %",
+            "Disk %",
+            "Threads",
+            "Commands",
+            "UI Updates",
+            "Playlist Size",
+            "Filtered Size",
+            "Duplicates"
+        ] + [label for label, name in LATENCY_FIELDS]
+
+        debug_labels = {}
+        for f in fields:
+            row = tk.Frame(frame)
+            row.pack(anchor="w", fill="x", pady=2)
+            tk.Label(row, text=f + ":", width=22, anchor="w").pack(side="left")
+            val = tk.Label(row, text="—", anchor="w")
+            val.pack(side="left")
+            debug_labels[f] = val
+
+        tk.Button(frame, text="Export Metrics", command=export_metrics).pack(anchor="w", pady=(8, 0))
+
+        debug_updating = True
+        update_debug_stats()
+        scheduler.every(1.0, 'debug_refresh', update_debug_stats)
+
+        def on_close():
+            nonlocal debug_updating
+            debug_updating = False
+            scheduler.cancel('debug_refresh')
+            for label in debug_labels.values():
+                ui.forget(label)
+            debug_window.destroy()
+
+        debug_window.protocol("WM_DELETE_WINDOW", on_close)
+
+    seed_var = tk.StringVar()
+    seed_enable_var = tk.BooleanVar(value=False)
+    smart_shuffle_var = tk.BooleanVar(value=False)
+
+    def apply_seed():
+        text = seed_var.get().strip()
+
+        if text == "-debug":
+            open_debug_window()
+            return
+
+        engine.set_shuffle(seed_enable_var.get(), text or None)
+
+        if playlist:
+            engine.play_track(0)
+
+    seed_frame = tk.Frame(root)
+    seed_frame.pack(pady=6)
+
+    seed_btn = tk.Button(
+        seed_frame,
+        text="Seeded Shuffle",
+        width=14,
+        command=lambda: toggle_button(seed_btn, seed_enable_var)
     )
+    seed_btn.pack(side="left", padx=4)
 
-    seed_apply_btn.configure(
-        bg=btn_bg,
-        fg=fg_color,
-        activebackground='#555555'
+    smart_btn = tk.Button(
+        seed_frame,
+        text="Smart Shuffle",
+        width=14,
+        command=lambda: toggle_button(smart_btn, smart_shuffle_var, lambda: engine.set_smart_shuffle(smart_shuffle_var.get()))
     )
+    smart_btn.pack(side="left", padx=4)
 
-def apply_light_mode():
-    bg_color = '#f0f0f0'
-    fg_color = '#000000'
-    btn_bg = '#f0f0f0'
-    entry_bg = '#ffffff'
-    entry_fg = '#000000'
-
-
-    apply_toggle_button_style(schizo_btn, auto_var)
-    apply_toggle_button_style(stats_btn, show_stats_var)
-    apply_toggle_button_style(seed_btn, seed_enable_var)
-    
-    bottom_btn_frame.configure(bg=bg_color)
-
-    set_light_mode_styles()
-    root.configure(bg=bg_color)
-    playlist_box.configure(bg='white', fg=fg_color, selectbackground='#c0c0ff', selectforeground=fg_color)
-    status_label.configure(bg=bg_color, fg=fg_color)
-    volume_label.configure(bg=bg_color, fg=fg_color)
-    control_frame.configure(bg=bg_color)
-    volume_frame.configure(bg=bg_color)
-    auto_frame.configure(bg=bg_color)
-    search_frame.configure(bg=bg_color)
-    search_label.configure(bg=bg_color, fg=fg_color)
-    search_entry.configure(bg=entry_bg, fg=entry_fg, insertbackground=entry_fg, highlightbackground='#d9d9d9', highlightcolor='#a0a0a0', relief='sunken')
-    for btn in [btn_prev, btn_play, btn_next, btn_load, darkmode_btn]:
-        btn.configure(bg=btn_bg, fg=fg_color, activebackground=None)
-    seed_frame.configure(bg=bg_color)
-
-    seed_entry.configure(
-        bg=entry_bg,
-        fg=entry_fg,
-        insertbackground=entry_fg,
-        highlightbackground='#d9d9d9',
-        highlightcolor='#a0a0a0',
-        relief='sunken'
+    seed_entry = tk.Entry(
+        seed_frame,
+        textvariable=seed_var,
+        width=18
     )
+    seed_entry.pack(side="left", padx=4)
 
-    seed_apply_btn.configure(
-        bg=btn_bg,
-        fg=fg_color,
-        activebackground=None
+    seed_apply_btn = tk.Button(
+        seed_frame,
+        text="Apply",
+        command=apply_seed
     )
+    seed_apply_btn.pack(side="left", padx=4)
+
+
+
+    ###########################
+    # Search Logic
+    ###########################
+    def schedule_search(*args):
+        scheduler.call_later(SEARCH_DEBOUNCE_MS / 1000, 'search', update_search_results)
+
+    def update_search_results(*args):
+        engine.search(search_var.get())
+
+    def play_first_search_result(event=None):
+        if scheduler.cancel('search'):
+            update_search_results()
+        engine.play_view_row(0)
+
+    search_var.trace_add('write', schedule_search)
+    search_entry.bind('<Return>', play_first_search_result)
+
+    ###########################
+    # Playback Functions
+    ###########################
+    def play_selected():
+        selection = playlist_box.selected_index()
+        if selection is not None:
+            engine.play_view_row(selection)
+
+    playlist_box.bind("<Double-Button-1>", lambda e: play_selected())
+
+    def enqueue_at(event, play_next=False):
+        # right click queues a track, shift+right click plays it next
+        row = playlist_box.index_at(event.y)
+        if row is None or not 0 <= row < len(playlist.rows):
+            return
+        path = playlist.path(playlist.view_tid(row))
+        if engine.enqueue(path, play_next):
+            where = "next" if play_next else f"#{len(engine.play_queue)}"
+            ui.config(status_label, text=f"Queued {where}: {engine.display_name(path)}")
+            reset_status_later()
+
+    playlist_box.bind("<Button-3>", enqueue_at)
+    playlist_box.bind("<Shift-Button-3>", lambda e: enqueue_at(e, play_next=True))
+
+    ###########################
+    # Volume Control
+    ###########################
+    def change_volume(e=None):
+        engine.set_volume(float(volume_slider.get()))
+        ui.config(status_label, text=f"Volume: {int(engine.volume*100)}%")
+        reset_status_later()
+
+    volume_slider.bind('<ButtonRelease-1>', change_volume)
+    volume_slider.bind('<B1-Motion>', change_volume)
+
+    ###########################
+    # Slider Seeking
+    ###########################
+    def start_drag(event):
+        nonlocal slider_dragging
+        slider_dragging = True
+        wake_progress()
+
+    def stop_drag(event):
+        nonlocal slider_dragging
+        slider_dragging = False
+        ui.forget(progress_slider)
+        engine.seek_to(progress_slider.get() * engine.track_duration)
+
+    progress_slider.bind("<ButtonPress-1>", start_drag)
+    progress_slider.bind("<ButtonRelease-1>", stop_drag)
+
+    ###########################
+    # Waveform Overview
+    ###########################
+
+    def draw_waveform(event=None):
+        # peaks are memory-mapped and precomputed, so this never decodes audio
+        waveform_canvas.delete('all')
+        width = waveform_canvas.winfo_width()
+        peaks = engine.peaks_for(engine.current_path())
+        if peaks is None or width < 2:
+            return
+        mid = WAVEFORM_HEIGHT / 2
+        scale = (mid - 1) / 127
+        top = []
+        bottom = []
+        for x, (lo, hi) in enumerate(peaks.columns(width)):
+            top += (x, mid - hi * scale)
+            bottom += (x, mid - lo * scale)
+        for i in range(len(bottom) - 2, -1, -2):
+            top += (bottom[i], bottom[i + 1])
+        waveform_canvas.create_polygon(top, fill=waveform_colors['wave'], outline='', tags='wave')
+        waveform_canvas.create_line(0, 0, 0, WAVEFORM_HEIGHT, fill=waveform_colors['cursor'], tags='cursor')
+        move_waveform_cursor(progress_slider.get())
+
+    def move_waveform_cursor(fraction):
+        x = fraction * waveform_canvas.winfo_width()
+        waveform_canvas.coords('cursor', x, 0, x, WAVEFORM_HEIGHT)
+
+    def seek_from_waveform(event):
+        width = waveform_canvas.winfo_width()
+        if width > 0 and engine.track_duration > 0:
+            fraction = max(0.0, min(1.0, event.x / width))
+            progress_slider.set(fraction)
+            ui.forget(progress_slider)
+            engine.seek_to(fraction * engine.track_duration)
+
+    waveform_canvas.bind("<Configure>", draw_waveform)
+    waveform_canvas.bind("<Button-1>", seek_from_waveform)
+
+    ###########################
+    # Auto-volume adjuster
+    ###########################
+
+    def schedule_next_adjust():
+        scheduler.call_later(random.randint(5*60, 30*60), 'auto_volume', auto_adjust_volume)
+
+    def auto_adjust_volume():
+        change = 0.0 if random.choice([True, False]) else -0.03
+        engine.set_volume(max(0.0, min(1.0, engine.volume + change)))
+        ui.config(status_label, text=f'Auto-adjusted volume to {int(engine.volume*100)}%')
+        reset_status_later(100)
+        schedule_next_adjust()
+
+    def start_auto_adjust():
+        nonlocal auto_adjust_enabled
+        if auto_adjust_enabled:
+            return
+        auto_adjust_enabled = True
+        schedule_next_adjust()
+
+    def stop_auto_adjust():
+        nonlocal auto_adjust_enabled
+        if not auto_adjust_enabled:
+            return
+        scheduler.cancel('auto_volume')
+        auto_adjust_enabled = False
+
+    ###########################
+    # Dark Mode
+    ###########################
+
+    dark_mode = True
+    style = ttk.Style()
+
+    LIGHT_BTN_OFF = "#f0f0f0"
+    LIGHT_BTN_ON  = "#6a9fb5"
+    LIGHT_BTN_FG  = "#000000"
+    DARK_BTN_OFF = "#444444"
+    DARK_BTN_ON  = "#6a9fb5"
+    DARK_BTN_FG  = "#ffffff"
+
+    def set_dark_mode_styles():
+        style.theme_use('default')
+        style.configure('TCheckbutton', background='#2e2e2e', foreground='white')
+        style.configure('TScale', troughcolor='#555555', background='#2e2e2e')
+
+    def set_light_mode_styles():
+        style.theme_use('default')
+        style.configure('TCheckbutton', background='#f0f0f0', foreground='black')
+        style.configure('TScale', troughcolor='#d9d9d9', background='#f0f0f0')
+
+    def apply_dark_mode():
+        bg_color = '#2e2e2e'
+        fg_color = '#ffffff'
+        btn_bg = '#444444'
+        entry_bg = '#3a3a3a'
+        entry_fg = '#ffffff'
+
+        bottom_btn_frame.configure(bg=bg_color)
+
+        apply_toggle_button_style(schizo_btn, auto_var)
+        apply_toggle_button_style(stats_btn, show_stats_var)
+        apply_toggle_button_style(normalize_btn, normalize_var)
+        apply_toggle_button_style(collapse_btn, collapse_var)
+        apply_toggle_button_style(seed_btn, seed_enable_var)
+        apply_toggle_button_style(smart_btn, smart_shuffle_var)
+
+        set_dark_mode_styles()
+        root.configure(bg=bg_color)
+        playlist_box.configure(bg='#3e3e3e', fg=fg_color, selectbackground='#666666', selectforeground=fg_color)
+        status_label.configure(bg=bg_color, fg=fg_color)
+        waveform_canvas.configure(bg=bg_color)
+        waveform_colors['wave'] = '#7fa7d4'
+        draw_waveform()
+        volume_label.configure(bg=bg_color, fg=fg_color)
+        control_frame.configure(bg=bg_color)
+        volume_frame.configure(bg=bg_color)
+        auto_frame.configure(bg=bg_color)
+        search_frame.configure(bg=bg_color)
+        search_label.configure(bg=bg_color, fg=fg_color)
+        search_entry.configure(bg=entry_bg, fg=entry_fg, insertbackground=entry_fg, highlightbackground='#555555', highlightcolor='#777777', relief='flat')
+        for btn in [btn_prev, btn_play, btn_next, btn_load, btn_import, btn_export, darkmode_btn]:
+            btn.configure(bg=btn_bg, fg=fg_color, activebackground='#555555')
+        seed_frame.configure(bg=bg_color)
+
+        seed_entry.configure(
+            bg=entry_bg,
+            fg=entry_fg,
+            insertbackground=entry_fg,
+            highlightbackground='#555555',
+            highlightcolor='#777777',
+            relief='flat'
+        )
+
+        seed_apply_btn.configure(
+            bg=btn_bg,
+            fg=fg_color,
+            activebackground='#555555'
+        )
+
+    def apply_light_mode():
+        bg_color = '#f0f0f0'
+        fg_color = '#000000'
+        btn_bg = '#f0f0f0'
+        entry_bg = '#ffffff'
+        entry_fg = '#000000'
+
+
+        apply_toggle_button_style(schizo_btn, auto_var)
+        apply_toggle_button_style(stats_btn, show_stats_var)
+        apply_toggle_button_style(normalize_btn, normalize_var)
+        apply_toggle_button_style(collapse_btn, collapse_var)
+        apply_toggle_button_style(seed_btn, seed_enable_var)
+        apply_toggle_button_style(smart_btn, smart_shuffle_var)
+
+        bottom_btn_frame.configure(bg=bg_color)
+
+        set_light_mode_styles()
+        root.configure(bg=bg_color)
+        playlist_box.configure(bg='white', fg=fg_color, selectbackground='#c0c0ff', selectforeground=fg_color)
+        status_label.configure(bg=bg_color, fg=fg_color)
+        waveform_canvas.configure(bg=bg_color)
+        waveform_colors['wave'] = '#5a7fa8'
+        draw_waveform()
+        volume_label.configure(bg=bg_color, fg=fg_color)
+        control_frame.configure(bg=bg_color)
+        volume_frame.configure(bg=bg_color)
+        auto_frame.configure(bg=bg_color)
+        search_frame.configure(bg=bg_color)
+        search_label.configure(bg=bg_color, fg=fg_color)
+        search_entry.configure(bg=entry_bg, fg=entry_fg, insertbackground=entry_fg, highlightbackground='#d9d9d9', highlightcolor='#a0a0a0', relief='sunken')
+        for btn in [btn_prev, btn_play, btn_next, btn_load, btn_import, btn_export, darkmode_btn]:
+            btn.configure(bg=btn_bg, fg=fg_color, activebackground=None)
+        seed_frame.configure(bg=bg_color)
+
+        seed_entry.configure(
+            bg=entry_bg,
+            fg=entry_fg,
+            insertbackground=entry_fg,
+            highlightbackground='#d9d9d9',
+            highlightcolor='#a0a0a0',
+            relief='sunken'
+        )
+
+        seed_apply_btn.configure(
+            bg=btn_bg,
+            fg=fg_color,
+            activebackground=None
+        )
+
+    def toggle_dark_mode():
+        nonlocal dark_mode
+        dark_mode = not dark_mode
+        if dark_mode:
+            apply_dark_mode()
+        else:
+            apply_light_mode()
+
+    bottom_btn_frame = tk.Frame(root, bg="#2e2e2e")
+    bottom_btn_frame.pack(pady=6)
+
+    btn_load = tk.Button(bottom_btn_frame, text="Load Folder", command=load_folder)
+    btn_load.pack(side="left", padx=6)
+
+    btn_import = tk.Button(bottom_btn_frame, text="Import Playlist", command=import_playlist)
+    btn_import.pack(side="left", padx=6)
 
-def toggle_dark_mode():
-    global dark_mode
-    dark_mode = not dark_mode
-    if dark_mode:
-        apply_dark_mode()
-    else:
-        apply_light_mode()
-
-bottom_btn_frame = tk.Frame(root, bg="#2e2e2e")
-bottom_btn_frame.pack(pady=6)
-
-btn_load = tk.Button(bottom_btn_frame, text="Load Folder", command=load_folder)
-btn_load.pack(side="left", padx=6)
-
-darkmode_btn = tk.Button(bottom_btn_frame, text='Toggle Dark Mode', command=toggle_dark_mode)
-darkmode_btn.pack(side="left", padx=6)
-
-
-apply_dark_mode()
-
-###########################
-# Hotkeys
-###########################
-
-VOLUME_STEP = 0.01
-def volume_up():
-    global volume
-    volume = min(1.0, volume + VOLUME_STEP)
-    pygame.mixer.music.set_volume(volume)
-    volume_slider.set(volume)
-    status_label.config(text=f"Volume: {int(volume*100)}%")
-    root.after(1200, update_status_label)
-
-def volume_down():
-    global volume
-    volume = max(0.0, volume - VOLUME_STEP)
-    pygame.mixer.music.set_volume(volume)
-    volume_slider.set(volume)
-    status_label.config(text=f"Volume: {int(volume*100)}%")
-    root.after(1200, update_status_label)
-
-def toggle_pause():
-    toggle_play()
-
-if KEYBOARD_AVAILABLE:
-    keyboard.add_hotkey('right ctrl+alt+up', volume_up)
-    keyboard.add_hotkey('right ctrl+alt+down', volume_down)
-    keyboard.add_hotkey('right ctrl+alt+pgdown', play_next)
-    keyboard.add_hotkey('right ctrl+alt+pgup', play_prev)
-    keyboard.add_hotkey('right ctrl+alt+l', toggle_pause)
-
-
-###########################
-# UI & Progress Updates
-###########################
-
-def update_ui_state():
-    if paused:
-        btn_play.config(text="▶ Resume")
-    elif playing:
-        btn_play.config(text="⏸ Pause")
-    else:
-        btn_play.config(text="▶ Play")
-
-def update_status_label():
-    if not playlist:
-        status_label.config(text='No track loaded')
-        return
-    current = playlist[index]
-    s = get_stats_for_path(current)
-    status_label.config(text=f"{os.path.basename(current)} — Started: {s['started']} | Listened: {s['listened']} | Skipped: {s['skipped']}")
-
-def update_progress():
-    global seek_block_until, playback_offset, _listened_flag
-    if playing:
-        if not slider_dragging and time.time() > seek_block_until:
-            pos_ms = pygame.mixer.music.get_pos()
-            current_time = (pos_ms / 1000.0 if pos_ms >= 0 else 0.0) + playback_offset
-            if track_duration > 0:
-                frac = max(0.0, min(1.0, current_time / track_duration))
-                progress_slider.set(frac)
-            if track_duration > 0 and current_time >= track_duration - 0.5:
-                if not _listened_flag:
-                    increment_stat_for_path(playlist[index], 'listened')
-                    _listened_flag = True
-                play_next()
-    update_status_label()
-    root.after(250, update_progress)
-
-update_progress()
-
-###########################
-# Scalable UI
-###########################
-
-def on_resize(event):
-    width = root.winfo_width()
-    scale = max(0.7, min(1.4, width / 560))
-
-    playlist_box.config(font=("Segoe UI", int(10 * scale)))
-    status_label.config(font=("Segoe UI", int(9 * scale)))
-    volume_label.config(font=("Segoe UI", int(9 * scale)))
-    search_label.config(font=("Segoe UI", int(9 * scale)))
-
-    fixed_font = ("Segoe UI", 10)
-    for widget in [btn_play, btn_prev, btn_next, btn_load, darkmode_btn]:
+    btn_export = tk.Button(bottom_btn_frame, text="Export Playlist", command=export_playlist)
+    btn_export.pack(side="left", padx=6)
+
+    darkmode_btn = tk.Button(bottom_btn_frame, text='Toggle Dark Mode', command=toggle_dark_mode)
+    darkmode_btn.pack(side="left", padx=6)
+
+
+    apply_dark_mode()
+
+    ###########################
+    # Hotkeys
+    ###########################
+
+    VOLUME_STEP = 0.01
+    def volume_up():
+        commands.push('volume_step', VOLUME_STEP)
+
+    def volume_down():
+        commands.push('volume_step', -VOLUME_STEP)
+
+    def toggle_pause():
+        toggle_play()
+
+    def step_volume(delta):
+        engine.set_volume(engine.volume + delta)
+        ui.config(status_label, text=f"Volume: {int(engine.volume*100)}%")
+        reset_status_later()
+
+    def toggle_playback(count):
+        if count:
+            engine.toggle_play()
+
+    commands.register('volume_step', step_volume, add)
+    commands.register('skip', engine.skip, add)
+    commands.register('toggle', toggle_playback, toggle)
+
+    def register_hotkeys():
+        try:
+            import keyboard
+        except Exception:
+            return
+        keyboard.add_hotkey('right ctrl+alt+up', volume_up)
+        keyboard.add_hotkey('right ctrl+alt+down', volume_down)
+        keyboard.add_hotkey('right ctrl+alt+pgdown', play_next)
+        keyboard.add_hotkey('right ctrl+alt+pgup', play_prev)
+        keyboard.add_hotkey('right ctrl+alt+l', toggle_pause)
+
+
+    ###########################
+    # UI & Progress Updates
+    ###########################
+
+    def update_ui_state():
+        if engine.paused:
+            ui.config(btn_play, text="▶ Resume")
+        elif engine.playing:
+            ui.config(btn_play, text="⏸ Pause")
+        else:
+            ui.config(btn_play, text="▶ Play")
+
+    def update_status_label():
+        scan_text = engine.scan_status_text
+        if not playlist:
+            ui.config(status_label, text=scan_text or 'No track loaded')
+            return
+        current = engine.current_path()
+        s = engine.stats_for(current)
+        text = f"{engine.display_name(current)} — Started: {s['started']} | Listened: {s['listened']} | Skipped: {s['skipped']}"
+        if scan_text:
+            text += f" — {scan_text}"
+        ui.config(status_label, text=text)
+
+    # Tick rates: fast while the slider moves on screen, slower when it can't be
+    # seen, and idle when nothing is playing or scanning.
+    TICK_ACTIVE_MS = 250
+    TICK_HIDDEN_MS = 500
+    TICK_IDLE_MS = 1000
+
+    def next_tick_ms():
+        if slider_dragging:
+            return TICK_ACTIVE_MS
+        if not engine.needs_fast_tick():
+            return TICK_IDLE_MS
+        if root.state() != 'normal' and root.state() != 'zoomed':
+            return TICK_HIDDEN_MS
+        return TICK_ACTIVE_MS
+
+    tick_due = None
+
+    def update_progress():
+        nonlocal tick_due
+        now = time.monotonic()
+        if tick_due is not None:
+            metrics.observe('tick_lag_ms', max(0.0, now - tick_due) * 1000)
+        commands.run()
+        engine.tick()
+        delay = next_tick_ms() / 1000
+        tick_due = time.monotonic() + delay
+        scheduler.call_later(delay, 'tick', update_progress)
+
+    def wake_progress(event=None):
+        # state changed under an idle tick; don't wait out the long interval
+        nonlocal tick_due
+        if not scheduler.pending('tick') or (event is not None and event.widget is not root):
+            return
+        tick_due = time.monotonic()
+        scheduler.call_later(0, 'tick', update_progress)
+
+    ###########################
+    # Engine Events
+    ###########################
+
+    def on_track_started(data):
+        update_ui_state()
+        update_status_label()
+        ui.call('waveform', draw_waveform)
+        row = playlist.view_row(playlist.tid_at(data['index']))
+        if row >= 0:
+            playlist_box.select(row)
+        else:
+            playlist_box.clear_selection()
+
+    def on_position(data):
+        duration = data['duration']
+        if not slider_dragging and duration > 0:
+            # a thousandth of the bar is below what the slider can show
+            fraction = round(max(0.0, min(1.0, data['position'] / duration)), 3)
+            ui.set(progress_slider, fraction)
+            ui.call('waveform_cursor', lambda: move_waveform_cursor(fraction))
+
+    def on_playlist_changed(data):
+        if data['reset']:
+            refresh_playlist_box()
+        else:
+            playlist_box.items_changed()
+
+    def on_stats_changed(data):
+        if data['path'] == engine.current_path():
+            update_status_label()
+        if show_stats_var.get():
+            playlist_box.refresh()
+
+    def on_state_changed(data):
+        update_ui_state()
+        wake_progress()
+
+    engine.events.subscribe('track_started', on_track_started)
+    engine.events.subscribe('position', on_position)
+    engine.events.subscribe('state_changed', on_state_changed)
+    engine.events.subscribe('volume_changed', lambda data: ui.set(volume_slider, data['volume']))
+    engine.events.subscribe('playlist_changed', on_playlist_changed)
+    engine.events.subscribe('view_changed', lambda data: refresh_playlist_box())
+    engine.events.subscribe('stats_changed', on_stats_changed)
+    engine.events.subscribe('scan_progress', lambda data: update_status_label())
+    engine.events.subscribe('tags_changed', lambda data: playlist_box.refresh())
+    engine.events.subscribe('duplicates_changed', lambda data: playlist_box.refresh())
+    engine.events.subscribe('peaks_ready', lambda data: ui.call('waveform', draw_waveform))
+
+    ###########################
+    # Scalable UI
+    ###########################
+
+    # Named fonts: resizing changes their size once and Tk updates every widget
+    # that uses them. <Configure> fires for each child during a drag-resize, so
+    # the window's own events are debounced into one rescale.
+    RESIZE_DEBOUNCE_MS = 100
+
+    list_font = tkfont.Font(family="Segoe UI", size=10)
+    label_font = tkfont.Font(family="Segoe UI", size=9)
+    fixed_font = tkfont.Font(family="Segoe UI", size=10)
+
+    playlist_box.config(font=list_font)
+    for widget in [status_label, volume_label, search_label]:
+        widget.config(font=label_font)
+    for widget in [btn_play, btn_prev, btn_next, btn_load, btn_import, btn_export, darkmode_btn]:
         widget.config(font=fixed_font)
 
-    progress_slider.config(length=int(500 * scale))
-    volume_slider.config(length=int(300 * scale))
+    def on_resize(event):
+        if event.widget is root:
+            scheduler.call_later(RESIZE_DEBOUNCE_MS / 1000, 'resize', apply_scale)
+
+    def apply_scale():
+        width = root.winfo_width()
+        scale = max(0.7, min(1.4, width / 560))
+
+        if list_font.cget('size') != int(10 * scale):
+            list_font.configure(size=int(10 * scale))
+            # row height depends on the font
+            playlist_box.config(font=list_font)
+        if label_font.cget('size') != int(9 * scale):
+            label_font.configure(size=int(9 * scale))
+
+        ui.config(progress_slider, length=int(500 * scale))
+        ui.config(volume_slider, length=int(300 * scale))
+
 
+    root.bind("<Configure>", on_resize)
+    root.bind("<Map>", wake_progress)
 
-root.bind("<Configure>", on_resize)
+    ###########################
+    # Close
+    ###########################
 
-###########################
-# Close
-###########################
+    def _on_close():
+        control.stop()
+        engine.close()
+        root.destroy()
 
-def _on_close():
-    auto_stop_event.set()
-    try:
-        pygame.mixer.music.stop()
-    except Exception:
-        pass
-    save_stats()
-    root.destroy()
+    root.protocol('WM_DELETE_WINDOW', _on_close)
 
-root.protocol('WM_DELETE_WINDOW', _on_close)
-root.mainloop()
+    ###########################
+    # Deferred Startup
+    ###########################
+
+    # Only what the first frame needs runs before mainloop. The mixer and
+    # library come right after the window is up; stats, hotkeys and their
+    # imports load on a worker so a big stats file never holds the window back.
+
+    background_done = threading.Event()
+    control = ControlServer(engine, socket_path(BASE_DIR))
+
+    def background_startup():
+        engine.load_stats()
+        timer.mark('stats')
+        register_hotkeys()
+        timer.mark('hotkeys')
+        background_done.set()
+
+    def wait_for_background():
+        if not background_done.is_set():
+            scheduler.call_later(0.05, 'startup_wait', wait_for_background)
+            return
+        if show_stats_var.get():
+            playlist_box.refresh()
+        update_status_label()
+        timer.report()
+
+    def restore_controls():
+        # reflect the resumed session in the toggles and entries
+        normalize_var.set(engine.normalize)
+        seed_enable_var.set(engine.seeded_shuffle_enabled)
+        seed_var.set(engine.shuffle_seed or "")
+        smart_shuffle_var.set(engine.smart_shuffle_enabled)
+        collapse_var.set(engine.collapse_duplicates)
+        for btn, var in ((normalize_btn, normalize_var), (seed_btn, seed_enable_var), (smart_btn, smart_shuffle_var),
+                         (collapse_btn, collapse_var)):
+            apply_toggle_button_style(btn, var)
+        if engine.search_query:
+            search_var.set(engine.search_query)
+            scheduler.cancel('search')
+
+    def deferred_startup():
+        timer.mark('first_paint')
+        threading.Thread(target=background_startup, daemon=True).start()
+        engine.init_audio()
+        timer.mark('mixer')
+        if engine.restore_library():
+            engine.resume_session()
+            restore_controls()
+            update_status_label()
+        timer.mark('library')
+        engine.wake = wake_from_thread
+        control.start()
+        update_progress()
+        wait_for_background()
+
+    timer.mark('widgets')
+    root.after_idle(deferred_startup)
+    root.mainloop()
+
+
+# spawned worker processes (loudness analysis) import this script again;
+# the guard keeps them from opening a window of their own
+if __name__ == '__main__':
+    main()
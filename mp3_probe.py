@@ -0,0 +1,240 @@
+import os
+import struct
+
+# Duration probing that only touches MP3 frame headers (never decodes audio).
+
+BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+SAMPLE_RATES = {
+    3: [44100, 48000, 32000],   # MPEG 1
+    2: [22050, 24000, 16000],   # MPEG 2
+    0: [11025, 12000, 8000],    # MPEG 2.5
+}
+
+SCAN_LIMIT = 256 * 1024
+HEAD_READ = 16 * 1024
+
+
+def parse_frame_header(b):
+    if len(b) < 4 or b[0] != 0xFF or (b[1] & 0xE0) != 0xE0:
+        return None
+    version = (b[1] >> 3) & 0x03
+    layer_bits = (b[1] >> 1) & 0x03
+    bitrate_idx = (b[2] >> 4) & 0x0F
+    sr_idx = (b[2] >> 2) & 0x03
+    if version == 1 or layer_bits == 0 or bitrate_idx in (0, 15) or sr_idx == 3:
+        return None
+    layer = 4 - layer_bits
+    mpeg1 = version == 3
+    bitrate = BITRATES[(1 if mpeg1 else 2, layer)][bitrate_idx]
+    sample_rate = SAMPLE_RATES[version][sr_idx]
+    padding = (b[2] >> 1) & 0x01
+    channel_mode = (b[3] >> 6) & 0x03
+
+    if layer == 1:
+        length = (12000 * bitrate // sample_rate + padding) * 4
+        samples = 384
+    elif layer == 2 or mpeg1:
+        length = 144000 * bitrate // sample_rate + padding
+        samples = 1152
+    else:
+        length = 72000 * bitrate // sample_rate + padding
+        samples = 576
+
+    return {
+        'version': version,
+        'layer': layer,
+        'bitrate': bitrate,
+        'sample_rate': sample_rate,
+        'channels': 1 if channel_mode == 3 else 2,
+        'length': length,
+        'samples': samples,
+    }
+
+
+def _id3v2_size(head):
+    if len(head) < 10 or head[:3] != b'ID3':
+        return 0
+    size = ((head[6] & 0x7F) << 21) | ((head[7] & 0x7F) << 14) | ((head[8] & 0x7F) << 7) | (head[9] & 0x7F)
+    footer = 10 if head[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _audio_end(f, file_size):
+    end = file_size
+    if file_size >= 128:
+        f.seek(file_size - 128)
+        if f.read(3) == b'TAG':
+            end -= 128
+    return end
+
+
+def _find_first_frame(f, start, end):
+    pos = start
+    limit = min(end, start + SCAN_LIMIT)
+    while pos < limit:
+        f.seek(pos)
+        buf = f.read(min(HEAD_READ, limit - pos) + 4)
+        if len(buf) < 4:
+            return None, None
+        i = buf.find(b'\xff')
+        while 0 <= i <= len(buf) - 4:
+            hdr = parse_frame_header(buf[i:i + 4])
+            if hdr:
+                frame_pos = pos + i
+                nxt = frame_pos + hdr['length']
+                if nxt + 4 > end:
+                    return frame_pos, hdr
+                f.seek(nxt)
+                hdr2 = parse_frame_header(f.read(4))
+                if (hdr2 and hdr2['version'] == hdr['version']
+                        and hdr2['layer'] == hdr['layer']
+                        and hdr2['sample_rate'] == hdr['sample_rate']):
+                    return frame_pos, hdr
+            i = buf.find(b'\xff', i + 1)
+        pos += max(1, len(buf) - 4)
+    return None, None
+
+
+def _side_info_size(hdr):
+    if hdr['version'] == 3:
+        return 17 if hdr['channels'] == 1 else 32
+    return 9 if hdr['channels'] == 1 else 17
+
+
+def _parse_xing(frame, hdr):
+    off = 4 + _side_info_size(hdr)
+    tag = frame[off:off + 4]
+    if tag not in (b'Xing', b'Info') or len(frame) < off + 8:
+        return None
+    flags = struct.unpack('>I', frame[off + 4:off + 8])[0]
+    p = off + 8
+    # a truncated file can cut the tag short; every field is checked
+    need = p + (4 if flags & 0x1 else 0) + (4 if flags & 0x2 else 0) + (100 if flags & 0x4 else 0)
+    if len(frame) < need:
+        return None
+    info = {'header': tag.decode('ascii'), 'frames': None, 'bytes': None,
+            'encoder_delay': 0, 'encoder_padding': 0}
+    if flags & 0x1:
+        info['frames'] = struct.unpack('>I', frame[p:p + 4])[0]
+        p += 4
+    if flags & 0x2:
+        info['bytes'] = struct.unpack('>I', frame[p:p + 4])[0]
+        p += 4
+    if flags & 0x4:
+        # seek TOC; pygame can't seek by byte, so it's skipped
+        p += 100
+    if flags & 0x8:
+        p += 4
+
+    # LAME extension: 9-byte encoder string, then delay/padding 21 bytes in
+    if frame[p:p + 4] in (b'LAME', b'Lavf', b'Lavc') and len(frame) >= p + 24:
+        d = frame[p + 21:p + 24]
+        info['encoder_delay'] = (d[0] << 4) | (d[1] >> 4)
+        info['encoder_padding'] = ((d[1] & 0x0F) << 8) | d[2]
+    return info
+
+
+def _parse_vbri(frame):
+    off = 4 + 32
+    if frame[off:off + 4] != b'VBRI' or len(frame) < off + 26:
+        return None
+    version, delay, quality, nbytes, nframes = struct.unpack('>HHHII', frame[off + 4:off + 18])
+    return {'header': 'VBRI', 'frames': nframes, 'bytes': nbytes,
+            'encoder_delay': delay, 'encoder_padding': 0}
+
+
+def probe_mp3(path):
+    try:
+        with open(path, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            head = f.read(10)
+            audio_start = _id3v2_size(head)
+            audio_end = _audio_end(f, file_size)
+            frame_pos, hdr = _find_first_frame(f, audio_start, audio_end)
+            if frame_pos is None:
+                return None
+            f.seek(frame_pos)
+            frame = f.read(max(hdr['length'], 256))
+    except OSError:
+        return None
+
+    sr = hdr['sample_rate']
+    spf = hdr['samples']
+    result = {
+        'duration': 0.0,
+        'bitrate': hdr['bitrate'],
+        'vbr': False,
+        'header': 'CBR',
+        'sample_rate': sr,
+        'channels': hdr['channels'],
+        'samples_per_frame': spf,
+        'audio_start': frame_pos,
+        'audio_end': audio_end,
+        'frames': 0,
+        'encoder_delay': 0,
+        'encoder_padding': 0,
+    }
+
+    vbr = _parse_xing(frame, hdr) if hdr['layer'] == 3 else None
+    if vbr is None:
+        vbr = _parse_vbri(frame)
+
+    if vbr and vbr.get('frames'):
+        frames = vbr['frames']
+        samples = frames * spf - vbr['encoder_delay'] - vbr['encoder_padding']
+        if samples <= 0:
+            samples = frames * spf
+        duration = samples / sr
+        # the tag frame itself carries no audio
+        nbytes = vbr['bytes'] or (audio_end - frame_pos - hdr['length'])
+        result.update(
+            duration=duration,
+            frames=frames,
+            header=vbr['header'],
+            vbr=vbr['header'] != 'Info',
+            encoder_delay=vbr['encoder_delay'],
+            encoder_padding=vbr['encoder_padding'],
+            audio_start=frame_pos + hdr['length'],
+        )
+        if duration > 0:
+            result['bitrate'] = int(round(nbytes * 8 / duration / 1000))
+        return result
+
+    audio_bytes = audio_end - frame_pos
+    frame_bytes = hdr['length'] or 1
+    frames = audio_bytes // frame_bytes
+    result['frames'] = frames
+    result['duration'] = audio_bytes * 8 / (hdr['bitrate'] * 1000)
+    return result
+
+
+def count_frames(path, info):
+    # exact frame count, hopping from header to header; only 4 bytes are
+    # read per frame, never the audio itself
+    count = 0
+    pos = info['audio_start']
+    end = info['audio_end'] - 4
+    with open(path, 'rb') as f:
+        while pos <= end:
+            f.seek(pos)
+            hdr = parse_frame_header(f.read(4))
+            if hdr is not None and hdr['length'] > 0:
+                count += 1
+                pos += hdr['length']
+                continue
+            # lost sync (junk or a broken frame), look for the next header
+            f.seek(pos + 1)
+            buf = f.read(HEAD_READ)
+            if not buf:
+                break
+            nxt = buf.find(b'\xff')
+            pos += 1 + (nxt if nxt >= 0 else len(buf))
+    return count
@@ -0,0 +1,73 @@
+import sys
+import time
+import signal
+import threading
+from pathlib import Path
+
+from player_engine import PlayerEngine
+from control_server import ControlServer, socket_path
+
+# Headless player: python player_daemon.py [folder]
+# Plays the given folder (or the last library) without importing tkinter.
+
+TICK_INTERVAL = 0.25
+IDLE_TICK_INTERVAL = 1.0
+
+running = True
+
+
+def stop(signum, frame):
+    global running
+    running = False
+
+
+def main():
+    engine = PlayerEngine(Path(__file__).resolve().parent)
+    if not engine.init_audio():
+        return 1
+    engine.load_stats()
+
+    engine.events.subscribe(
+        'track_started', lambda data: print("Playing:", engine.display_name(data['path']), flush=True)
+    )
+
+    if len(sys.argv) > 1:
+        engine.load_folder(sys.argv[1])
+    elif engine.restore_library():
+        if not engine.resume_session(autoplay=True):
+            engine.play_track(0)
+    else:
+        print("No library yet, pass a folder: python player_daemon.py <folder>")
+        engine.close()
+        return 1
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    scheduler = engine.scheduler
+    # control commands arrive on the server thread and wake the loop
+    wake = threading.Event()
+    engine.wake = wake.set
+    control = ControlServer(engine, socket_path(engine.data_dir))
+    if control.start():
+        print("Control socket:", control.path, flush=True)
+
+    def tick():
+        engine.tick()
+        scheduler.call_later(TICK_INTERVAL if engine.needs_fast_tick() else IDLE_TICK_INTERVAL, 'tick', tick)
+
+    tick()
+    while running:
+        wake.clear()
+        engine.run_posted()
+        scheduler.run_due()
+        due = scheduler.next_due()
+        wait = IDLE_TICK_INTERVAL if due is None else due - time.monotonic()
+        wake.wait(max(0.0, min(wait, IDLE_TICK_INTERVAL)))
+
+    control.stop()
+    engine.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
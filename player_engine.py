@@ -0,0 +1,1188 @@
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from mp3_probe import probe_mp3
+from library_index import LibraryIndex
+from folder_scanner import FolderScanner
+from stats_store import StatsStore, track_id
+from search_index import SearchIndex
+from playlist_model import Playlist
+from prefetch import Prefetcher
+from seek_table import SeekTableCache
+from scheduler import Scheduler
+from metrics import MetricsRegistry
+from tag_pipeline import TagPipeline
+from id3_tags import display_label, search_text
+from loudness import LoudnessAnalyzer, gain_db, MAX_GAIN_DB
+from waveform import PeakCache
+from smart_shuffle import SmartShuffle, listen_weight
+from session_store import SessionStore
+from playlist_io import PlaylistImporter, write_playlist
+from track_identity import IdentityPipeline
+
+# Playback, playlist and stats logic with no UI attached. Front ends (the Tk
+# window, the headless daemon) call into a PlayerEngine and subscribe to the
+# events it emits. Nothing in here imports tkinter.
+
+SCAN_EXTENSIONS = ('.mp3', '.ogg', '.wav', '.flac')
+STATS_FLUSH_INTERVAL = 2.0
+SCAN_STATUS_LINGER = 5.0
+HISTORY_LENGTH = 200
+SESSION_SAVE_DELAY = 1.0
+SESSION_SAVE_INTERVAL = 5.0
+SEARCH_REFRESH_DELAY = 0.5
+
+# imported by init_audio(); pygame is slow to import and not needed to paint
+pygame = None
+
+
+class EventBus:
+    # events: track_started, position, ended, stats_changed, state_changed,
+    # volume_changed, playlist_changed, view_changed, scan_progress,
+    # tags_changed, peaks_ready, queue_changed, duplicates_changed
+    def __init__(self):
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, event, callback):
+        with self.lock:
+            self.subscribers.setdefault(event, []).append(callback)
+        return callback
+
+    def unsubscribe(self, event, callback):
+        with self.lock:
+            callbacks = self.subscribers.get(event, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def emit(self, event, **data):
+        data['event'] = event
+        with self.lock:
+            callbacks = list(self.subscribers.get(event, ())) + list(self.subscribers.get('*', ()))
+        for callback in callbacks:
+            try:
+                callback(data)
+            except Exception as e:
+                print(f"{event} subscriber failed:", e)
+
+
+class PlayerEngine:
+    def __init__(self, data_dir, extensions=SCAN_EXTENSIONS):
+        self.events = EventBus()
+        self.data_dir = Path(data_dir)
+        self.extensions = extensions
+
+        self.playlist = Playlist()
+        self.index = 0
+        self.playing = False
+        self.paused = False
+        self.volume = 0.1
+        # per-track loudness gain on top of the user's volume
+        self.normalize = True
+        self.track_gain = 1.0
+        self.track_duration = 0
+        self.playback_offset = 0
+        self.listened = False
+        self.current_track_info = None
+        self.seeded_shuffle_enabled = False
+        self.shuffle_seed = None
+        # seed behind the current order, kept so a restart rebuilds it
+        self.order_seed = None
+        # smart shuffle draws each next track by listen/skip weight
+        self.smart_shuffle_enabled = False
+        self.smart = None
+        self.smart_next = None
+        self.history = deque(maxlen=HISTORY_LENGTH)
+        # tids picked to play next, ahead of the shuffle order
+        self.play_queue = deque()
+        # where to start the current track when it was restored, not played
+        self.resume_position = None
+        self.queued_path = None
+        self.last_transition_ms = None
+        self.last_seek_ms = None
+        # get_pos() at the last poll, to see a queued switch without end events
+        self.last_pos_ms = 0
+        self.end_event = None
+        # (path, peaks) for the track whose waveform is on screen
+        self.shown_peaks = None
+
+        self.scanner = None
+        self.tag_pipeline = None
+        self.identity_pipeline = None
+        self.importer = None
+        # tid -> first of its identical copies, for tracks that have copies,
+        # and first -> all of them
+        self.dup_of = {}
+        self.dup_groups = {}
+        # tid -> #EXTINF length from an imported playlist
+        self.listed_durations = {}
+        self.collapse_duplicates = False
+        self.scan_autoplay = False
+        self.scan_status_text = ""
+        self.search_index = SearchIndex()
+        self.search_query = ""
+
+        self.stats_file = self.data_dir / "song_stats.json"
+        self.library = LibraryIndex(self.data_dir / "library.db")
+        self.stats = StatsStore(self.stats_file)
+        self.stats_ready = threading.Event()
+        self.session = SessionStore(self.data_dir / "session.jsonl")
+        self.metrics = MetricsRegistry()
+        self.probe = self.metrics.timed('probe_ms', self._probe)
+        self.prefetcher = Prefetcher(self.probe)
+        self.seek_tables = SeekTableCache()
+        self.peaks = PeakCache(self.data_dir / "peaks")
+        self.loudness = LoudnessAnalyzer(self.library, self.peaks)
+        # timed jobs; the host loop runs whatever is due
+        self.scheduler = Scheduler()
+        # calls from other threads, run by the host loop in run_posted();
+        # the host sets wake to get prompted when one arrives
+        self.inbox = queue.SimpleQueue()
+        self.wake = None
+
+    def init_audio(self):
+        global pygame
+        # no pygame window is ever opened; the dummy driver still gives us
+        # SDL's event queue, which music end events are posted to
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        try:
+            import pygame
+            pygame.mixer.init()
+        except Exception as e:
+            print("Audio init failed:", e)
+            return False
+        try:
+            pygame.display.init()
+            self.end_event = pygame.USEREVENT + 1
+            pygame.mixer.music.set_endevent(self.end_event)
+        except Exception as e:
+            # tick() falls back to polling get_busy()
+            print("No music end events:", e)
+            self.end_event = None
+        return True
+
+    def audio_ready(self):
+        return pygame is not None and pygame.mixer.get_init() is not None
+
+    def needs_fast_tick(self):
+        # false when nothing is moving: stopped or paused, and no scan running
+        return ((self.playing and not self.paused) or self.scanner is not None or self.tag_pipeline is not None
+                or self.identity_pipeline is not None or self.importer is not None)
+
+    def _discard_end_events(self):
+        # stopping or replacing the music posts an end event too; drop it
+        if self.end_event is not None:
+            pygame.event.clear(self.end_event)
+
+    def load_stats(self):
+        # safe to call from a worker thread; lookups return zeros until done
+        try:
+            self.stats.load()
+        except Exception as e:
+            print("Stats load failed:", e)
+        finally:
+            self.stats_ready.set()
+
+    ###########################
+    # Stats
+    ###########################
+    def _stats_path(self, path):
+        # identical copies share one set of stats, kept under the first copy
+        if self.dup_of:
+            first = self.dup_of.get(self.playlist.lookup(path))
+            if first is not None:
+                return self.playlist.path(first)
+        return path
+
+    def stats_for(self, path):
+        path = self._stats_path(path)
+        return self.stats.get(track_id(path), os.path.basename(path))
+
+    def increment_stat(self, path, key):
+        stats_path = self._stats_path(path)
+        self.stats.increment(track_id(stats_path), key, os.path.basename(stats_path))
+        if self.smart is not None:
+            tid = self.playlist.lookup(path)
+            if tid is not None:
+                # the copies share the stats, so they share the weight
+                self.smart.update(self.dup_groups.get(self.dup_of.get(tid), [tid]))
+        if not self.scheduler.pending('stats_flush'):
+            self.scheduler.call_later(STATS_FLUSH_INTERVAL, 'stats_flush', self.flush_stats)
+        self.events.emit('stats_changed', path=path, key=key)
+
+    def flush_stats(self):
+        with self.metrics.time('stats_write_ms'):
+            self.stats.flush()
+
+    ###########################
+    # Library & Scanning
+    ###########################
+    def current_path(self):
+        return self.playlist[self.index] if self.playlist else None
+
+    def display_name(self, path):
+        # tag label when known, else the file name
+        tid = self.playlist.lookup(path)
+        return self.playlist.display_name(tid) if tid is not None else os.path.basename(path)
+
+    def apply_shuffle(self, order_seed=None):
+        if not self.playlist.base:
+            return
+        if self.seeded_shuffle_enabled and self.shuffle_seed is not None:
+            self.order_seed = self.shuffle_seed
+        elif order_seed is not None:
+            self.order_seed = order_seed
+        else:
+            self.order_seed = random.getrandbits(32)
+        self.playlist.shuffle(self.order_seed)
+        self.playlist.drop_from_order(self._hidden_copies())
+        self.index = 0
+        self.events.emit('playlist_changed', reset=True)
+
+    def set_shuffle(self, seeded, seed):
+        self.seeded_shuffle_enabled = seeded
+        self.shuffle_seed = seed
+        self.apply_shuffle()
+        self._reset_smart()
+        self._session_dirty()
+
+    def set_smart_shuffle(self, enabled):
+        self.smart_shuffle_enabled = enabled
+        self._reset_smart()
+        if self.playing:
+            self.prefetcher.request(self.next_track_path())
+        self._session_dirty()
+
+    def _reset_smart(self):
+        self.smart_next = None
+        if not self.smart_shuffle_enabled:
+            self.smart = None
+            return
+        seed = self.shuffle_seed if self.seeded_shuffle_enabled else None
+        self.smart = SmartShuffle(self._smart_weight, seed)
+        # weights wait for the stats file, which may still be loading
+        self.smart.build(len(self.playlist.track_dir), self.stats_ready)
+
+    def _smart_weight(self, tid):
+        if not self.playlist.alive[tid]:
+            return 0.0
+        if self.collapse_duplicates and self.dup_of.get(tid, tid) != tid:
+            return 0.0
+        return listen_weight(self.stats_for(self.playlist.path(tid)))
+
+    def load_folder(self, folder):
+        self.playlist.clear()
+        self.index = 0
+        self.play_queue.clear()
+        self.resume_position = None
+        self.order_seed = None
+        self.dup_of = {}
+        self.dup_groups = {}
+        self.listed_durations = {}
+        self.search_index = SearchIndex()
+        self._reset_smart()
+        self.events.emit('playlist_changed', reset=True)
+        self.start_scan(folder, autoplay=True)
+
+    def restore_library(self):
+        folder = self.library.last_folder()
+        if not folder:
+            return False
+        session = self.session.load()
+        self.seeded_shuffle_enabled = session.get('seeded', False)
+        self.shuffle_seed = session.get('seed')
+        self.smart_shuffle_enabled = session.get('smart', False)
+        self.collapse_duplicates = session.get('collapse', False)
+        paths = self.library.tracks_in(folder)
+        tids = self.playlist.add(paths)
+        # same sorted paths and same seed give back last run's order
+        self.apply_shuffle(session.get('order_seed'))
+        self._reset_smart()
+        threading.Thread(target=self._index_restored, args=(list(zip(tids, paths)),), daemon=True).start()
+        # pick up anything added since last run without blocking startup
+        self.start_scan(folder, only_new=True)
+        return True
+
+    def _index_restored(self, items):
+        # on a worker thread; a search restored with the session ran against
+        # a partial index, so it runs again once the index is whole
+        self.search_index.add(items)
+        self.post(self._restored_indexed)
+
+    def _restored_indexed(self):
+        if self.search_query:
+            self.search(self.search_query)
+
+    def start_scan(self, folder, autoplay=False, only_new=False):
+        if self.scanner:
+            self.scanner.cancel()
+        if self.importer:
+            self.importer.cancel()
+            self.importer = None
+        if self.tag_pipeline:
+            self.tag_pipeline.cancel()
+            self.tag_pipeline = None
+        if self.identity_pipeline:
+            self.identity_pipeline.cancel()
+            self.identity_pipeline = None
+        self.scheduler.cancel('scan_status_clear')
+        self.scan_autoplay = autoplay
+        # the scanner only probes files the index is missing or stale on
+        self.scanner = FolderScanner(folder, self.library, self.metrics.timed('probe_ms', probe_mp3),
+                                     self.extensions, only_new=only_new)
+        self.scanner.start()
+
+    def poll_scan(self):
+        s = self.scanner
+        if s is None:
+            return
+        finished = False
+        for kind, paths in s.drain():
+            if kind == 'batch':
+                self._add_scanned_tracks(paths)
+            elif kind == 'done':
+                self._finish_scan(paths)
+                self.start_tags(s.folder)
+                self.start_identity(s.folder)
+                finished = True
+            elif kind == 'cancelled':
+                finished = True
+        if finished:
+            self.scan_status_text = f"Scanned {s.scanned} files in {s.elapsed():.1f}s ({s.files_per_second():.0f} files/s)"
+            self.scanner = None
+            self.scheduler.call_later(SCAN_STATUS_LINGER, 'scan_status_clear', self._clear_scan_status)
+        else:
+            self.scan_status_text = f"Scanning: {s.scanned} files ({s.files_per_second():.0f} files/s)"
+        self.events.emit('scan_progress', text=self.scan_status_text)
+
+    def start_tags(self, folder):
+        if self.tag_pipeline:
+            self.tag_pipeline.cancel()
+        self.tag_pipeline = TagPipeline(folder, self.library)
+        self.tag_pipeline.start()
+
+    def poll_tags(self):
+        p = self.tag_pipeline
+        if p is None:
+            return
+        finished = False
+        texts = []
+        for kind, items in p.drain():
+            if kind != 'tags':
+                finished = True
+                continue
+            for path, tags in items:
+                tid = self.playlist.lookup(path)
+                if tid is None:
+                    continue
+                self.playlist.set_label(tid, display_label(tags))
+                texts.append((tid, path, search_text(tags)))
+        if texts:
+            self.search_index.set_text(texts)
+            if self.search_query:
+                self.search(self.search_query)
+            self.events.emit('tags_changed', count=len(texts))
+        if finished:
+            self.tag_pipeline = None
+            if not p.read:
+                return
+            self.scan_status_text = f"Read tags for {p.read} files in {p.elapsed():.1f}s ({p.files_per_second():.0f} files/s)"
+            self.scheduler.call_later(SCAN_STATUS_LINGER, 'scan_status_clear', self._clear_scan_status)
+        elif p.total:
+            self.scan_status_text = f"Reading tags: {p.read}/{p.total} files ({p.files_per_second():.0f} files/s)"
+        else:
+            return
+        self.events.emit('scan_progress', text=self.scan_status_text)
+
+    ###########################
+    # Duplicates
+    ###########################
+    def start_identity(self, folder):
+        if self.identity_pipeline:
+            self.identity_pipeline.cancel()
+        self.identity_pipeline = IdentityPipeline(folder, self.library)
+        self.identity_pipeline.start()
+
+    def poll_identity(self):
+        p = self.identity_pipeline
+        if p is None:
+            return
+        for kind, groups in p.drain():
+            if kind == 'groups':
+                self._set_duplicates(groups)
+            else:
+                self.identity_pipeline = None
+        if self.identity_pipeline is None and self.dup_groups and p.hashed:
+            copies = len(self.dup_of) - len(self.dup_groups)
+            self.show_status(f"Found {copies} duplicate copies of {len(self.dup_groups)} tracks")
+
+    def _set_duplicates(self, groups):
+        old_hidden = self._hidden_copies()
+        changed = set(self.dup_of)
+        dup_of = {}
+        dup_groups = {}
+        for group in groups:
+            tids = [t for t in map(self.playlist.lookup, group) if t is not None]
+            if len(tids) > 1:
+                dup_groups[tids[0]] = tids
+                for t in tids:
+                    dup_of[t] = tids[0]
+        self.dup_of = dup_of
+        self.dup_groups = dup_groups
+        self._merge_copy_stats()
+        changed.update(dup_of)
+        if self.smart is not None and changed:
+            self.smart.update(changed)
+        if old_hidden or self._hidden_copies():
+            self._reorder_copies(old_hidden)
+        self.events.emit('duplicates_changed', groups=len(dup_groups))
+
+    def _merge_copy_stats(self):
+        # counts a copy gathered before it was known to be one move onto the
+        # first copy, where the shared stats are kept
+        path = self.playlist.path
+        for first, tids in self.dup_groups.items():
+            sources = [(track_id(path(t)), os.path.basename(path(t))) for t in tids if t != first]
+            self.stats.merge(track_id(path(first)), os.path.basename(path(first)), sources)
+
+    def _hidden_copies(self):
+        if not self.collapse_duplicates:
+            return []
+        return [t for t, first in self.dup_of.items() if t != first]
+
+    def _reorder_copies(self, old_hidden):
+        # copies that are no longer hidden go back at the end of the order
+        current = self.playlist.tid_at(self.index) if self.playlist else None
+        hidden = self._hidden_copies()
+        keep = set(hidden)
+        alive = self.playlist.alive
+        self.playlist.append_in_order([t for t in old_hidden if t not in keep and alive[t]])
+        self.playlist.drop_from_order(hidden)
+        if current is not None:
+            row = self.playlist.row_of(self.dup_of[current] if current in keep else current)
+            self.index = max(row, 0)
+        if self.smart is not None:
+            self.smart.update(keep.union(old_hidden))
+        self.events.emit('playlist_changed', reset=True)
+        self.search(self.search_query)
+
+    def set_collapse_duplicates(self, enabled):
+        old_hidden = self._hidden_copies()
+        self.collapse_duplicates = enabled
+        self._reorder_copies(old_hidden)
+        self._session_dirty()
+
+    def copies(self, path):
+        # paths of the identical copies of a track, itself included
+        tids = self.dup_groups.get(self.dup_of.get(self.playlist.lookup(path)))
+        if tids is None:
+            return [path]
+        return [self.playlist.path(t) for t in tids]
+
+    def duplicate_groups(self):
+        return [[self.playlist.path(t) for t in tids] for tids in self.dup_groups.values()]
+
+    def _clear_scan_status(self):
+        self.scan_status_text = ""
+        self.events.emit('scan_progress', text="")
+
+    def show_status(self, text):
+        # one-off message in the scan status line
+        self.scan_status_text = text
+        self.events.emit('scan_progress', text=text)
+        self.scheduler.call_later(SCAN_STATUS_LINGER, 'scan_status_clear', self._clear_scan_status)
+
+    def _add_scanned_tracks(self, paths, in_order=False):
+        tids = self.playlist.add(paths)
+        if in_order:
+            # a playlist can list a track twice; only new tids are returned
+            self.search_index.add([(t, self.playlist.path(t)) for t in tids])
+            batch = self.playlist.append_in_order([self.playlist.lookup(p) for p in paths])
+        else:
+            self.search_index.add(zip(tids, paths))
+            batch = self.playlist.append_shuffled(tids)
+        if self.smart is not None:
+            self.smart.update(tids)
+
+        query = self.search_query
+        if query.startswith('~'):
+            # ranked: new matches can land anywhere, so search again once
+            # the batches stop coming
+            self.scheduler.call_later(SEARCH_REFRESH_DELAY, 'search_refresh', lambda: self.search(self.search_query))
+        elif query:
+            keys = self.search_index.keys
+            self.playlist.append_to_view([t for t in batch if query in keys[t]])
+        self.events.emit('playlist_changed', reset=False)
+
+        if self.scan_autoplay and self.playlist and not self.playing:
+            self.scan_autoplay = False
+            self.play_track(0)
+
+    ###########################
+    # Playlist files
+    ###########################
+    def import_playlist(self, path):
+        # replaces the list with the playlist's tracks, in the playlist's order
+        if self.scanner:
+            self.scanner.cancel()
+            self.scanner = None
+        if self.tag_pipeline:
+            self.tag_pipeline.cancel()
+            self.tag_pipeline = None
+        if self.identity_pipeline:
+            self.identity_pipeline.cancel()
+            self.identity_pipeline = None
+        if self.importer:
+            self.importer.cancel()
+        self.scheduler.cancel('scan_status_clear')
+        self.playlist.clear()
+        self.index = 0
+        self.dup_of = {}
+        self.dup_groups = {}
+        self.listed_durations = {}
+        self.play_queue.clear()
+        self.resume_position = None
+        self.search_index = SearchIndex()
+        self._reset_smart()
+        self.events.emit('playlist_changed', reset=True)
+        self.scan_autoplay = True
+        self.importer = PlaylistImporter(path)
+        self.importer.start()
+
+    def poll_import(self):
+        p = self.importer
+        if p is None:
+            return
+        finished = False
+        for kind, entries in p.drain():
+            if kind != 'entries':
+                finished = True
+                continue
+            self._add_scanned_tracks([path for path, _, _ in entries], in_order=True)
+            # #EXTINF titles stand in for tags until they're read, and the
+            # lengths for tracks that can't be probed
+            texts = []
+            for path, title, duration in entries:
+                tid = self.playlist.lookup(path)
+                if tid is None:
+                    continue
+                if duration and duration > 0:
+                    self.listed_durations[tid] = duration
+                if title and self.playlist.label(tid) is None:
+                    self.playlist.set_label(tid, title)
+                    texts.append((tid, path, title))
+            if texts:
+                self.search_index.set_text(texts)
+                self.events.emit('tags_changed', count=len(texts))
+        if finished:
+            self.importer = None
+            if p.cancel_event.is_set():
+                return
+            if p.error:
+                self.show_status(f"Can't read playlist: {p.error}")
+                return
+            text = f"Imported {p.found} tracks in {p.elapsed():.1f}s"
+            if p.missing:
+                text += f", {p.missing} missing"
+                for location in p.missing_entries[:10]:
+                    print("Missing:", location)
+            self.show_status(text)
+        else:
+            self.scan_status_text = f"Importing: {p.found} tracks ({p.missing} missing)"
+            self.events.emit('scan_progress', text=self.scan_status_text)
+
+    def export_playlist(self, path):
+        # writes what the list shows, in play order; paths and titles are
+        # taken here, the durations and the write on a thread that reports
+        # back through post()
+        playlist = self.playlist
+        tids = playlist.view if playlist.filtered else playlist.order
+        paths = [playlist.path(t) for t in tids]
+        names = [playlist.display_name(t) for t in tids]
+        listed = {paths[i]: self.listed_durations[t] for i, t in enumerate(tids) if t in self.listed_durations}
+
+        def entries():
+            for i in range(0, len(paths), 1000):
+                durations = self.library.durations(paths[i:i + 1000])
+                for track, name in zip(paths[i:i + 1000], names[i:i + 1000]):
+                    yield track, name, durations.get(track) or listed.get(track) or -1
+
+        def run():
+            try:
+                count = write_playlist(path, entries())
+                text = f"Exported {count} tracks to {os.path.basename(path)}"
+            except Exception as e:
+                text = f"Export failed: {e}"
+            self.post(self.show_status, text)
+        threading.Thread(target=run, daemon=True).start()
+
+    def _finish_scan(self, removed):
+        current = self.playlist.tid_at(self.index) if self.playlist else None
+        if removed:
+            gone = self.playlist.remove(removed)
+            self.search_index.remove(gone)
+            if self.smart is not None:
+                self.smart.update(gone)
+        self.playlist.sort_base()
+        # keep the order reproducible regardless of scan order: seeded, or
+        # from a recorded seed after a fresh load so a restart can rebuild it
+        reshuffle = (self.seeded_shuffle_enabled and self.shuffle_seed is not None) or self.order_seed is None
+        if reshuffle:
+            self.apply_shuffle()
+        row = self.playlist.row_of(current) if current is not None else -1
+        self.index = row if row >= 0 else 0
+        if removed or reshuffle:
+            self.search(self.search_query)
+
+    ###########################
+    # Search
+    ###########################
+    def search(self, query):
+        query = query.lower()
+        previous = self.search_query
+        self.search_query = query
+        with self.metrics.time('search_ms'):
+            if not query:
+                self.playlist.set_filter(None)
+            elif query.startswith('~'):
+                # "~query" does a ranked fuzzy match, best first
+                self.playlist.set_filter(self.search_index.fuzzy_search(query[1:]), ranked=True)
+            else:
+                # a query that only grew keeps a subset of the rows shown
+                narrow = (self.playlist.filtered and previous and previous != query
+                          and previous in query and not previous.startswith('~'))
+                self.playlist.set_filter(self.search_index.search(query), narrow=narrow)
+        self.events.emit('view_changed')
+        self._session_dirty()
+
+    def play_view_row(self, row):
+        if 0 <= row < len(self.playlist.rows):
+            self.play_track(self.playlist.row_of(self.playlist.view_tid(row)))
+
+    ###########################
+    # Playback
+    ###########################
+    def play_track(self, i, position=None):
+        if not self.playlist or not self.audio_ready():
+            return
+        started = time.perf_counter()
+        self.index = i % len(self.playlist)
+        filepath = self.playlist[self.index]
+        try:
+            pygame.mixer.music.load(filepath)
+        except Exception as e:
+            print("Failed loading:", filepath, e)
+            self.show_status(f"Can't play {os.path.basename(filepath)}")
+            return
+        self.queued_path = None
+        self.resume_position = None
+        pygame.mixer.music.play(0)
+        self._discard_end_events()
+        self.playback_offset = 0
+        self.last_pos_ms = 0
+        if position is not None:
+            try:
+                pygame.mixer.music.set_pos(position)
+                self.sync_playback_clock(position)
+            except Exception:
+                pass
+        self.playing = True
+        self.paused = False
+        self._on_track_started(filepath)
+        self.last_transition_ms = (time.perf_counter() - started) * 1000
+        self.metrics.observe('track_load_ms', self.last_transition_ms)
+
+    def _on_track_started(self, filepath):
+        self.increment_stat(filepath, 'started')
+        tid = self.playlist.lookup(filepath)
+        if tid is not None:
+            self.history.append(tid)
+            if self.smart is not None:
+                self.smart.rest(tid)
+        self.listened = False
+        ready = self.prefetcher.result(filepath)
+        self.current_track_info = ready[0] if ready else self.probe(filepath)
+        if self.current_track_info:
+            self.track_duration = self.current_track_info['duration']
+        elif tid in self.listed_durations:
+            # the length its playlist gave, rather than decoding the file
+            self.track_duration = self.listed_durations[tid]
+        else:
+            # not a parseable MP3, fall back to a full decode
+            try:
+                self.track_duration = pygame.mixer.Sound(filepath).get_length()
+            except Exception:
+                self.track_duration = 0
+        self.seek_tables.request(filepath)
+        self.track_gain = self.gain_for(filepath)
+        pygame.mixer.music.set_volume(self.output_volume())
+        self.loudness.request(filepath)
+        self.loudness.request(self.next_track_path())
+        self.events.emit('track_started', index=self.index, path=filepath, duration=self.track_duration)
+        self.events.emit('state_changed', playing=self.playing, paused=self.paused)
+        self.prefetcher.request(self.next_track_path())
+        self._session_dirty()
+
+    def toggle_play(self):
+        if not self.playlist:
+            return
+        if self.playing and not self.paused:
+            pygame.mixer.music.pause()
+            self.paused = True
+        elif self.paused:
+            pygame.mixer.music.unpause()
+            self.paused = False
+        else:
+            self.play_track(self.index, self.resume_position)
+            return
+        self.events.emit('state_changed', playing=self.playing, paused=self.paused)
+        self._session_dirty()
+
+    def play_next(self):
+        self.skip(1)
+
+    def play_prev(self):
+        self.skip(-1)
+
+    def skip(self, count):
+        # count tracks ahead, or back when negative; only the last one loads
+        if not self.playlist or not count:
+            return
+        if not self.listened:
+            self.increment_stat(self.playlist[self.index], 'skipped')
+        step = self._next_row if count > 0 else self._prev_row
+        for _ in range(abs(count)):
+            self.index = step()
+        if count < 0 and self.history and self.history[-1] == self.playlist.tid_at(self.index):
+            # play_track() puts it back on the history
+            self.history.pop()
+        self.play_track(self.index)
+
+    def _prev_row(self):
+        if self.smart is not None and len(self.history) > 1:
+            # smart order isn't a list, so go back through what was played
+            self.history.pop()
+            row = self.playlist.row_of(self.history[-1])
+            if row >= 0:
+                return row
+        return (self.index - 1) % len(self.playlist)
+
+    def stop(self):
+        if self.audio_ready():
+            pygame.mixer.music.stop()
+            self._discard_end_events()
+        self.playing = False
+        self.paused = False
+        self.queued_path = None
+        self.events.emit('state_changed', playing=False, paused=False)
+        self._session_dirty()
+
+    def set_volume(self, volume):
+        self.volume = max(0.0, min(1.0, volume))
+        if self.audio_ready():
+            pygame.mixer.music.set_volume(self.output_volume())
+        self.events.emit('volume_changed', volume=self.volume)
+        self._session_dirty()
+
+    def set_normalize(self, enabled):
+        self.normalize = enabled
+        if self.audio_ready():
+            pygame.mixer.music.set_volume(self.output_volume())
+        self._session_dirty()
+
+    def gain_for(self, path):
+        # measured loudness first, then a ReplayGain tag, else unity
+        info = self.library.get(path)
+        if not info:
+            return 1.0
+        if info.get('loudness') is not None:
+            db = gain_db(info['loudness'], info.get('peak'))
+        elif info.get('rg_track_gain') is not None:
+            db = max(-MAX_GAIN_DB, min(MAX_GAIN_DB, info['rg_track_gain']))
+        else:
+            return 1.0
+        return 10 ** (db / 20)
+
+    def peaks_for(self, path):
+        # memory-mapped waveform peaks, None until the track is analyzed;
+        # looked up once per track rather than on every redraw
+        if not path:
+            return None
+        shown = self.shown_peaks
+        if shown is None or shown[0] != path or (shown[1] is not None and shown[1].closed):
+            shown = self.shown_peaks = (path, self.peaks.get(path))
+        return shown[1]
+
+    def poll_analysis(self):
+        current = self.current_path()
+        while True:
+            try:
+                path, entry = self.loudness.done.get_nowait()
+            except queue.Empty:
+                return
+            if entry is not None:
+                self.peaks.add(*entry)
+            if path == current:
+                self.shown_peaks = None
+                self.events.emit('peaks_ready', path=path)
+
+    def output_volume(self):
+        if not self.normalize:
+            return self.volume
+        return max(0.0, min(1.0, self.volume * self.track_gain))
+
+    def _probe(self, path):
+        # duration and bitrate from the library index; a file it doesn't
+        # know, or knows an older version of, is read once and remembered
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        info = self.library.probe_info(path, st.st_size, st.st_mtime_ns)
+        if info is None:
+            info = probe_mp3(path)
+            if info is not None:
+                self.library.store_probe(path, st.st_size, st.st_mtime_ns, info)
+        return info
+
+    def estimate_bitrate(self):
+        info = self.current_track_info
+        if info and info.get('bitrate'):
+            return info['bitrate']
+        try:
+            size_bytes = os.path.getsize(self.current_path())
+            if self.track_duration > 0:
+                return int((size_bytes * 8) / self.track_duration / 1000)
+        except Exception:
+            pass
+        return 0
+
+    ###########################
+    # Play Queue
+    ###########################
+    def enqueue(self, path, play_next=False):
+        tid = self.playlist.lookup(path)
+        if tid is None:
+            return False
+        # one queue slot per song, whichever copy it's queued from
+        first = self.dup_of.get(tid)
+        if first is not None:
+            for queued in list(self.play_queue):
+                if self.dup_of.get(queued) == first:
+                    self.play_queue.remove(queued)
+        if play_next:
+            self.play_queue.appendleft(tid)
+        else:
+            self.play_queue.append(tid)
+        self._queue_changed()
+        return True
+
+    def _prune_queue(self):
+        # removed tracks stay queued until reached; drop them so indices
+        # match queued_paths()
+        alive = self.playlist.alive
+        live = [t for t in self.play_queue if alive[t]]
+        if len(live) != len(self.play_queue):
+            self.play_queue.clear()
+            self.play_queue.extend(live)
+
+    def dequeue(self, i=0):
+        self._prune_queue()
+        if not 0 <= i < len(self.play_queue):
+            return None
+        tid = self.play_queue[i]
+        del self.play_queue[i]
+        self._queue_changed()
+        return self.playlist.path(tid)
+
+    def move_queued(self, src, dst):
+        self._prune_queue()
+        q = self.play_queue
+        if not (0 <= src < len(q) and 0 <= dst < len(q)):
+            return False
+        tid = q[src]
+        del q[src]
+        q.insert(dst, tid)
+        self._queue_changed()
+        return True
+
+    def clear_queue(self):
+        self.play_queue.clear()
+        self._queue_changed()
+
+    def queued_paths(self):
+        return [self.playlist.path(t) for t in self.play_queue if self.playlist.alive[t]]
+
+    def _queue_changed(self):
+        nxt = self.next_track_path()
+        if self.queued_path and self.queued_path != nxt:
+            # the mixer holds one queued file; queueing again replaces it
+            try:
+                pygame.mixer.music.queue(nxt)
+                self.queued_path = nxt
+            except Exception:
+                self.queued_path = None
+        if self.playing:
+            self.prefetcher.request(nxt)
+        self.events.emit('queue_changed', size=len(self.play_queue))
+        self._session_dirty()
+
+    ###########################
+    # Session
+    ###########################
+    def resume_session(self, autoplay=False):
+        # after restore_library(): last run's settings, queue, search and
+        # track, started at the saved position if it was playing
+        s = self.session.state
+        if 'volume' in s:
+            self.volume = max(0.0, min(1.0, s['volume']))
+            self.events.emit('volume_changed', volume=self.volume)
+        self.normalize = s.get('normalize', self.normalize)
+        for path in s.get('queue', ()):
+            tid = self.playlist.lookup(path)
+            if tid is not None:
+                self.play_queue.append(tid)
+        if self.play_queue:
+            self.events.emit('queue_changed', size=len(self.play_queue))
+        if s.get('search'):
+            self.search(s['search'])
+        tid = self.playlist.lookup(s['track']) if s.get('track') else None
+        if tid is None or self.playlist.row_of(tid) < 0:
+            return False
+        self.index = self.playlist.row_of(tid)
+        self.resume_position = s.get('position') or None
+        if autoplay or s.get('playing'):
+            self.play_track(self.index, self.resume_position)
+        else:
+            self.events.emit('playlist_changed', reset=True)
+        return True
+
+    def save_session(self):
+        playing = self.playing and not self.paused
+        if self.playing:
+            position = self.playback_position()
+        else:
+            position = self.resume_position or 0.0
+        self.session.update({
+            'track': self.current_path(),
+            'position': round(position, 1),
+            'playing': playing,
+            'volume': round(self.volume, 3),
+            'normalize': self.normalize,
+            'seeded': self.seeded_shuffle_enabled,
+            'seed': self.shuffle_seed,
+            'order_seed': self.order_seed,
+            'smart': self.smart_shuffle_enabled,
+            'collapse': self.collapse_duplicates,
+            'search': self.search_query,
+            'queue': self.queued_paths(),
+        })
+        if playing:
+            # keep the saved position fresh while the track plays
+            self.scheduler.call_later(SESSION_SAVE_INTERVAL, 'session_save', self.save_session)
+
+    def _session_dirty(self):
+        if not self.scheduler.pending('session_save'):
+            self.scheduler.call_later(SESSION_SAVE_DELAY, 'session_save', self.save_session)
+
+    ###########################
+    # Prefetch & Gapless
+    ###########################
+    def next_track_path(self):
+        if not self.playlist:
+            return None
+        q = self.play_queue
+        while q and not self.playlist.alive[q[0]]:
+            q.popleft()
+        if q:
+            return self.playlist.path(q[0])
+        if self.smart is not None:
+            # drawn once and kept, so prefetch and the gapless queue agree
+            # with what play_next() will pick
+            nxt = self.smart_next
+            if nxt is None or not self.playlist.alive[nxt]:
+                nxt = self.smart_next = self.smart.draw()
+            if nxt is not None:
+                return self.playlist.path(nxt)
+        # sequential until the smart weights are built
+        return self.playlist[(self.index + 1) % len(self.playlist)]
+
+    def _next_row(self):
+        path = self.next_track_path()
+        self._take_next(path)
+        tid = self.playlist.lookup(path)
+        row = self.playlist.row_of(tid) if tid is not None else -1
+        return row if row >= 0 else (self.index + 1) % len(self.playlist)
+
+    def _take_next(self, path):
+        # the next track is starting: off the play queue, or a fresh draw
+        q = self.play_queue
+        if q and self.playlist.path(q[0]) == path:
+            q.popleft()
+            self.events.emit('queue_changed', size=len(q))
+        else:
+            self.smart_next = None
+
+    def _queue_next_track(self):
+        # hand the warmed next track to the mixer so it starts without a gap
+        if self.queued_path or not self.playing or not self.playlist:
+            return
+        path = self.next_track_path()
+        if path is None or self.prefetcher.result(path) is None:
+            return
+        try:
+            pygame.mixer.music.queue(path)
+            self.queued_path = path
+        except Exception as e:
+            print("Queue failed:", path, e)
+
+    def _advance_to_queued(self):
+        # the mixer already switched to the queued file; catch our state up
+        started = time.perf_counter()
+        path = self.queued_path
+        self.queued_path = None
+        self._take_next(path)
+        # get_pos() starts again from 0 when the mixer moves to the queued file
+        self.playback_offset = 0
+        tid = self.playlist.lookup(path)
+        row = self.playlist.row_of(tid) if tid is not None else -1
+        self.index = row if row >= 0 else (self.index + 1) % len(self.playlist)
+        self._on_track_started(path)
+        self.last_transition_ms = (time.perf_counter() - started) * 1000
+        self.metrics.observe('gapless_switch_ms', self.last_transition_ms)
+
+    ###########################
+    # Seeking & Clock
+    ###########################
+    def playback_position(self):
+        if not self.audio_ready():
+            return 0.0
+        pos_ms = pygame.mixer.music.get_pos()
+        return (pos_ms / 1000.0 if pos_ms >= 0 else 0.0) + self.playback_offset
+
+    def sync_playback_clock(self, position):
+        # get_pos() counts from play() and ignores set_pos(), so re-anchor on it
+        pos_ms = pygame.mixer.music.get_pos()
+        self.playback_offset = position - (pos_ms / 1000.0 if pos_ms >= 0 else 0.0)
+
+    def seek_to(self, position):
+        if not (self.playing and self.playlist):
+            return
+        started = time.perf_counter()
+        filepath = self.playlist[self.index]
+        table = self.seek_tables.get(filepath)
+        if table:
+            position = table.snap(position)
+        try:
+            # rewind first so set_pos is absolute on every SDL_mixer version
+            pygame.mixer.music.rewind()
+            pygame.mixer.music.set_pos(position)
+        except Exception:
+            # no in-stream seeking for this format, reload at the position
+            try:
+                pygame.mixer.music.load(filepath)
+                pygame.mixer.music.play(start=position)
+                pygame.mixer.music.set_volume(self.output_volume())
+                self.queued_path = None
+                self.last_pos_ms = 0
+                self._discard_end_events()
+            except Exception as e:
+                print("Seek failed:", e)
+                return
+            if self.paused:
+                pygame.mixer.music.pause()
+        self.sync_playback_clock(position)
+        self.last_seek_ms = (time.perf_counter() - started) * 1000
+        self.metrics.observe('seek_ms', self.last_seek_ms)
+
+    ###########################
+    # Tick
+    ###########################
+    def post(self, fn, *args):
+        # safe from any thread; the engine itself is only touched by the host
+        self.inbox.put((fn, args))
+        wake = self.wake
+        if wake is not None:
+            wake()
+
+    def run_posted(self):
+        while True:
+            try:
+                fn, args = self.inbox.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                fn(*args)
+            except Exception as e:
+                print("Posted call failed:", e)
+
+    def tick(self):
+        # drive from the host loop (Tk after() or the daemon loop)
+        self.run_posted()
+        self.poll_scan()
+        self.poll_import()
+        self.poll_tags()
+        self.poll_identity()
+        self.poll_analysis()
+        if self.playing and self.playlist:
+            if self.end_event is not None:
+                # one event per finished track, including the switch to a
+                # queued one
+                for _ in pygame.event.get(self.end_event):
+                    if self.playing:
+                        self._track_ended()
+            elif not self.paused and self._polled_end():
+                self._track_ended()
+        if self.playing and not self.paused and self.playlist:
+            table = self.seek_tables.get(self.playlist[self.index])
+            if table and table.exact() and table.duration > 0:
+                # frame count from the table beats the header estimate
+                self.track_duration = table.duration
+            self.events.emit('position', position=self.playback_position(), duration=self.track_duration)
+            self._queue_next_track()
+
+    def _polled_end(self):
+        # without end events: a queued switch shows up as get_pos() starting
+        # over, otherwise the mixer going idle is the end of the track
+        pos_ms = pygame.mixer.music.get_pos()
+        switched = pos_ms < self.last_pos_ms
+        self.last_pos_ms = pos_ms
+        if self.queued_path:
+            return switched
+        return not pygame.mixer.music.get_busy()
+
+    def _track_ended(self):
+        path = self.playlist[self.index]
+        if not self.listened:
+            self.increment_stat(path, 'listened')
+            self.listened = True
+        self.events.emit('ended', path=path)
+        if self.queued_path:
+            self._advance_to_queued()
+        else:
+            self.play_next()
+
+    def close(self):
+        # before the mixer stops, while the position is still readable
+        self.save_session()
+        if self.scanner:
+            self.scanner.cancel()
+        if self.tag_pipeline:
+            self.tag_pipeline.cancel()
+        if self.identity_pipeline:
+            self.identity_pipeline.cancel()
+        if self.importer:
+            self.importer.cancel()
+        if self.audio_ready():
+            pygame.mixer.music.stop()
+        self.prefetcher.stop()
+        self.seek_tables.stop()
+        self.loudness.stop()
+        self.session.close()
+        self.stats.close()
+        self.library.close()
@@ -0,0 +1,224 @@
+import os
+from urllib.parse import unquote, urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+from background_worker import BackgroundWorker
+
+# M3U/M3U8 and PLS playlists. Reading streams the file a line at a time and
+# resolves entries in batches, with the existence checks on a thread pool
+# (slow on network shares), so a huge playlist is never in memory whole.
+# Missing entries are counted and reported rather than added. Writing
+# streams too, with paths relative to the playlist where possible so it
+# still works when the music folder is copied to another machine.
+
+PLAYLIST_EXTENSIONS = ('.m3u', '.m3u8', '.pls')
+BATCH_SIZE = 1000
+CHECK_WORKERS = 8
+MISSING_KEPT = 1000
+
+
+###########################
+# Reading
+###########################
+
+def _lines(path):
+    # M3U8 is UTF-8; plain M3U is often in the Windows codepage
+    with open(path, 'rb') as f:
+        for raw in f:
+            try:
+                line = raw.decode('utf-8')
+            except UnicodeDecodeError:
+                line = raw.decode('cp1252', 'replace')
+            yield line.lstrip('\ufeff').strip()
+
+
+def iter_m3u(path):
+    # (location, title, duration); title None and duration -1 when unknown
+    title, duration = None, -1
+    for line in _lines(path):
+        if not line:
+            continue
+        if line.startswith('#'):
+            if line[:8].upper() == '#EXTINF:':
+                # "#EXTINF:215,Artist - Title", possibly with attributes
+                # between the duration and the comma
+                info, _, text = line[8:].partition(',')
+                try:
+                    duration = int(float(info.split()[0]))
+                except (ValueError, IndexError):
+                    duration = -1
+                title = text.strip() or None
+            continue
+        yield line, title, duration
+        title, duration = None, -1
+
+
+def _pls_key(key):
+    key = key.strip().lower()
+    for field in ('file', 'title', 'length'):
+        number = key[len(field):]
+        if key.startswith(field) and number.isdigit():
+            return field, int(number)
+    return None, None
+
+
+def iter_pls(path):
+    # entries are numbered; they normally come grouped and in order, so an
+    # entry is complete once a File line with a higher number shows up
+    entries = {}
+    current = 0
+
+    def finished(below):
+        for n in sorted(k for k in entries if k < below):
+            entry = entries.pop(n)
+            if entry.get('file'):
+                yield entry['file'], entry.get('title'), entry.get('length') or -1
+
+    for line in _lines(path):
+        key, sep, value = line.partition('=')
+        field, n = _pls_key(key) if sep else (None, None)
+        if field is None:
+            continue
+        if field == 'file' and n > current:
+            yield from finished(n)
+            current = n
+        value = value.strip()
+        if field == 'length':
+            try:
+                value = int(value)
+            except ValueError:
+                value = -1
+        entries.setdefault(n, {})[field] = value or None
+    yield from finished(float('inf'))
+
+
+def iter_entries(path):
+    if path.lower().endswith('.pls'):
+        return iter_pls(path)
+    return iter_m3u(path)
+
+
+def resolve_location(location, base_dir):
+    # absolute local path, or None for something we can't play (streams)
+    if '://' in location:
+        parsed = urlparse(location)
+        if parsed.scheme != 'file':
+            return None
+        location = unquote(parsed.path)
+        if os.name == 'nt' and location[:1] == '/' and location[2:3] == ':':
+            location = location[1:]
+    if os.sep == '/':
+        # playlists written on Windows
+        location = location.replace('\\', '/')
+    if not os.path.isabs(location):
+        location = os.path.join(base_dir, location)
+    return os.path.normpath(location)
+
+
+def _exists(resolved):
+    return [path is not None and os.path.isfile(path) for path, _, _, _ in resolved]
+
+
+class PlaylistImporter(BackgroundWorker):
+    # sends ('entries', [(path, title, duration)]) as batches check out
+    def __init__(self, path, workers=CHECK_WORKERS):
+        super().__init__()
+        self.path = os.path.abspath(path)
+        self.workers = workers
+        self.read = 0
+        self.found = 0
+        self.missing = 0
+        self.missing_entries = []
+        self.error = None
+
+    def _check(self, pool, batch):
+        base_dir = os.path.dirname(self.path)
+        resolved = [(resolve_location(loc, base_dir), loc, title, duration) for loc, title, duration in batch]
+        # one slice per worker; a future per entry costs more than a local stat
+        step = -(-len(resolved) // self.workers)
+        slices = pool.map(_exists, [resolved[i:i + step] for i in range(0, len(resolved), step)])
+        exists = [ok for part in slices for ok in part]
+        found = []
+        for (path, location, title, duration), ok in zip(resolved, exists):
+            if ok:
+                found.append((path, title, duration))
+            else:
+                self.missing += 1
+                if len(self.missing_entries) < MISSING_KEPT:
+                    self.missing_entries.append(location)
+        self.read += len(batch)
+        self.found += len(found)
+        if found:
+            self.queue.put(('entries', found))
+
+    def _run(self):
+        batch = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='playlist') as pool:
+                for entry in iter_entries(self.path):
+                    if self.cancel_event.is_set():
+                        break
+                    batch.append(entry)
+                    if len(batch) >= BATCH_SIZE:
+                        self._check(pool, batch)
+                        batch = []
+                if batch and not self.cancel_event.is_set():
+                    self._check(pool, batch)
+        except OSError as e:
+            self.error = e
+        self._finish()
+
+
+###########################
+# Writing
+###########################
+
+def _location(path, base_dir):
+    try:
+        rel = os.path.relpath(path, base_dir)
+    except ValueError:
+        # another drive on Windows
+        return path
+    return path if rel.startswith('..') else rel
+
+
+def _clean(text):
+    return (text or '').replace('\r', ' ').replace('\n', ' ')
+
+
+def write_playlist(path, entries):
+    # entries: iterable of (path, title, duration); returns the count
+    path = os.path.abspath(path)
+    base_dir = os.path.dirname(path)
+    tmp = path + '.tmp'
+    try:
+        count = _write_entries(tmp, base_dir, path.lower().endswith('.pls'), entries)
+        os.replace(tmp, path)
+    except Exception:
+        # a half-written playlist is no use to anyone
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return count
+
+
+def _write_entries(tmp, base_dir, pls, entries):
+    count = 0
+    with open(tmp, 'w', encoding='utf-8', newline='\n') as f:
+        if pls:
+            f.write('[playlist]\n')
+            for track, title, duration in entries:
+                count += 1
+                f.write(f"File{count}={_location(track, base_dir)}\n")
+                f.write(f"Title{count}={_clean(title)}\n")
+                f.write(f"Length{count}={int(duration) if duration and duration > 0 else -1}\n")
+            f.write(f"NumberOfEntries={count}\nVersion=2\n")
+        else:
+            f.write('#EXTM3U\n')
+            for track, title, duration in entries:
+                count += 1
+                f.write(f"#EXTINF:{int(duration) if duration and duration > 0 else -1},{_clean(title)}\n")
+                f.write(_location(track, base_dir) + '\n')
+    return count
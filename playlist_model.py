@@ -0,0 +1,302 @@
+import os
+import sys
+import random
+from array import array
+from itertools import compress
+
+# Compact playlist storage. Every path is stored once, as an interned directory
+# id plus its UTF-8 file name in a shared byte buffer. The play order and the
+# filtered view are arrays of track ids; the order has a reverse position
+# map, so path -> row and row -> path are both O(1).
+
+
+class PlaylistRows:
+    # sequence of paths in the current (filtered) view, for the list widget
+    def __init__(self, playlist):
+        self.playlist = playlist
+
+    def __len__(self):
+        return self.playlist.view_len()
+
+    def __getitem__(self, row):
+        return self.playlist.path(self.playlist.view_tid(row))
+
+
+class Playlist:
+    def __init__(self):
+        self.dirs = []
+        self.dir_ids = {}
+        self.track_dir = array('I')
+        self.name_data = bytearray()
+        self.name_off = array('Q', [0])
+        # display labels from tags ("Artist - Title"), -1 when there are none
+        self.label_data = bytearray()
+        self.label_off = array('q')
+        self.label_len = array('I')
+        self.hashes = array('q')
+        self.table = array('i', [-1]) * 1024
+        self.alive = bytearray()
+        self.base = array('I')
+        self.order = array('I')
+        self.order_pos = array('i')
+        self.view = array('I')
+        self.filtered = False
+        self.rows = PlaylistRows(self)
+
+    ###########################
+    # Track table
+    ###########################
+    def _intern_dir(self, d):
+        i = self.dir_ids.get(d)
+        if i is None:
+            i = self.dir_ids[d] = len(self.dirs)
+            self.dirs.append(d)
+        return i
+
+    def name(self, tid):
+        off = self.name_off
+        return self.name_data[off[tid]:off[tid + 1]].decode('utf-8', 'surrogateescape')
+
+    def path(self, tid):
+        return os.path.join(self.dirs[self.track_dir[tid]], self.name(tid))
+
+    def label(self, tid):
+        off = self.label_off[tid]
+        if off < 0:
+            return None
+        return self.label_data[off:off + self.label_len[tid]].decode('utf-8', 'surrogateescape')
+
+    def set_label(self, tid, text):
+        if text is None:
+            self.label_off[tid] = -1
+            return
+        if text == self.label(tid):
+            return
+        data = text.encode('utf-8', 'surrogateescape')
+        self.label_off[tid] = len(self.label_data)
+        self.label_len[tid] = len(data)
+        self.label_data += data
+
+    def display_name(self, tid):
+        label = self.label(tid)
+        return label if label is not None else self.name(tid)
+
+    def _find(self, dir_id, name, h):
+        # open addressing over self.table; returns (slot, tid or None)
+        table = self.table
+        mask = len(table) - 1
+        slot = h & mask
+        while True:
+            tid = table[slot]
+            if tid < 0:
+                return slot, None
+            if self.hashes[tid] == h and self.track_dir[tid] == dir_id and self.name(tid) == name:
+                return slot, tid
+            slot = (slot + 1) & mask
+
+    def _grow(self):
+        size = len(self.table) * 2
+        table = array('i', [-1]) * size
+        mask = size - 1
+        for tid, h in enumerate(self.hashes):
+            slot = h & mask
+            while table[slot] >= 0:
+                slot = (slot + 1) & mask
+            table[slot] = tid
+        self.table = table
+
+    def lookup(self, path):
+        d, name = os.path.split(path)
+        dir_id = self.dir_ids.get(d)
+        if dir_id is None:
+            return None
+        _, tid = self._find(dir_id, name, hash((dir_id, name)))
+        if tid is None or not self.alive[tid]:
+            return None
+        return tid
+
+    def add(self, paths):
+        new = []
+        for path in paths:
+            d, name = os.path.split(path)
+            dir_id = self._intern_dir(d)
+            h = hash((dir_id, name))
+            slot, existing = self._find(dir_id, name, h)
+            if existing is not None:
+                if not self.alive[existing]:
+                    self.alive[existing] = 1
+                    self.base.append(existing)
+                    new.append(existing)
+                continue
+
+            tid = len(self.track_dir)
+            self.name_data += name.encode('utf-8', 'surrogateescape')
+            self.name_off.append(len(self.name_data))
+            self.track_dir.append(dir_id)
+            self.label_off.append(-1)
+            self.label_len.append(0)
+            self.hashes.append(h)
+            self.alive.append(1)
+            self.order_pos.append(-1)
+            self.base.append(tid)
+            self.table[slot] = tid
+            if len(self.hashes) * 2 > len(self.table):
+                self._grow()
+            new.append(tid)
+        return new
+
+    def remove(self, paths):
+        gone = []
+        for path in paths:
+            tid = self.lookup(path)
+            if tid is not None:
+                self.alive[tid] = 0
+                gone.append(tid)
+        if gone:
+            alive = self.alive
+            self.base = array('I', (t for t in self.base if alive[t]))
+            self.order = array('I', (t for t in self.order if alive[t]))
+            for t in gone:
+                self.order_pos[t] = -1
+            self._rebuild_order_pos()
+            if self.filtered:
+                self.set_filter([t for t in self.view if alive[t]])
+        return gone
+
+    def sort_base(self):
+        self.base = array('I', sorted(self.base, key=self.path))
+
+    def clear(self):
+        self.__init__()
+
+    ###########################
+    # Play order
+    ###########################
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, row):
+        return self.path(self.order[row])
+
+    def tid_at(self, row):
+        return self.order[row]
+
+    def row_of(self, tid):
+        return self.order_pos[tid]
+
+    def shuffle(self, seed=None):
+        ids = list(self.base)
+        if seed is not None:
+            random.Random(seed).shuffle(ids)
+        else:
+            random.shuffle(ids)
+        self.order = array('I', ids)
+        self._rebuild_order_pos()
+        self.set_filter(None)
+
+    def append_shuffled(self, tids):
+        batch = list(tids)
+        random.shuffle(batch)
+        return self.append_in_order(batch)
+
+    def append_in_order(self, tids):
+        # tracks already in the order are left where they are
+        pos = self.order_pos
+        row = len(self.order)
+        batch = []
+        for tid in tids:
+            if pos[tid] < 0:
+                pos[tid] = row
+                row += 1
+                batch.append(tid)
+        self.order.extend(batch)
+        return batch
+
+    def drop_from_order(self, tids):
+        # out of the play order but still in the library, like a removed
+        # track that could come back
+        drop = {t for t in tids if self.order_pos[t] >= 0}
+        if not drop:
+            return
+        self.order = array('I', (t for t in self.order if t not in drop))
+        for t in drop:
+            self.order_pos[t] = -1
+        self._rebuild_order_pos()
+        if self.filtered:
+            self.set_filter([t for t in self.view if t not in drop])
+
+    def _rebuild_order_pos(self):
+        pos = self.order_pos
+        for row, tid in enumerate(self.order):
+            pos[tid] = row
+
+    ###########################
+    # Filtered view
+    ###########################
+    def view_len(self):
+        return len(self.view) if self.filtered else len(self.order)
+
+    def view_tid(self, row):
+        return self.view[row] if self.filtered else self.order[row]
+
+    def view_row(self, tid):
+        # only asked for the current track; a scan of the view is cheaper
+        # than keeping a position table up to date on every keystroke
+        if not self.filtered:
+            return self.order_pos[tid]
+        try:
+            return self.view.index(tid)
+        except ValueError:
+            return -1
+
+    def set_filter(self, tids, ranked=False, narrow=False):
+        # narrow: tids are a subset of the current view (the query grew), so
+        # only the rows already shown need checking
+        if tids is None:
+            self.view = array('I')
+            self.filtered = False
+            return
+        order_pos = self.order_pos
+        if ranked:
+            view = array('I', (t for t in tids if order_pos[t] >= 0))
+        elif len(tids) * 16 < len(self.order):
+            view = array('I', sorted((t for t in tids if order_pos[t] >= 0), key=order_pos.__getitem__))
+        else:
+            # many matches: one pass over the rows in play order beats
+            # sorting them
+            mark = bytearray(len(order_pos))
+            for t in tids:
+                mark[t] = 1
+            rows = self.view if narrow and self.filtered else self.order
+            view = array('I', compress(rows, map(mark.__getitem__, rows)))
+        self.view = view
+        self.filtered = True
+
+    def append_to_view(self, tids):
+        if self.filtered:
+            self.view.extend(tids)
+
+    ###########################
+    # Introspection
+    ###########################
+    def memory_usage(self):
+        parts = (self.track_dir, self.name_data, self.name_off, self.label_data, self.label_off, self.label_len, self.hashes, self.table, self.alive,
+                 self.base, self.order, self.order_pos, self.view)
+        total = sum(sys.getsizeof(a) for a in parts)
+        total += sys.getsizeof(self.dirs) + sum(sys.getsizeof(d) for d in self.dirs)
+        total += sys.getsizeof(self.dir_ids)
+        return total
+
+
+if __name__ == '__main__':
+    # python playlist_model.py [count] -- memory report for a synthetic library
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    paths = [os.path.join('/music', f'artist{i % 5000:04d}', f'album{i % 7}', f'{i:07d} - track title.mp3')
+             for i in range(count)]
+    flat = sys.getsizeof(paths) + sum(sys.getsizeof(p) for p in paths)
+    p = Playlist()
+    p.add(paths)
+    p.shuffle(seed='bench')
+    del paths
+    print(f"{count} tracks: Playlist {p.memory_usage() / 2**20:.1f} MB "
+          f"(plain list of path strings: {flat / 2**20:.1f} MB)")
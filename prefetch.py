@@ -0,0 +1,63 @@
+import queue
+import threading
+import time
+
+# Warms the next track on a worker thread: pulls the file into the OS page
+# cache and probes its duration, so the switch itself never waits on disk.
+
+READ_CHUNK = 1024 * 1024
+READ_LIMIT = 64 * 1024 * 1024
+
+
+class Prefetcher:
+    def __init__(self, probe):
+        self.probe = probe
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()
+        self.ready = {}
+        self.wanted = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def request(self, path):
+        with self.lock:
+            if path == self.wanted:
+                return
+            self.wanted = path
+            # only the most recent request matters
+            self.ready = {p: v for p, v in self.ready.items() if p == path}
+        self.requests.put(path)
+
+    def result(self, path):
+        # (info, seconds spent warming) once ready, else None
+        with self.lock:
+            return self.ready.get(path)
+
+    def stop(self):
+        self.requests.put(None)
+
+    def _run(self):
+        while True:
+            path = self.requests.get()
+            if path is None:
+                return
+            with self.lock:
+                if path != self.wanted or path in self.ready:
+                    continue
+            started = time.perf_counter()
+            try:
+                with open(path, 'rb', buffering=0) as f:
+                    read = 0
+                    while read < READ_LIMIT:
+                        chunk = f.read(READ_CHUNK)
+                        if not chunk:
+                            break
+                        read += len(chunk)
+                        if path != self.wanted:
+                            break
+            except OSError:
+                continue
+            info = self.probe(path)
+            with self.lock:
+                if path == self.wanted:
+                    self.ready[path] = (info, time.perf_counter() - started)
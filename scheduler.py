@@ -0,0 +1,102 @@
+import heapq
+import itertools
+import threading
+import time
+
+# One timer queue for every timed job in the player (ticks, stats flushes,
+# auto-volume, status resets, debug refresh). Jobs are named; scheduling a
+# name that is already pending replaces it. The host loop runs due jobs and
+# sleeps until next_due(): Tk arms a single after() for it, the daemon
+# sleeps on it. No threads are involved.
+
+
+class Job:
+    __slots__ = ('due', 'name', 'callback', 'interval', 'cancelled')
+
+    def __init__(self, due, name, callback, interval):
+        self.due = due
+        self.name = name
+        self.callback = callback
+        self.interval = interval
+        self.cancelled = False
+
+
+class Scheduler:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.lock = threading.RLock()
+        self.heap = []
+        self.jobs = {}
+        self.counter = itertools.count()
+        self.running = False
+        # called when the earliest deadline moves forward, so the host loop
+        # can wake up sooner than it planned to
+        self.on_change = None
+
+    def call_later(self, delay, name, callback, interval=None):
+        with self.lock:
+            old = self.jobs.get(name)
+            if old is not None:
+                old.cancelled = True
+            job = Job(self.clock() + max(0.0, delay), name, callback, interval)
+            self.jobs[name] = job
+            head = self.heap[0][0] if self.heap else None
+            heapq.heappush(self.heap, (job.due, next(self.counter), job))
+            changed = head is None or job.due < head
+        if changed and not self.running and self.on_change:
+            self.on_change()
+        return job
+
+    def every(self, interval, name, callback):
+        return self.call_later(interval, name, callback, interval)
+
+    def cancel(self, name):
+        with self.lock:
+            job = self.jobs.pop(name, None)
+            if job is not None:
+                job.cancelled = True
+            return job is not None
+
+    def pending(self, name):
+        with self.lock:
+            return name in self.jobs
+
+    def due_in(self, name):
+        # seconds until the named job fires, None if it isn't scheduled
+        with self.lock:
+            job = self.jobs.get(name)
+            return None if job is None else max(0.0, job.due - self.clock())
+
+    def snapshot(self):
+        # (name, seconds until due) for every pending job, soonest first
+        with self.lock:
+            now = self.clock()
+            return sorted(((j.name, max(0.0, j.due - now)) for j in self.jobs.values()),
+                          key=lambda item: item[1])
+
+    def next_due(self):
+        with self.lock:
+            while self.heap and self.heap[0][2].cancelled:
+                heapq.heappop(self.heap)
+            return self.heap[0][0] if self.heap else None
+
+    def run_due(self):
+        self.running = True
+        try:
+            while True:
+                with self.lock:
+                    due = self.next_due()
+                    if due is None or due > self.clock():
+                        return
+                    job = heapq.heappop(self.heap)[2]
+                    if job.interval is not None:
+                        job.due = max(job.due + job.interval, self.clock())
+                        heapq.heappush(self.heap, (job.due, next(self.counter), job))
+                    else:
+                        del self.jobs[job.name]
+                try:
+                    job.callback()
+                except Exception as e:
+                    print("Scheduled job failed:", job.name, e)
+        finally:
+            self.running = False
@@ -0,0 +1,208 @@
+import os
+import re
+import heapq
+import threading
+from array import array
+from collections import OrderedDict
+from itertools import islice
+
+# Substring search over track names backed by a trigram inverted index.
+# Tracks are indexed by their Playlist track id, which never changes when the
+# playlist is reordered.
+
+CACHE_SIZE = 64
+# the lock is let go between chunks so a search can get in while a big
+# library is being indexed
+LOCK_CHUNK = 2000
+
+
+def search_key(path):
+    return os.path.basename(path).lower()
+
+
+def trigrams(key):
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+
+def fuzzy_score(query, key):
+    # subsequence match; lower is better, None if no match
+    pos = 0
+    gaps = 0
+    first = -1
+    for ch in query:
+        found = key.find(ch, pos)
+        if found < 0:
+            return None
+        if first < 0:
+            first = found
+        gaps += found - pos
+        pos = found + 1
+    return gaps + first
+
+
+class SearchIndex:
+    def __init__(self):
+        self.keys = []
+        self.dead = set()
+        self.postings = {}
+        # tag text that arrived before its track was added
+        self.pending_text = {}
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.last_query = None
+        self.last_result = None
+        # (query, every matching id) from the last fuzzy search
+        self.last_fuzzy = None
+
+    def __len__(self):
+        return sum(1 for k in self.keys if k is not None) - len(self.dead)
+
+    def add(self, items):
+        # items: iterable of (track id, path)
+        items = iter(items)
+        while True:
+            chunk = list(islice(items, LOCK_CHUNK))
+            if not chunk:
+                return
+            self._add_chunk(chunk)
+
+    def _add_chunk(self, items):
+        with self.lock:
+            keys = self.keys
+            for i, path in items:
+                if i < len(keys) and keys[i] is not None:
+                    self.dead.discard(i)
+                    continue
+                if i >= len(keys):
+                    keys.extend([None] * (i + 1 - len(keys)))
+                key = search_key(path)
+                text = self.pending_text.pop(i, None)
+                if text:
+                    key = f"{key} {text.lower()}"
+                keys[i] = key
+                for tri in trigrams(key):
+                    post = self.postings.get(tri)
+                    if post is None:
+                        post = self.postings[tri] = array('I')
+                    post.append(i)
+            self._invalidate()
+
+    def set_text(self, items):
+        # items: iterable of (track id, path, extra text such as tags).
+        # Old postings are left in place: every hit is checked against the
+        # key anyway, so only the new trigrams need adding.
+        items = iter(items)
+        while True:
+            chunk = list(islice(items, LOCK_CHUNK))
+            if not chunk:
+                return
+            self._set_text_chunk(chunk)
+
+    def _set_text_chunk(self, items):
+        with self.lock:
+            keys = self.keys
+            for i, path, text in items:
+                if i >= len(keys) or keys[i] is None:
+                    self.pending_text[i] = text
+                    continue
+                key = search_key(path)
+                if text:
+                    key = f"{key} {text.lower()}"
+                old = keys[i]
+                if key == old:
+                    continue
+                keys[i] = key
+                for tri in trigrams(key) - trigrams(old):
+                    post = self.postings.get(tri)
+                    if post is None:
+                        post = self.postings[tri] = array('I')
+                    post.append(i)
+            self._invalidate()
+
+    def remove(self, ids):
+        with self.lock:
+            self.dead.update(ids)
+            self._invalidate()
+
+    def _invalidate(self):
+        self.cache.clear()
+        self.last_query = None
+        self.last_result = None
+        self.last_fuzzy = None
+
+    def search(self, query):
+        # returns matching track ids in ascending order
+        query = query.lower()
+        with self.lock:
+            if not query:
+                return [i for i, k in enumerate(self.keys) if k is not None and i not in self.dead]
+
+            hit = self.cache.get(query)
+            if hit is not None:
+                self.cache.move_to_end(query)
+                ids = hit
+            elif self.last_query and self.last_query in query:
+                # query only grew: narrow the previous result set
+                keys = self.keys
+                ids = [i for i in self.last_result if query in keys[i]]
+            elif len(query) >= 3:
+                ids = self._trigram_lookup(query)
+            else:
+                ids = [i for i, k in enumerate(self.keys) if k is not None and query in k and i not in self.dead]
+
+            self.cache[query] = ids
+            if len(self.cache) > CACHE_SIZE:
+                self.cache.popitem(last=False)
+            self.last_query = query
+            self.last_result = ids
+            return ids
+
+    def _trigram_lookup(self, query):
+        lists = []
+        for tri in trigrams(query):
+            post = self.postings.get(tri)
+            if post is None:
+                return []
+            lists.append(post)
+        lists.sort(key=len)
+        candidates = set(lists[0])
+        for post in lists[1:]:
+            if len(candidates) < 64:
+                break
+            candidates.intersection_update(post)
+            if not candidates:
+                return []
+        keys = self.keys
+        dead = self.dead
+        return sorted(i for i in candidates if i not in dead and query in keys[i])
+
+    def fuzzy_search(self, query, limit=500):
+        # ranked subsequence matching, best first
+        query = query.lower().replace(' ', '')
+        if not query:
+            return []
+        # "[^a]*a[^b]*b..." finds the same greedy subsequence as
+        # fuzzy_score, in C and without backtracking; its end gives the
+        # score: gaps + first == end - len(query) + first
+        match = re.compile(''.join(f"[^{re.escape(ch)}]*{re.escape(ch)}" for ch in query)).match
+        size = len(query)
+        head = query[0]
+        with self.lock:
+            keys = self.keys
+            last = self.last_fuzzy
+            if last and query.startswith(last[0]):
+                # anything matching the longer query matched the shorter one
+                candidates = last[1]
+            else:
+                dead = self.dead
+                candidates = [i for i, key in enumerate(keys) if key is not None and i not in dead]
+            matched = []
+            scored = []
+            for i in candidates:
+                key = keys[i]
+                m = match(key)
+                if m is not None:
+                    matched.append(i)
+                    scored.append((m.end() - size + key.find(head), len(key), i))
+            self.last_fuzzy = (query, matched)
+            return [i for _, _, i in heapq.nsmallest(limit, scored)]
@@ -0,0 +1,87 @@
+import queue
+import threading
+from collections import OrderedDict
+
+from mp3_probe import probe_mp3, count_frames
+
+# Per-track frame counts used to snap a seek time to a frame boundary and
+# to get the exact duration. The header estimate is used right away; the
+# exact count follows from a worker thread that walks the frame headers.
+
+CACHE_TRACKS = 16
+
+
+class SeekTable:
+    def __init__(self, info, frames=None):
+        self.sample_rate = info['sample_rate']
+        self.samples_per_frame = info['samples_per_frame']
+        self.counted = frames is not None
+        self.frames = frames if self.counted else info['frames']
+        delay = info.get('encoder_delay', 0) + info.get('encoder_padding', 0)
+        self.duration = max(0.0, (self.frames * self.samples_per_frame - delay) / self.sample_rate)
+
+    def frame_duration(self):
+        return self.samples_per_frame / self.sample_rate
+
+    def frame_at(self, seconds):
+        k = int(seconds / self.frame_duration())
+        return max(0, min(k, max(0, self.frames - 1)))
+
+    def snap(self, seconds):
+        # start time of the frame containing `seconds`
+        return self.frame_at(seconds) * self.frame_duration()
+
+    def exact(self):
+        return self.counted
+
+
+class SeekTableCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tables = OrderedDict()
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def get(self, path):
+        with self.lock:
+            table = self.tables.get(path)
+            if table is not None:
+                self.tables.move_to_end(path)
+            return table
+
+    def request(self, path):
+        with self.lock:
+            table = self.tables.get(path)
+        if table is None or not table.exact():
+            self.requests.put(path)
+
+    def stop(self):
+        self.requests.put(None)
+
+    def _store(self, path, table):
+        with self.lock:
+            self.tables[path] = table
+            self.tables.move_to_end(path)
+            while len(self.tables) > CACHE_TRACKS:
+                self.tables.popitem(last=False)
+
+    def _run(self):
+        while True:
+            path = self.requests.get()
+            if path is None:
+                return
+            existing = self.get(path)
+            if existing is not None and existing.exact():
+                continue
+            info = probe_mp3(path)
+            if info is None:
+                continue
+            # the header estimate is usable right away, the exact one follows
+            self._store(path, SeekTable(info))
+            try:
+                frames = count_frames(path, info)
+            except OSError:
+                continue
+            if frames:
+                self._store(path, SeekTable(info, frames))
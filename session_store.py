@@ -0,0 +1,82 @@
+import os
+import json
+import threading
+
+# Player session (current track, position, volume, shuffle, search, queue)
+# kept as a journal of small JSON lines. Each line holds only the fields that
+# changed since the previous one; loading merges them in order. Once the
+# journal gets long it's rewritten as a single line.
+
+COMPACT_EVERY = 1000
+
+
+class SessionStore:
+    def __init__(self, path):
+        self.path = str(path)
+        self.state = {}
+        self.file = None
+        self.lines = 0
+        self.lock = threading.Lock()
+
+    def load(self):
+        state = {}
+        lines = 0
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        fields = json.loads(line)
+                    except Exception:
+                        # torn last write after a crash
+                        continue
+                    if isinstance(fields, dict):
+                        state.update(fields)
+                        lines += 1
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print("Session unreadable:", e)
+        with self.lock:
+            self.state = state
+            self.lines = lines
+        return dict(state)
+
+    def update(self, fields):
+        with self.lock:
+            changed = {k: v for k, v in fields.items() if k not in self.state or self.state[k] != v}
+            if not changed:
+                return
+            self.state.update(changed)
+            try:
+                if self.file is None:
+                    self.file = open(self.path, 'a', encoding='utf-8')
+                self.file.write(json.dumps(changed, separators=(',', ':')) + '\n')
+                self.file.flush()
+                self.lines += 1
+                if self.lines >= COMPACT_EVERY:
+                    self._compact_locked()
+            except Exception as e:
+                print("Session write failed:", e)
+
+    def _compact_locked(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(self.state, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        if self.file is not None:
+            self.file.close()
+        os.replace(tmp, self.path)
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.lines = 1
+
+    def close(self):
+        with self.lock:
+            try:
+                if self.lines > 1:
+                    self._compact_locked()
+            except Exception as e:
+                print("Session compaction failed:", e)
+            if self.file is not None:
+                self.file.close()
+                self.file = None
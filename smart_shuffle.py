@@ -0,0 +1,163 @@
+import random
+import threading
+from array import array
+from collections import deque
+
+# Stats-weighted shuffle. Every track has a weight from its listen/skip
+# history; the next track is drawn from a Fenwick tree over those weights,
+# so a draw and a weight change are both O(log n) and nothing is ever
+# reshuffled. Recently drawn tracks sit out (weight 0) until COOLDOWN more
+# tracks have been drawn.
+
+COOLDOWN = 50
+
+
+def listen_weight(stats):
+    # smoothed share of plays that weren't skipped, in (0, 1)
+    listened = stats['listened']
+    skipped = stats['skipped']
+    return (listened + 1) / (listened + skipped + 2)
+
+
+class FenwickTree:
+    def __init__(self, weights, capacity=None):
+        n = max(len(weights), capacity or 0, 1)
+        tree = array('d', bytes(8 * (n + 1)))
+        tree[1:len(weights) + 1] = array('d', weights)
+        for i in range(1, n + 1):
+            j = i + (i & -i)
+            if j <= n:
+                tree[j] += tree[i]
+        self.tree = tree
+        self.size = n
+        self.total = sum(weights)
+        self.mask = 1 << (n.bit_length() - 1)
+
+    def add(self, i, delta):
+        # i is 0-based
+        tree = self.tree
+        n = self.size
+        i += 1
+        while i <= n:
+            tree[i] += delta
+            i += i & -i
+        self.total += delta
+
+    def find(self, u):
+        # smallest 0-based index whose prefix sum exceeds u
+        tree = self.tree
+        pos = 0
+        step = self.mask
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and tree[nxt] <= u:
+                pos = nxt
+                u -= tree[nxt]
+            step >>= 1
+        return min(pos, self.size - 1)
+
+
+class SmartShuffle:
+    def __init__(self, weight_of, seed=None, cooldown=COOLDOWN):
+        # weight_of(tid) -> float; 0 for tracks that must not be drawn
+        self.weight_of = weight_of
+        self.rng = random.Random(seed) if seed is not None else random.Random()
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.weights = None
+        self.tree = None
+        # tids whose own weight is above 0, resting or not
+        self.live = None
+        self.live_count = 0
+        self.resting = deque()
+        self.pending = set()
+        self.thread = None
+
+    def ready(self):
+        return self.tree is not None
+
+    def build(self, count, ready=None):
+        # computing a million weights takes seconds, so it runs on a thread;
+        # changes that arrive meanwhile are replayed once it's done
+        def run():
+            if ready is not None:
+                ready.wait()
+            weights = array('d', (self.weight_of(t) for t in range(count)))
+            tree = FenwickTree(weights)
+            live = bytearray(w > 0 for w in weights)
+            with self.lock:
+                self.weights = weights
+                self.tree = tree
+                self.live = live
+                self.live_count = sum(live)
+                pending, self.pending = self.pending, set()
+                for tid in pending:
+                    self._set_locked(tid, self.weight_of(tid))
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def _set_locked(self, tid, weight):
+        if tid >= self.tree.size:
+            # room for newly scanned tracks: double and rebuild once
+            self.weights.extend(array('d', bytes(8 * (max(tid + 1, 2 * self.tree.size) - len(self.weights)))))
+            self.tree = FenwickTree(self.weights)
+        elif tid >= len(self.weights):
+            self.weights.extend(array('d', bytes(8 * (tid + 1 - len(self.weights)))))
+        if tid >= len(self.live):
+            self.live.extend(bytes(len(self.weights) - len(self.live)))
+        alive = weight > 0
+        if alive != self.live[tid]:
+            self.live[tid] = alive
+            self.live_count += 1 if alive else -1
+        if tid in self.resting:
+            weight = 0.0
+        self._put_locked(tid, weight)
+
+    def _put_locked(self, tid, weight):
+        delta = weight - self.weights[tid]
+        if delta:
+            self.weights[tid] = weight
+            self.tree.add(tid, delta)
+
+    def update(self, tids):
+        # stats changed, tracks added or removed
+        with self.lock:
+            for tid in tids:
+                if self.tree is None:
+                    self.pending.add(tid)
+                else:
+                    self._set_locked(tid, self.weight_of(tid))
+
+    def draw(self):
+        with self.lock:
+            tree = self.tree
+            if tree is None:
+                return None
+            # tracks removed while others rest can leave only resting ones
+            while tree.total <= 0 and self.resting:
+                self._wake_locked()
+            if tree.total <= 0:
+                return None
+            tid = tree.find(self.rng.random() * tree.total)
+            if self.weights[tid] <= 0:
+                return None
+            self._rest_locked(tid)
+            return tid
+
+    def rest(self, tid):
+        # a track picked by hand sits out like a drawn one
+        with self.lock:
+            if self.tree is not None and tid not in self.resting:
+                self._rest_locked(tid)
+
+    def _rest_locked(self, tid):
+        # the oldest resting track comes back; small libraries keep at
+        # least half their live tracks drawable, and a lone track never rests
+        self._put_locked(tid, 0.0)
+        self.resting.append(tid)
+        while len(self.resting) > min(self.cooldown, self.live_count // 2):
+            self._wake_locked()
+
+    def _wake_locked(self):
+        back = self.resting.popleft()
+        self._set_locked(back, self.weight_of(back))
@@ -0,0 +1,35 @@
+import sys
+import time
+import threading
+
+# Startup phase timings. Pass --startup-timings to print them once startup
+# has finished, e.g. python mp3_player.py --startup-timings
+
+FLAG = '--startup-timings'
+PROCESS_START = time.perf_counter()
+
+
+class StartupTimer:
+    def __init__(self, enabled=None):
+        self.enabled = FLAG in sys.argv if enabled is None else enabled
+        self.lock = threading.Lock()
+        self.marks = []
+        self.reported = False
+
+    def mark(self, phase):
+        with self.lock:
+            self.marks.append((phase, time.perf_counter(), threading.current_thread().name))
+
+    def report(self):
+        with self.lock:
+            if self.reported or not self.enabled:
+                return
+            self.reported = True
+            marks = sorted(self.marks, key=lambda m: m[1])
+        print("Startup timings (ms since process start):")
+        previous = PROCESS_START
+        for phase, t, thread in marks:
+            where = "" if thread == 'MainThread' else f"  [{thread}]"
+            print(f"  {phase:<16} {(t - PROCESS_START) * 1000:8.1f}  (+{(t - previous) * 1000:.1f}){where}")
+            previous = t
+        sys.stdout.flush()
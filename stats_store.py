@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import threading
+
+# Play stats kept in memory, persisted as an append-only journal that is
+# periodically compacted into a snapshot. Every event costs one short append.
+
+EMPTY_STATS = {'started': 0, 'listened': 0, 'skipped': 0}
+FSYNC_INTERVAL = 2.0
+COMPACT_EVERY = 5000
+
+
+def track_id(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+class StatsStore:
+    def __init__(self, snapshot_path, journal_path=None):
+        self.snapshot_path = str(snapshot_path)
+        self.journal_path = str(journal_path or os.path.splitext(self.snapshot_path)[0] + '.journal')
+        self.tracks = {}
+        self.legacy = {}
+        self.seq = 0
+        self.journal = None
+        self.journal_entries = 0
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        # (method, args) recorded while loading, applied once the counts are in
+        self.pending = []
+
+    def load(self):
+        try:
+            self._load()
+        finally:
+            # set even when loading fails, or the first play and close() wait forever
+            with self.lock:
+                for fn, args in self.pending:
+                    fn(*args)
+                self.pending = []
+                self.ready.set()
+
+    def _load(self):
+        snapshot_seq = 0
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data, dict) and data.get('version') == 2:
+                self.tracks = data.get('tracks', {})
+                self.legacy = data.get('legacy', {})
+                snapshot_seq = data.get('seq', 0)
+            elif isinstance(data, dict):
+                # old format keyed by file name
+                self.legacy = data
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print("Stats snapshot unreadable:", e)
+
+        self.seq = snapshot_seq
+        try:
+            # read as bytes so a garbled line is skipped on its own
+            with open(self.journal_path, 'rb') as f:
+                for line in f:
+                    try:
+                        seq, key, tid, legacy_name = json.loads(line)
+                        if seq <= snapshot_seq:
+                            continue
+                        self._apply(tid, key, legacy_name)
+                    except Exception:
+                        # torn last write after a crash
+                        continue
+                    self.seq = max(self.seq, seq)
+                    self.journal_entries += 1
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print("Stats journal unreadable:", e)
+
+        try:
+            self.journal = open(self.journal_path, 'a', encoding='utf-8')
+        except Exception as e:
+            print("Stats journal can't be opened, play counts won't be saved:", e)
+
+    def _apply(self, tid, key, legacy_name=None):
+        s = self.tracks.get(tid)
+        if s is None:
+            # name-keyed counts go to the first track that claims them; a
+            # different song with the same file name starts from zero
+            base = self.legacy.pop(legacy_name, None) if legacy_name else None
+            s = dict(base) if base else dict(EMPTY_STATS)
+            self.tracks[tid] = s
+        s[key] = s.get(key, 0) + 1
+        return s
+
+    def get(self, tid, legacy_name=None):
+        if not self.ready.is_set():
+            return EMPTY_STATS
+        s = self.tracks.get(tid)
+        if s is None and legacy_name:
+            s = self.legacy.get(legacy_name)
+        return s or EMPTY_STATS
+
+    def increment(self, tid, key, legacy_name=None):
+        with self.lock:
+            if not self.ready.is_set():
+                # still loading; never block the caller on it
+                self.pending.append((self._record_locked, (tid, key, legacy_name)))
+                return
+            self._record_locked(tid, key, legacy_name)
+        if time.monotonic() - self.last_sync >= FSYNC_INTERVAL:
+            self.flush()
+
+    def _record_locked(self, tid, key, legacy_name):
+        if legacy_name not in self.legacy:
+            legacy_name = None
+        # the first event for a track seeds it from its old name-keyed counts
+        self._apply(tid, key, legacy_name)
+        self.seq += 1
+        if self.journal is None:
+            return
+        self.journal.write(json.dumps([self.seq, key, tid, legacy_name]) + '\n')
+        self.journal_entries += 1
+        self.unsynced += 1
+
+    def merge(self, tid, legacy_name, sources):
+        # sources: (tid, legacy_name) of identical copies whose counts move
+        # onto tid, so the copies share one set of stats
+        with self.lock:
+            if not self.ready.is_set():
+                self.pending.append((self._merge_locked, (tid, legacy_name, sources)))
+                return
+            self._merge_locked(tid, legacy_name, sources)
+
+    def _merge_locked(self, tid, legacy_name, sources):
+        moved = []
+        for source, source_legacy in sources:
+            s = self.tracks.pop(source, None)
+            if s is None and source_legacy in self.legacy and source_legacy != legacy_name:
+                s = self.legacy.pop(source_legacy)
+            if s:
+                moved.append(s)
+        if not moved:
+            return
+        target = self.tracks.get(tid)
+        if target is None:
+            base = self.legacy.pop(legacy_name, None) if legacy_name else None
+            target = self.tracks[tid] = dict(base) if base else dict(EMPTY_STATS)
+        for s in moved:
+            for key, count in s.items():
+                target[key] = target.get(key, 0) + count
+        # the journal has no record for a merge; a snapshot takes it instead
+        if self.journal is not None:
+            self._compact_locked()
+
+    def flush(self):
+        with self.lock:
+            if self.journal is None:
+                return
+            if self.unsynced:
+                try:
+                    self.journal.flush()
+                    os.fsync(self.journal.fileno())
+                except Exception as e:
+                    print("Stats journal sync failed:", e)
+                self.unsynced = 0
+            self.last_sync = time.monotonic()
+            if self.journal_entries >= COMPACT_EVERY:
+                self._compact_locked()
+
+    def compact(self):
+        with self.lock:
+            if self.journal is None:
+                return
+            self._compact_locked()
+
+    def _write_snapshot_locked(self):
+        data = {'version': 2, 'seq': self.seq, 'tracks': self.tracks, 'legacy': self.legacy}
+        tmp = self.snapshot_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+
+    def _compact_locked(self):
+        try:
+            self._write_snapshot_locked()
+        except Exception as e:
+            print("Stats compaction failed:", e)
+            return
+        # snapshot holds everything up to self.seq, so the journal can restart
+        self.journal.close()
+        self.journal = open(self.journal_path, 'w', encoding='utf-8')
+        self.journal_entries = 0
+        self.unsynced = 0
+
+    def close(self):
+        self.ready.wait()
+        self.flush()
+        self.compact()
+        with self.lock:
+            if self.journal:
+                self.journal.close()
+                self.journal = None
@@ -0,0 +1,57 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from id3_tags import read_tags
+from background_worker import BackgroundWorker
+
+# Reads tags for a whole folder after a scan. Tags already in the library
+# index are replayed first; files that are new or changed since their tags
+# were read go through a thread pool (tag reads are small and mostly wait on
+# disk). Results are pushed onto a queue in batches for the engine to drain.
+
+BATCH_SIZE = 200
+TAG_WORKERS = min(16, (os.cpu_count() or 2) * 2)
+
+
+def _read_batch(paths):
+    return [(p, read_tags(p)) for p in paths]
+
+
+class TagPipeline(BackgroundWorker):
+    def __init__(self, folder, index, workers=TAG_WORKERS):
+        super().__init__()
+        self.folder = os.path.abspath(folder)
+        self.index = index
+        self.workers = workers
+        self.total = 0
+        self.read = 0
+
+    def progress(self):
+        return self.read
+
+    def _run(self):
+        cached = self.index.tags_in(self.folder)
+        for i in range(0, len(cached), BATCH_SIZE):
+            if self.cancel_event.is_set():
+                break
+            self.queue.put(('tags', cached[i:i + BATCH_SIZE]))
+
+        pending = self.index.untagged(self.folder)
+        self.total = len(pending)
+        chunks = [pending[i:i + BATCH_SIZE] for i in range(0, len(pending), BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tags') as pool:
+            futures = [pool.submit(_read_batch, chunk) for chunk in chunks]
+            for future in as_completed(futures):
+                if self.cancel_event.is_set():
+                    for f in futures:
+                        f.cancel()
+                    break
+                results = future.result()
+                # unreadable files stay untagged and are retried next time
+                self.index.set_tags([(p, t) for p, t in results if t is not None])
+                self.read += len(results)
+                found = [(p, t) for p, t in results if t]
+                if found:
+                    self.queue.put(('tags', found))
+
+        self._finish()
@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+import wave
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+pytest.importorskip('pygame')
+
+from player_engine import PlayerEngine  # noqa: E402
+
+TRACK_SECONDS = 1.0
+RATE = 22050
+
+
+def _write_tracks(folder, count):
+    os.makedirs(folder)
+    for i in range(count):
+        with wave.open(os.path.join(folder, f"track{i}.wav"), 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(RATE)
+            w.writeframes(b'\0\0' * int(RATE * TRACK_SECONDS))
+
+
+def _engine(tmp_path, count):
+    music = str(tmp_path / 'music')
+    _write_tracks(music, count)
+    engine = PlayerEngine(tmp_path)
+    if not engine.init_audio():
+        pytest.skip("no audio device")
+    engine.load_stats()
+    engine.load_folder(music)
+    deadline = time.time() + 10
+    while (engine.scanner is not None or len(engine.playlist) < count) and time.time() < deadline:
+        engine.tick()
+        time.sleep(0.01)
+    assert len(engine.playlist) == count
+    return engine
+
+
+def _play_through(engine, switches):
+    # ticks like the host loop; returns the position half a track after
+    # each time the mixer moved on to a queued track
+    switched = []
+    advance = engine._advance_to_queued
+
+    def counted():
+        advance()
+        switched.append(time.perf_counter())
+    engine._advance_to_queued = counted
+
+    engine.play_track(0)
+    positions = []
+    deadline = time.perf_counter() + (switches + 2) * TRACK_SECONDS * 2
+    while len(positions) < switches and time.perf_counter() < deadline:
+        engine.tick()
+        if len(switched) > len(positions) and time.perf_counter() - switched[len(positions)] >= TRACK_SECONDS / 2:
+            positions.append(engine.playback_position())
+        time.sleep(0.01)
+    return positions
+
+
+@pytest.mark.parametrize('end_events', [True, False])
+def test_clock_restarts_on_each_gapless_switch(tmp_path, end_events):
+    engine = _engine(tmp_path, 4)
+    try:
+        if not end_events:
+            engine.end_event = None
+        positions = _play_through(engine, 3)
+        assert len(positions) == 3
+        for position in positions:
+            assert TRACK_SECONDS / 4 < position < TRACK_SECONDS
+    finally:
+        engine.close()
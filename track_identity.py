@@ -0,0 +1,107 @@
+import os
+import mmap
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from background_worker import BackgroundWorker
+
+# Content identity for tracks, so copies of a song in different folders are
+# known to be the same song. The fingerprint is the file size plus a hash of
+# the first and last 64 KiB, read through mmap; that tells nearly all files
+# apart for the cost of two small reads. Files whose fingerprints collide get
+# a full hash to confirm they really are the same. Both are kept in the
+# library index, and a changed size or mtime drops them with the row.
+
+CHUNK = 64 * 1024
+BATCH_SIZE = 200
+HASH_WORKERS = min(16, (os.cpu_count() or 2) * 2)
+
+
+def _mapped(path):
+    f = open(path, 'rb')
+    try:
+        return f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except Exception:
+        f.close()
+        raise
+
+
+def fingerprint(path):
+    size = os.path.getsize(path)
+    h = hashlib.blake2b(digest_size=16)
+    if size:
+        f, m = _mapped(path)
+        try:
+            if size <= 2 * CHUNK:
+                h.update(m)
+            else:
+                h.update(m[:CHUNK])
+                h.update(m[-CHUNK:])
+        finally:
+            m.close()
+            f.close()
+    return f"{size:x}-{h.hexdigest()}"
+
+
+def full_hash(path):
+    h = hashlib.blake2b(digest_size=16)
+    if os.path.getsize(path):
+        f, m = _mapped(path)
+        try:
+            # hashlib drops the GIL on big buffers, so this runs in parallel
+            h.update(m)
+        finally:
+            m.close()
+            f.close()
+    return h.hexdigest()
+
+
+def _hash_batch(fn, paths):
+    out = []
+    for p in paths:
+        try:
+            out.append((p, fn(p)))
+        except (OSError, ValueError):
+            # gone or unreadable: left unhashed and retried next scan
+            pass
+    return out
+
+
+class IdentityPipeline(BackgroundWorker):
+    # fingerprints what the index lacks, full hashes the collisions, then
+    # sends ('groups', [[path, ...], ...]) with every set of identical files
+    # in the folder
+    def __init__(self, folder, index, workers=HASH_WORKERS):
+        super().__init__()
+        self.folder = os.path.abspath(folder)
+        self.index = index
+        self.workers = workers
+        self.total = 0
+        self.hashed = 0
+        self.full = 0
+
+    def _hash_all(self, pool, fn, paths, store):
+        chunks = [paths[i:i + BATCH_SIZE] for i in range(0, len(paths), BATCH_SIZE)]
+        futures = [pool.submit(_hash_batch, fn, chunk) for chunk in chunks]
+        for future in as_completed(futures):
+            if self.cancel_event.is_set():
+                for f in futures:
+                    f.cancel()
+                return
+            results = future.result()
+            store(results)
+            self.hashed += len(results)
+
+    def _run(self):
+        pending = self.index.unfingerprinted(self.folder)
+        self.total = len(pending)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='identity') as pool:
+            self._hash_all(pool, fingerprint, pending, self.index.set_fingerprints)
+            if not self.cancel_event.is_set():
+                colliding = self.index.colliding(self.folder)
+                self.full = len(colliding)
+                self.total += self.full
+                self._hash_all(pool, full_hash, colliding, self.index.set_content_hashes)
+        if not self.cancel_event.is_set():
+            self.queue.put(('groups', self.index.duplicate_groups(self.folder)))
+        self._finish()
@@ -0,0 +1,78 @@
+import time
+
+# Widget updates collected during a Tk event pass and applied once when the
+# loop goes idle, one configure per widget. Setting an option to the value
+# it already has costs nothing: no configure, no redraw. Everything that
+# changes a widget's text, font or value should go through here, or the
+# cache of what's on screen goes stale.
+
+
+class UIUpdater:
+    def __init__(self, root, metrics=None):
+        self.root = root
+        self.metrics = metrics
+        self.pending = {}  # widget -> {option: value}
+        self.shown = {}  # widget -> {option: value} as last applied
+        self.calls = {}  # name -> callable, latest wins
+        self.idle_id = None
+        self.requested = 0
+        self.skipped = 0
+        self.applied = 0
+
+    def config(self, widget, **options):
+        shown = self.shown.get(widget, {})
+        for option, value in options.items():
+            self.requested += 1
+            if option in shown and shown[option] == value:
+                self.skipped += 1
+                self.pending.get(widget, {}).pop(option, None)
+                continue
+            self.pending.setdefault(widget, {})[option] = value
+        self._arm()
+
+    def set(self, widget, value):
+        # Scale.set() and friends, with the same change detection
+        self.config(widget, value=value)
+
+    def call(self, name, fn):
+        # run fn once this pass; a later call under the same name replaces it
+        self.calls[name] = fn
+        self._arm()
+
+    def forget(self, widget):
+        # the user moved it, or it's gone
+        self.pending.pop(widget, None)
+        self.shown.pop(widget, None)
+
+    def _arm(self):
+        if self.idle_id is None and (self.pending or self.calls):
+            self.idle_id = self.root.after_idle(self.flush)
+
+    def flush(self):
+        self.idle_id = None
+        started = time.perf_counter()
+        pending, self.pending = self.pending, {}
+        calls, self.calls = self.calls, {}
+        for widget, options in pending.items():
+            if not options:
+                continue
+            try:
+                if 'value' in options:
+                    value = options.pop('value')
+                    widget.set(value)
+                    self.shown.setdefault(widget, {})['value'] = value
+                    self.applied += 1
+                if options:
+                    widget.configure(**options)
+                    self.shown.setdefault(widget, {}).update(options)
+                    self.applied += len(options)
+            except Exception:
+                # destroyed (debug window closed) or not ready yet
+                self.shown.pop(widget, None)
+        for fn in calls.values():
+            try:
+                fn()
+            except Exception as e:
+                print("UI update failed:", e)
+        if self.metrics is not None:
+            self.metrics.observe('ui_flush_ms', (time.perf_counter() - started) * 1000)
@@ -0,0 +1,232 @@
+import tkinter as tk
+from tkinter import ttk
+import tkinter.font as tkfont
+
+# A Listbox that only holds the rows currently in view (plus some overscan).
+# Row text is produced on demand by a formatter, so refresh cost depends on
+# the viewport size rather than on the number of items.
+
+OVERSCAN = 20
+
+
+class VirtualList:
+    def __init__(self, parent, **listbox_options):
+        self.frame = tk.Frame(parent)
+        self.listbox = tk.Listbox(self.frame, selectmode=tk.SINGLE, exportselection=False, **listbox_options)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient='vertical', command=self._on_scrollbar)
+        self.scrollbar.pack(side='right', fill='y')
+        self.listbox.pack(side='left', fill='both', expand=True)
+
+        self.items = []
+        self.formatter = str
+        self.top = 0
+        self.visible = 1
+        self.start = 0
+        self.rows = []
+        self.selected = None
+        self.line_height = None
+
+        self.listbox.bind('<Configure>', self._on_configure)
+        self.listbox.bind('<<ListboxSelect>>', self._on_select)
+        self.listbox.bind('<MouseWheel>', self._on_wheel)
+        self.listbox.bind('<Button-4>', lambda e: self._scroll_by(-3))
+        self.listbox.bind('<Button-5>', lambda e: self._scroll_by(3))
+        self.listbox.bind('<Up>', lambda e: self._move_selection(-1))
+        self.listbox.bind('<Down>', lambda e: self._move_selection(1))
+        self.listbox.bind('<Prior>', lambda e: self._move_selection(-self.visible))
+        self.listbox.bind('<Next>', lambda e: self._move_selection(self.visible))
+
+    ###########################
+    # Tk passthrough
+    ###########################
+    def pack(self, **kw):
+        self.frame.pack(**kw)
+
+    def bind(self, sequence, func, add=None):
+        return self.listbox.bind(sequence, func, add)
+
+    def configure(self, **kw):
+        bg = kw.get('bg')
+        if bg:
+            self.frame.configure(bg=bg)
+        self.listbox.configure(**kw)
+        if 'font' in kw:
+            self.line_height = None
+            self._measure()
+            self.render()
+
+    config = configure
+
+    ###########################
+    # Data
+    ###########################
+    def set_items(self, items, formatter=None):
+        if formatter is not None:
+            self.formatter = formatter
+        if items is not self.items:
+            self.items = items
+            self.selected = None
+        self._clamp_top()
+        self.render()
+
+    def items_changed(self):
+        # items were appended/removed in place; only redraw if it shows
+        self._clamp_top()
+        if self._window() != (self.start, self.start + len(self.rows)):
+            self.render()
+        else:
+            self._update_scrollbar()
+
+    def refresh(self):
+        self.render()
+
+    ###########################
+    # Selection
+    ###########################
+    def selected_index(self):
+        if self.selected is not None and self.selected < len(self.items):
+            return self.selected
+        return None
+
+    def select(self, i, see=True):
+        self.selected = i
+        if i is not None and see:
+            self.see(i)
+        self._apply_selection()
+
+    def clear_selection(self):
+        self.selected = None
+        self._apply_selection()
+
+    def see(self, i):
+        if i < self.top:
+            self.top = i
+        elif i >= self.top + self.visible:
+            self.top = i - self.visible + 1
+        self._clamp_top()
+        self._scroll_view()
+
+    def index_at(self, y):
+        if not self.rows:
+            return None
+        i = self.start + self.listbox.nearest(y)
+        return i if i < len(self.items) else None
+
+    ###########################
+    # Rendering
+    ###########################
+    def _measure(self):
+        if self.line_height is None:
+            try:
+                font = tkfont.Font(font=self.listbox.cget('font'))
+                self.line_height = font.metrics('linespace') + 1
+            except Exception:
+                self.line_height = 16
+        height = self.listbox.winfo_height()
+        self.visible = max(1, height // self.line_height)
+
+    def _clamp_top(self):
+        self.top = max(0, min(self.top, len(self.items) - self.visible))
+
+    def _window(self):
+        start = max(0, self.top - OVERSCAN)
+        end = min(len(self.items), self.top + self.visible + OVERSCAN)
+        return start, end
+
+    def render(self):
+        start, end = self._window()
+        new_rows = [self.formatter(self.items[i]) for i in range(start, end)]
+
+        if start == self.start:
+            self._diff_rows(new_rows)
+        else:
+            self.listbox.delete(0, tk.END)
+            if new_rows:
+                self.listbox.insert(tk.END, *new_rows)
+        self.rows = new_rows
+        self.start = start
+        self.listbox.yview(self.top - start)
+        self._apply_selection()
+        self._update_scrollbar()
+
+    def _diff_rows(self, new_rows):
+        old = self.rows
+        common = min(len(old), len(new_rows))
+        for i in range(common):
+            if old[i] != new_rows[i]:
+                self.listbox.delete(i)
+                self.listbox.insert(i, new_rows[i])
+        if len(old) > common:
+            self.listbox.delete(common, tk.END)
+        elif len(new_rows) > common:
+            self.listbox.insert(tk.END, *new_rows[common:])
+
+    def _scroll_view(self):
+        end = self.start + len(self.rows)
+        if self.top < self.start or min(len(self.items), self.top + self.visible) > end:
+            self.render()
+            return
+        self.listbox.yview(self.top - self.start)
+        self._update_scrollbar()
+
+    def _apply_selection(self):
+        self.listbox.select_clear(0, tk.END)
+        i = self.selected
+        if i is not None and self.start <= i < self.start + len(self.rows):
+            self.listbox.select_set(i - self.start)
+            self.listbox.activate(i - self.start)
+
+    def _update_scrollbar(self):
+        total = len(self.items)
+        if total <= 0:
+            self.scrollbar.set(0, 1)
+            return
+        first = self.top / total
+        last = min(1.0, (self.top + self.visible) / total)
+        self.scrollbar.set(first, last)
+
+    ###########################
+    # Events
+    ###########################
+    def _on_configure(self, event):
+        old = self.visible
+        self._measure()
+        if self.visible != old:
+            self._clamp_top()
+            self.render()
+
+    def _on_select(self, event):
+        sel = self.listbox.curselection()
+        if sel:
+            self.selected = self.start + sel[0]
+
+    def _on_wheel(self, event):
+        step = -1 if event.delta > 0 else 1
+        # macOS reports small deltas, Windows multiples of 120
+        amount = max(1, abs(event.delta) // 120) * 3 if abs(event.delta) >= 120 else 1
+        return self._scroll_by(step * amount)
+
+    def _scroll_by(self, n):
+        self.top += n
+        self._clamp_top()
+        self._scroll_view()
+        return 'break'
+
+    def _move_selection(self, n):
+        if not self.items:
+            return 'break'
+        current = self.selected if self.selected is not None else self.top - (1 if n > 0 else 0)
+        self.select(max(0, min(len(self.items) - 1, current + n)))
+        self.listbox.event_generate('<<ListboxSelect>>')
+        return 'break'
+
+    def _on_scrollbar(self, *args):
+        if not args:
+            return
+        if args[0] == 'moveto':
+            self.top = int(float(args[1]) * len(self.items))
+        elif args[0] == 'scroll':
+            n = int(args[1])
+            self.top += n * (self.visible if args[2] == 'pages' else 1)
+        self._clamp_top()
+        self._scroll_view()
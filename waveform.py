@@ -0,0 +1,163 @@
+import os
+import mmap
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Waveform overviews for the progress bar. A track's peaks are a few thousand
+# (min, max) pairs of int8, written once by the analysis worker into a small
+# binary file and memory-mapped when shown. The peak folder is capped in size
+# and evicts the least recently shown tracks first. Eviction closes maps, so
+# everything but write() belongs on the thread that draws.
+
+MAGIC = b'PKS1'
+HEADER = struct.Struct('<4sI')
+BUCKETS = 2048
+CACHE_BYTES = 64 * 1024 * 1024
+OPEN_FILES = 8
+
+
+def compute_peaks(samples, buckets=BUCKETS):
+    # samples: NumPy int16 array (n, channels); returns bytes of int8 min/max
+    # pairs, one pair per bucket
+    import numpy as np
+    if samples.ndim == 2:
+        lo = samples.min(axis=1)
+        hi = samples.max(axis=1)
+    else:
+        lo = hi = samples
+    n = len(hi)
+    if n == 0:
+        return bytes(2 * buckets)
+    per = -(-n // buckets)
+    pad = per * buckets - n
+    lo = np.concatenate((lo, np.zeros(pad, lo.dtype))).reshape(buckets, per).min(axis=1)
+    hi = np.concatenate((hi, np.zeros(pad, hi.dtype))).reshape(buckets, per).max(axis=1)
+    pairs = np.empty((buckets, 2), np.int8)
+    pairs[:, 0] = (lo.astype(np.int32) * 127 // 32768)
+    pairs[:, 1] = (hi.astype(np.int32) * 127 // 32767)
+    return pairs.tobytes()
+
+
+class PeakFile:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.buckets = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or len(self.map) < HEADER.size + 2 * self.buckets:
+            self.map.close()
+            raise ValueError("not a peak file")
+        self.pairs = memoryview(self.map)[HEADER.size:HEADER.size + 2 * self.buckets].cast('b')
+        self.closed = False
+
+    def columns(self, width):
+        # (min, max) per pixel column, each in -127..127
+        pairs = self.pairs
+        buckets = self.buckets
+        out = []
+        for x in range(width):
+            a = x * buckets // width
+            b = max(a + 1, (x + 1) * buckets // width)
+            lo = min(pairs[2 * a:2 * b:2])
+            hi = max(pairs[2 * a + 1:2 * b:2])
+            out.append((lo, hi))
+        return out
+
+    def close(self):
+        self.closed = True
+        self.pairs.release()
+        self.map.close()
+
+
+class PeakCache:
+    def __init__(self, folder, max_bytes=CACHE_BYTES):
+        self.folder = str(folder)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.files = OrderedDict()  # name -> size, least recently used first
+        self.total = 0
+        self.open = OrderedDict()
+        os.makedirs(self.folder, exist_ok=True)
+        entries = []
+        with os.scandir(self.folder) as it:
+            for e in it:
+                if e.name.endswith('.pks'):
+                    st = e.stat()
+                    entries.append((st.st_mtime_ns, e.name, st.st_size))
+        for _, name, size in sorted(entries):
+            self.files[name] = size
+            self.total += size
+
+    def _name(self, path):
+        # keyed on size+mtime so an edited file gets new peaks
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = f"{path}\0{st.st_size}\0{st.st_mtime_ns}".encode('utf-8', 'surrogateescape')
+        return hashlib.sha1(key).hexdigest() + '.pks'
+
+    def has(self, path):
+        name = self._name(path)
+        with self.lock:
+            return name is not None and name in self.files
+
+    def get(self, path):
+        name = self._name(path)
+        if name is None:
+            return None
+        with self.lock:
+            if name not in self.files:
+                return None
+            self.files.move_to_end(name)
+            peaks = self.open.get(name)
+            if peaks is not None:
+                self.open.move_to_end(name)
+                return peaks
+        full = os.path.join(self.folder, name)
+        try:
+            # mtime doubles as the LRU clock across runs
+            os.utime(full)
+            peaks = PeakFile(full)
+        except (OSError, ValueError):
+            return None
+        with self.lock:
+            self.open[name] = peaks
+            while len(self.open) > OPEN_FILES:
+                self.open.popitem(last=False)[1].close()
+        return peaks
+
+    def store(self, path, pairs):
+        entry = self.write(path, pairs)
+        if entry is not None:
+            self.add(*entry)
+
+    def write(self, path, pairs):
+        # safe from any thread; returns (name, size) for add()
+        name = self._name(path)
+        if name is None:
+            return None
+        full = os.path.join(self.folder, name)
+        tmp = full + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(pairs) // 2))
+            f.write(pairs)
+        os.replace(tmp, full)
+        return name, HEADER.size + len(pairs)
+
+    def add(self, name, size):
+        # may close evicted maps, so only on the thread that reads them
+        with self.lock:
+            self.total += size - self.files.pop(name, 0)
+            self.files[name] = size
+            while self.total > self.max_bytes and len(self.files) > 1:
+                old, old_size = self.files.popitem(last=False)
+                self.total -= old_size
+                peaks = self.open.pop(old, None)
+                if peaks is not None:
+                    peaks.close()
+                try:
+                    os.remove(os.path.join(self.folder, old))
+                except OSError:
+                    pass